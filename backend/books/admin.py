@@ -1,39 +1,160 @@
+import os
+
+from django import forms
 from django.contrib import admin
-from .models import Genre, Book, Reservation
+from django.db import transaction
+from django.db.models import Max, Min
+from django.http import FileResponse, Http404
+from django.urls import path, reverse
+from django.utils.html import format_html
+from library_api.admin_tools import FastChangeListMixin
+from users.cache import bump_user_generation
+from .models import (Genre, Book, Reservation, ArchivedReservation, ReadingProgress, Notification,
+                     ReservationEvent)
+from .pdf_pipeline import schedule_pdf_processing
+from . import counters, events, exports, inventory, notifications
+
+
+class YearPublishedDecadeFilter(admin.SimpleListFilter):
+    """
+    Фильтр по десятилетиям издания. Варианты строятся по MIN/MAX года,
+    а не DISTINCT по всей таблице, как у стандартного фильтра по значениям.
+    """
+    title = 'Год издания'
+    parameter_name = 'decade'
+
+    def lookups(self, request, model_admin):
+        bounds = model_admin.get_queryset(request).aggregate(
+            first=Min('year_published'), last=Max('year_published')
+        )
+        if bounds['first'] is None:
+            return []
+        return [
+            (str(decade), f'{decade}-{decade + 9}')
+            for decade in range(bounds['first'] // 10 * 10, bounds['last'] + 1, 10)
+        ]
+
+    def queryset(self, request, queryset):
+        if not self.value():
+            return queryset
+        try:
+            decade = int(self.value())
+        except ValueError:
+            return queryset
+        return queryset.filter(year_published__gte=decade, year_published__lt=decade + 10)
+
 
 @admin.register(Genre)
 class GenreAdmin(admin.ModelAdmin):
-    list_display = ('name', 'description', 'created_at')
+    list_display = ('name', 'description', 'books_count', 'available_books_count', 'created_at')
     search_fields = ('name',)
     ordering = ('name',)
 
 @admin.register(Book)
-class BookAdmin(admin.ModelAdmin):
+class BookAdmin(FastChangeListMixin, admin.ModelAdmin):
     list_display = ('title', 'author', 'genre', 'year_published', 'status', 'created_at')
-    list_filter = ('status', 'genre', 'year_published', 'created_at')
+    list_filter = ('status', 'genre', YearPublishedDecadeFilter, 'created_at')
+    list_select_related = ('genre',)
     search_fields = ('title', 'author', 'isbn', 'description')
     ordering = ('-created_at',)
+    date_hierarchy = 'created_at'
+    autocomplete_fields = ('genre',)
     
     fieldsets = (
         ('Основная информация', {
             'fields': ('title', 'author', 'description', 'genre', 'year_published', 'isbn')
         }),
         ('Файлы', {
-            'fields': ('cover_image', 'pdf_file')
+            'fields': ('cover_image', 'pdf_file', 'pdf_original_link', 'pdf_page_count', 'pdf_size')
         }),
         ('Статус', {
-            'fields': ('status',)
+            'fields': ('status', 'total_copies', 'available_copies')
         }),
     )
     
-    readonly_fields = ('created_at', 'updated_at')
+    readonly_fields = ('created_at', 'updated_at', 'available_copies',
+                       'pdf_original_link', 'pdf_page_count', 'pdf_size')
+
+    actions = ['export_csv', 'export_xlsx']
+
+    def get_urls(self):
+        return [
+            path('<int:pk>/pdf-original/', self.admin_site.admin_view(self.pdf_original_view),
+                 name='books_book_pdf_original'),
+            *super().get_urls(),
+        ]
+
+    def pdf_original_view(self, request, pk):
+        """Скачивание исходного PDF: в media он не раздаётся (PRIVATE_MEDIA_DIRS)"""
+        book = self.get_object(request, str(pk))
+        if book is None or not book.pdf_original or not self.has_view_permission(request, book):
+            raise Http404
+        try:
+            file = book.pdf_original.open('rb')
+        except FileNotFoundError:
+            raise Http404
+        return FileResponse(file, as_attachment=True, content_type='application/pdf',
+                            filename=os.path.basename(book.pdf_original.name))
+
+    def pdf_original_link(self, obj):
+        if not obj.pdf_original:
+            return '-'
+        url = reverse('admin:books_book_pdf_original', args=[obj.pk])
+        return format_html('<a href="{}">{}</a>', url, os.path.basename(obj.pdf_original.name))
+    pdf_original_link.short_description = "Исходный PDF"
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if 'pdf_file' in form.changed_data:
+            schedule_pdf_processing(obj)
+
+    def export_csv(self, request, queryset):
+        return exports.books_response(queryset, 'csv')
+    export_csv.short_description = "Выгрузить выбранные книги в CSV"
+
+    def export_xlsx(self, request, queryset):
+        return exports.books_response(queryset, 'xlsx')
+    export_xlsx.short_description = "Выгрузить выбранные книги в Excel"
+
+# Смена статуса в админке, о которой сообщается пользователю
+NOTIFY_ON_STATUS = {
+    'confirmed': 'reservation_confirmed',
+    'taken': 'reservation_taken',
+}
+
+
+class ReservationAdminForm(forms.ModelForm):
+    class Meta:
+        model = Reservation
+        fields = '__all__'
+
+    def clean(self):
+        """
+        Активное бронирование должно держать экземпляр: переход в активный
+        статус без свободного экземпляра отклоняется. Экземпляр блокируется
+        до коммита (форма проверяется в транзакции changeform_view), поэтому
+        save_model его гарантированно займёт.
+        """
+        cleaned_data = super().clean()
+        status = cleaned_data.get('status')
+        book = cleaned_data.get('book') or (self.instance.book if self.instance.book_id else None)
+        was_active = self.instance.pk and self.initial.get('status') in Reservation.ACTIVE_STATUSES
+        if book and status in Reservation.ACTIVE_STATUSES and not was_active:
+            if not inventory.lock_free_copy(book.pk):
+                self.add_error('status', 'Свободных экземпляров книги нет.')
+        return cleaned_data
+
 
 @admin.register(Reservation)
-class ReservationAdmin(admin.ModelAdmin):
+class ReservationAdmin(FastChangeListMixin, admin.ModelAdmin):
+    form = ReservationAdminForm
     list_display = ('user', 'book', 'status', 'reservation_date', 'taken_date')
     list_filter = ('status', 'reservation_date', 'taken_date')
+    list_select_related = ('user', 'book')
     search_fields = ('user__username', 'user__email', 'book__title')
     ordering = ('-reservation_date',)
+    date_hierarchy = 'reservation_date'
+    autocomplete_fields = ('user', 'book')
     
     fieldsets = (
         ('Основная информация', {
@@ -49,37 +170,167 @@ class ReservationAdmin(admin.ModelAdmin):
     
     readonly_fields = ('reservation_date',)
     
-    actions = ['confirm_reservation', 'mark_as_taken', 'mark_as_returned']
+    actions = ['confirm_reservation', 'mark_as_taken', 'mark_as_returned', 'export_csv', 'export_xlsx']
+
+    def get_readonly_fields(self, request, obj=None):
+        # Экземпляр и счётчики привязаны к книге: смена книги - новое бронирование
+        if obj is not None:
+            return self.readonly_fields + ('book',)
+        return self.readonly_fields
+
+    def save_model(self, request, obj, form, change):
+        old_status = form.initial.get('status') if change else None
+        super().save_model(request, obj, form, change)
+        if change and 'user' in form.changed_data:
+            # Бронирование ушло из списка прежнего владельца
+            bump_user_generation(form.initial.get('user'))
+        if old_status != obj.status:
+            comment = obj.admin_comment if 'admin_comment' in form.changed_data else ''
+            events.record(obj.pk, old_status, obj.status, request.user, comment)
+            if obj.status in NOTIFY_ON_STATUS:
+                notifications.enqueue(NOTIFY_ON_STATUS[obj.status], [obj.pk])
+        if not inventory.reservation_moved(obj.book_id, obj.pk, old_status, obj.status):
+            # Экземпляр заблокирован в ReservationAdminForm.clean; откатываем всё сохранение
+            raise RuntimeError(f'Не удалось занять экземпляр книги {obj.book_id}')
+        counters.reservation_changed(obj.book_id, old_status, obj.status)
     
+    @transaction.atomic
     def confirm_reservation(self, request, queryset):
         from django.utils import timezone
-        updated = queryset.filter(status='pending').update(
+        now = timezone.now()
+        pending = list(queryset.filter(status='pending').select_for_update().values_list('pk', 'user_id'))
+        updated = Reservation.objects.filter(pk__in=[pk for pk, _ in pending]).update(
             status='confirmed',
-            confirmed_date=timezone.now()
+            confirmed_date=now,
+            updated_at=now
         )
+        notifications.enqueue('reservation_confirmed', [pk for pk, _ in pending])
+        events.record_many([(pk, 'pending') for pk, _ in pending], 'confirmed', request.user)
+        bump_user_generation(*(user_id for _, user_id in pending))
         self.message_user(request, f'Подтверждено {updated} бронирований.')
     confirm_reservation.short_description = "Подтвердить выбранные бронирования"
     
+    @transaction.atomic
     def mark_as_taken(self, request, queryset):
         from django.utils import timezone
-        updated = queryset.filter(status='confirmed').update(
+        now = timezone.now()
+        confirmed = list(
+            queryset.filter(status='confirmed').select_for_update().values_list('pk', 'book_id', 'user_id')
+        )
+        updated = Reservation.objects.filter(pk__in=[pk for pk, _, _ in confirmed]).update(
             status='taken',
-            taken_date=timezone.now()
+            taken_date=now,
+            updated_at=now
         )
-        for reservation in queryset.filter(status='taken'):
-            reservation.book.status = 'taken'
-            reservation.book.save()
+        notifications.enqueue('reservation_taken', [pk for pk, _, _ in confirmed])
+        events.record_many([(pk, 'confirmed') for pk, _, _ in confirmed], 'taken', request.user)
+        bump_user_generation(*(user_id for _, _, user_id in confirmed))
+        for _, book_id, _ in confirmed:
+            counters.reservation_changed(book_id, 'confirmed', 'taken')
+            inventory.mark_copy_taken(book_id)
         self.message_user(request, f'Отмечено как выданные: {updated} бронирований.')
     mark_as_taken.short_description = "Отметить как выданные"
     
+    @transaction.atomic
     def mark_as_returned(self, request, queryset):
         from django.utils import timezone
-        updated = queryset.filter(status='taken').update(
+        now = timezone.now()
+        taken = list(
+            queryset.filter(status='taken').select_for_update().values_list('pk', 'book_id', 'user_id')
+        )
+        updated = Reservation.objects.filter(pk__in=[pk for pk, _, _ in taken]).update(
             status='returned',
-            return_date=timezone.now()
+            return_date=now,
+            updated_at=now
         )
-        for reservation in queryset.filter(status='returned'):
-            reservation.book.status = 'available'
-            reservation.book.save()
+        bump_user_generation(*(user_id for _, _, user_id in taken))
+        events.record_many([(pk, 'taken') for pk, _, _ in taken], 'returned', request.user)
+        for pk, _, _ in taken:
+            inventory.release_copy(pk)
         self.message_user(request, f'Отмечено как возвращенные: {updated} бронирований.')
-    mark_as_returned.short_description = "Отметить как возвращенные"
\ No newline at end of file
+    mark_as_returned.short_description = "Отметить как возвращенные"
+
+    def export_csv(self, request, queryset):
+        return exports.reservations_response(queryset, 'csv')
+    export_csv.short_description = "Выгрузить выбранные бронирования в CSV"
+
+    def export_xlsx(self, request, queryset):
+        return exports.reservations_response(queryset, 'xlsx')
+    export_xlsx.short_description = "Выгрузить выбранные бронирования в Excel"
+
+
+@admin.register(ArchivedReservation)
+class ArchivedReservationAdmin(FastChangeListMixin, admin.ModelAdmin):
+    """Архив только для просмотра: строки в него переносит archive_reservations"""
+    list_display = ('user', 'book', 'status', 'reservation_date', 'return_date', 'archived_at')
+    list_filter = ('status',)
+    list_select_related = ('user', 'book')
+    search_fields = ('user__username', 'user__email', 'book__title')
+    ordering = ('-reservation_date',)
+    date_hierarchy = 'reservation_date'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ReadingProgress)
+class ReadingProgressAdmin(FastChangeListMixin, admin.ModelAdmin):
+    """Только просмотр: позиции присылает приложение, пишет books.progress"""
+    list_display = ('user', 'book', 'page', 'total_pages', 'updated_at')
+    list_select_related = ('user', 'book')
+    search_fields = ('user__username', 'book__title')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(Notification)
+class NotificationAdmin(FastChangeListMixin, admin.ModelAdmin):
+    """Очередь уведомлений: только просмотр и повторная отправка неудачных"""
+    list_display = ('kind', 'user', 'channel', 'status', 'attempts', 'created_at', 'sent_at')
+    list_filter = ('status', 'kind', 'channel')
+    list_select_related = ('user',)
+    search_fields = ('user__username', 'address', 'dedupe_key')
+    ordering = ('-created_at',)
+    date_hierarchy = 'created_at'
+    actions = ['retry']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def retry(self, request, queryset):
+        from django.utils import timezone
+        updated = queryset.filter(status='failed').update(
+            status='pending', attempts=0, next_attempt_at=timezone.now()
+        )
+        self.message_user(request, f'Поставлено на повторную отправку: {updated}.')
+    retry.short_description = "Отправить повторно"
+
+
+@admin.register(ReservationEvent)
+class ReservationEventAdmin(FastChangeListMixin, admin.ModelAdmin):
+    """Журнал только для чтения: строки пишет books.events, удалять их нельзя"""
+    list_display = ('reservation_id', 'from_status', 'to_status', 'actor', 'created_at', 'comment')
+    list_filter = ('to_status',)
+    list_select_related = ('actor',)
+    search_fields = ('=reservation_id', 'actor__username')
+    ordering = ('-created_at',)
+    date_hierarchy = 'created_at'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,144 @@
+"""
+Перенос завершённых бронирований в архив.
+
+books_reservation хранит только "горячие" строки: активные бронирования
+и недавно завершённые. Возвращённые и отменённые бронирования старше
+RESERVATION_ARCHIVE_AFTER_DAYS переносятся пачками в ArchivedReservation
+(секционирована по месяцам reservation_date). Каждая пачка - один запрос
+DELETE ... RETURNING + INSERT в одной транзакции, поэтому строка никогда
+не оказывается сразу в обеих таблицах или ни в одной.
+
+История пользователя (reservation_history) объединяет обе таблицы.
+"""
+import datetime
+
+from django.db import connection, transaction
+from django.db.models import BooleanField, Value
+from django.utils import timezone
+
+from .models import ArchivedReservation, Reservation
+
+# Статусы, после которых бронирование больше не меняется
+ARCHIVE_STATUSES = ('returned', 'cancelled')
+
+ARCHIVE_COLUMNS = (
+    'id', 'user_id', 'book_id', 'status', 'reservation_date',
+    'confirmed_date', 'taken_date', 'return_date', 'pickup_date',
+    'pickup_time', 'user_comment', 'admin_comment',
+)
+
+
+def _partition_name(month, model=ArchivedReservation):
+    return f'{model._meta.db_table}_p{month:%Y_%m}'
+
+
+def _next_month(month):
+    if month.month == 12:
+        return month.replace(year=month.year + 1, month=1)
+    return month.replace(month=month.month + 1)
+
+
+def ensure_partitions(months, model=ArchivedReservation):
+    """
+    Создаёт месячные секции таблицы model, секционированной по месяцам
+    (архив, журнал бронирований); months - первые числа месяцев в UTC.
+    """
+    table = connection.ops.quote_name(model._meta.db_table)
+    with connection.cursor() as cursor:
+        for month in months:
+            cursor.execute(
+                f'CREATE TABLE IF NOT EXISTS {connection.ops.quote_name(_partition_name(month, model))} '
+                f'PARTITION OF {table} FOR VALUES FROM (%s) TO (%s)',
+                [month, _next_month(month)]
+            )
+
+
+def _pending_months(cutoff):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'''
+            SELECT DISTINCT date_trunc('month', reservation_date AT TIME ZONE 'UTC')
+            FROM {Reservation._meta.db_table}
+            WHERE status = ANY(%s) AND reservation_date < %s
+            ''',
+            [list(ARCHIVE_STATUSES), cutoff]
+        )
+        return [row[0].replace(tzinfo=datetime.timezone.utc) for row in cursor.fetchall()]
+
+
+def _move_batch(cutoff, batch_size):
+    columns = ', '.join(ARCHIVE_COLUMNS)
+    with transaction.atomic(), connection.cursor() as cursor:
+        # SKIP LOCKED: строки, которые сейчас меняет другой запрос, перенесём в следующий раз
+        cursor.execute(
+            f'''
+            WITH moved AS (
+                DELETE FROM {Reservation._meta.db_table}
+                WHERE id IN (
+                    SELECT id FROM {Reservation._meta.db_table}
+                    WHERE status = ANY(%s) AND reservation_date < %s
+                    ORDER BY id
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING {columns}
+            )
+            INSERT INTO {ArchivedReservation._meta.db_table} ({columns}, archived_at)
+            SELECT {columns}, %s FROM moved
+            ''',
+            [list(ARCHIVE_STATUSES), cutoff, batch_size, timezone.now()]
+        )
+        return cursor.rowcount
+
+
+def archive_reservations(older_than_days, batch_size=1000, max_batches=None):
+    """
+    Переносит завершённые бронирования старше older_than_days дней в архив.
+    Возвращает число перенесённых строк.
+    """
+    cutoff = timezone.now() - datetime.timedelta(days=older_than_days)
+    ensure_partitions(_pending_months(cutoff))
+
+    moved = batches = 0
+    while max_batches is None or batches < max_batches:
+        count = _move_batch(cutoff, batch_size)
+        moved += count
+        batches += 1
+        if count < batch_size:
+            break
+    return moved
+
+
+def reservation_history(user):
+    """
+    Ключи бронирований пользователя из обеих таблиц (pk, reservation_date,
+    archived), от новых к старым. Объединение делается в БД одним запросом,
+    поэтому его можно пагинировать как обычный queryset.
+    """
+    hot = Reservation.objects.filter(user=user).values(
+        'pk', 'reservation_date', archived=Value(False, output_field=BooleanField())
+    )
+    cold = ArchivedReservation.objects.filter(user=user).values(
+        'pk', 'reservation_date', archived=Value(True, output_field=BooleanField())
+    )
+    return hot.union(cold, all=True).order_by('-reservation_date', '-pk')
+
+
+def load_history(rows, hot_queryset, cold_queryset):
+    """
+    Загружает объекты для страницы reservation_history (не более двух
+    запросов) в том же порядке. Архивные строки возвращаются как Reservation.
+    """
+    hot_ids = [row['pk'] for row in rows if not row['archived']]
+    cold_ids = [row['pk'] for row in rows if row['archived']]
+    hot = hot_queryset.in_bulk(hot_ids) if hot_ids else {}
+    cold = cold_queryset.in_bulk(cold_ids) if cold_ids else {}
+
+    reservations = []
+    for row in rows:
+        if row['archived']:
+            if row['pk'] in cold:
+                reservations.append(cold[row['pk']].as_reservation())
+        elif row['pk'] in hot:
+            reservations.append(hot[row['pk']])
+    return reservations
@@ -0,0 +1,381 @@
+"""
+Резервное копирование и восстановление данных библиотеки.
+
+Каждая таблица выгружается в отдельный сжатый файл (zstd, без него gzip):
+  - jsonl - строка JSON на запись, читается построчно и легко сравнивается;
+  - copy  - двоичный COPY PostgreSQL, самый быстрый формат для загрузки.
+Таблицы выгружаются параллельно в отдельных соединениях, но из одного снимка
+БД (pg_export_snapshot, как pg_dump -j), поэтому данные согласованы между собой.
+Рядом пишется manifest.json и, по желанию, media.tar с файлами книг.
+
+Восстановление идёт в одной транзакции с отложенной проверкой внешних ключей:
+в пустую таблицу - напрямую COPY / bulk_create, в непустую (инкрементальная
+выгрузка) - через временную таблицу и INSERT ... ON CONFLICT DO UPDATE.
+"""
+import contextlib
+import datetime
+import gzip
+import io
+import json
+import os
+import tarfile
+from concurrent.futures import ThreadPoolExecutor
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management.color import no_style
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.db.models import Q
+
+from .archive import ensure_partitions
+
+try:
+    import orjson
+except ImportError:  # orjson необязателен
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:  # zstandard необязателен
+    zstandard = None
+
+FORMAT_VERSION = 1
+MANIFEST_NAME = 'manifest.json'
+MEDIA_ARCHIVE_NAME = 'media.tar'
+JSONL_BATCH_SIZE = 2000
+
+# (имя, модель, поля-даты для инкрементальной выгрузки) в порядке загрузки
+TABLES = (
+    ('users', 'users.User', ('updated_at',)),
+    ('genres', 'books.Genre', ('updated_at',)),
+    ('books', 'books.Book', ('updated_at',)),
+    ('reservations', 'books.Reservation', ('updated_at',)),
+    ('archived_reservations', 'books.ArchivedReservation', ('archived_at',)),
+)
+
+MEDIA_FIELDS = ('cover_image', 'pdf_file')
+
+
+class BackupError(Exception):
+    pass
+
+
+def _compression():
+    return 'zstd' if zstandard is not None else 'gzip'
+
+
+def _open_write(path, compression):
+    if compression == 'zstd':
+        raw = open(path, 'wb')
+        return zstandard.ZstdCompressor(level=6, threads=-1).stream_writer(raw, closefd=True)
+    return gzip.open(path, 'wb', compresslevel=6)
+
+
+def _open_read(path, compression):
+    if compression == 'zstd':
+        if zstandard is None:
+            raise BackupError('Для чтения выгрузки нужен пакет zstandard')
+        reader = zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+        # BufferedReader даёт построчное чтение для JSONL
+        return io.BufferedReader(reader, buffer_size=1024 * 1024)
+    return gzip.open(path, 'rb')
+
+
+def _dumps(row):
+    if orjson is not None:
+        return orjson.dumps(row, default=str)
+    return json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False).encode()
+
+
+def _columns(model):
+    return [field.column for field in model._meta.concrete_fields]
+
+
+def _conflict_columns(model):
+    # У секционированного архива первичный ключ в БД включает reservation_date
+    if model._meta.label == 'books.ArchivedReservation':
+        return ['id', 'reservation_date']
+    return [model._meta.pk.column]
+
+
+def _table_queryset(model, date_fields, since):
+    queryset = model._base_manager.order_by('pk')
+    if since is not None:
+        changed = Q()
+        for field in date_fields:
+            changed |= Q(**{f'{field}__gte': since})
+        queryset = queryset.filter(changed)
+    return queryset
+
+
+def _copy_to(cursor, sql, params, file):
+    raw = cursor.cursor
+    if hasattr(raw, 'copy_expert'):
+        # psycopg2: COPY не принимает параметры, подставляем их на клиенте
+        raw.copy_expert(raw.mogrify(sql, params).decode(), file)
+        return raw.rowcount
+    with raw.copy(sql, params) as copy:
+        for data in copy:
+            file.write(data)
+    return raw.rowcount
+
+
+def _copy_from(cursor, sql, file):
+    raw = cursor.cursor
+    if hasattr(raw, 'copy_expert'):
+        raw.copy_expert(sql, file)
+        return raw.rowcount
+    with raw.copy(sql) as copy:
+        while chunk := file.read(1024 * 1024):
+            copy.write(chunk)
+    return raw.rowcount
+
+
+# ==================== ВЫГРУЗКА ====================
+
+def _export_table(name, label, date_fields, directory, fmt, compression, since, snapshot):
+    model = apps.get_model(label)
+    queryset = _table_queryset(model, date_fields, since)
+    suffix = '.zst' if compression == 'zstd' else '.gz'
+    filename = f'{name}.{fmt}{suffix}'
+
+    try:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+            cursor.execute('SET TRANSACTION SNAPSHOT %s', [snapshot])
+
+            with _open_write(os.path.join(directory, filename), compression) as out:
+                if fmt == 'copy':
+                    sql, params = queryset.values_list(*[f.attname for f in model._meta.concrete_fields]) \
+                        .query.sql_with_params()
+                    rows = _copy_to(cursor, f'COPY ({sql}) TO STDOUT WITH (FORMAT binary)', params, out)
+                else:
+                    rows = 0
+                    attnames = [field.attname for field in model._meta.concrete_fields]
+                    # iterator() в транзакции читает через серверный курсор
+                    for values in queryset.values_list(*attnames).iterator(chunk_size=JSONL_BATCH_SIZE):
+                        out.write(_dumps(dict(zip(attnames, values))))
+                        out.write(b'\n')
+                        rows += 1
+    finally:
+        connection.close()
+
+    return name, {'file': filename, 'model': label, 'columns': _columns(model), 'rows': rows}
+
+
+def _export_media(directory, since, snapshot):
+    Book = apps.get_model('books', 'Book')
+    names = set()
+    try:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+            cursor.execute('SET TRANSACTION SNAPSHOT %s', [snapshot])
+            queryset = _table_queryset(Book, ('updated_at',), since)
+            for values in queryset.values_list(*MEDIA_FIELDS).iterator(chunk_size=JSONL_BATCH_SIZE):
+                names.update(name for name in values if name)
+    finally:
+        connection.close()
+
+    added = 0
+    # Обложки и PDF уже сжаты, поэтому tar без сжатия
+    with tarfile.open(os.path.join(directory, MEDIA_ARCHIVE_NAME), 'w') as tar:
+        for name in sorted(names):
+            path = os.path.join(settings.MEDIA_ROOT, name)
+            if os.path.isfile(path):
+                tar.add(path, arcname=name)
+                added += 1
+    return {'file': MEDIA_ARCHIVE_NAME, 'files': added, 'missing': len(names) - added}
+
+
+def export_library(directory, fmt='jsonl', since=None, include_media=False, jobs=4, tables=None):
+    """Выгружает таблицы (и медиафайлы) в directory. Возвращает манифест."""
+    if connection.vendor != 'postgresql':
+        raise BackupError('Выгрузка поддерживается только для PostgreSQL')
+    os.makedirs(directory, exist_ok=True)
+    compression = _compression()
+    selected = [table for table in TABLES if tables is None or table[0] in tables]
+    ArchivedReservation = apps.get_model('books', 'ArchivedReservation')
+
+    manifest = {
+        'version': FORMAT_VERSION,
+        'format': fmt,
+        'compression': compression,
+        'since': since.isoformat() if since else None,
+        'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'tables': {},
+        'media': None,
+    }
+
+    # Снимок держится открытым, пока потоки читают таблицы
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+        cursor.execute('SELECT pg_export_snapshot()')
+        snapshot = cursor.fetchone()[0]
+
+        # Секции архива создаются при загрузке до COPY
+        cursor.execute(
+            f"SELECT DISTINCT date_trunc('month', reservation_date AT TIME ZONE 'UTC') "
+            f"FROM {ArchivedReservation._meta.db_table}"
+        )
+        manifest['archive_months'] = sorted(row[0].date().isoformat() for row in cursor.fetchall())
+
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            futures = [
+                pool.submit(_export_table, name, label, date_fields, directory, fmt, compression, since, snapshot)
+                for name, label, date_fields in selected
+            ]
+            media_future = pool.submit(_export_media, directory, since, snapshot) if include_media else None
+            for future in futures:
+                name, info = future.result()
+                manifest['tables'][name] = info
+            if media_future is not None:
+                manifest['media'] = media_future.result()
+
+    with open(os.path.join(directory, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return manifest
+
+
+# ==================== ЗАГРУЗКА ====================
+
+def read_manifest(directory):
+    path = os.path.join(directory, MANIFEST_NAME)
+    if not os.path.exists(path):
+        raise BackupError(f'Не найден {MANIFEST_NAME} в {directory}')
+    with open(path, encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get('version') != FORMAT_VERSION:
+        raise BackupError('Неподдерживаемая версия формата выгрузки')
+    return manifest
+
+
+def _iter_jsonl(file):
+    for line in file:
+        if line.strip():
+            yield orjson.loads(line) if orjson is not None else json.loads(line)
+
+
+def _load_copy(cursor, model, info, file, empty):
+    table = connection.ops.quote_name(model._meta.db_table)
+    columns = ', '.join(connection.ops.quote_name(column) for column in info['columns'])
+    if empty:
+        return _copy_from(cursor, f'COPY {table} ({columns}) FROM STDIN WITH (FORMAT binary)', file)
+
+    # Инкрементальная загрузка: COPY во временную таблицу и upsert одним запросом
+    staging = connection.ops.quote_name(f'restore_{model._meta.db_table}')
+    cursor.execute(f'CREATE TEMP TABLE {staging} (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP')
+    _copy_from(cursor, f'COPY {staging} ({columns}) FROM STDIN WITH (FORMAT binary)', file)
+    conflict = _conflict_columns(model)
+    updates = ', '.join(
+        f'{connection.ops.quote_name(column)} = EXCLUDED.{connection.ops.quote_name(column)}'
+        for column in info['columns'] if column not in conflict
+    )
+    cursor.execute(
+        f'INSERT INTO {table} ({columns}) SELECT {columns} FROM {staging} '
+        f'ON CONFLICT ({", ".join(conflict)}) DO UPDATE SET {updates}'
+    )
+    return cursor.rowcount
+
+
+@contextlib.contextmanager
+def _keep_auto_dates(model):
+    """
+    bulk_create проставляет auto_now/auto_now_add текущим временем;
+    при восстановлении даты должны остаться из выгрузки.
+    """
+    fields = [
+        field for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def _load_jsonl(model, file, empty):
+    fields = [field for field in model._meta.concrete_fields]
+    options = {}
+    if not empty:
+        conflict = _conflict_columns(model)
+        options = {
+            'update_conflicts': True,
+            'unique_fields': [f.name for f in fields if f.column in conflict],
+            'update_fields': [f.name for f in fields if f.column not in conflict],
+        }
+
+    rows = 0
+    batch = []
+    with _keep_auto_dates(model):
+        for row in _iter_jsonl(file):
+            batch.append(model(**row))
+            if len(batch) >= JSONL_BATCH_SIZE:
+                model._base_manager.bulk_create(batch, **options)
+                rows += len(batch)
+                batch = []
+        if batch:
+            model._base_manager.bulk_create(batch, **options)
+            rows += len(batch)
+    return rows
+
+
+def _extract_media(directory, manifest):
+    path = os.path.join(directory, manifest['media']['file'])
+    with tarfile.open(path) as tar:
+        # filter='data' не даёт распаковать файлы за пределы MEDIA_ROOT
+        tar.extractall(settings.MEDIA_ROOT, filter='data')
+
+
+def import_library(directory, include_media=True, jobs=4):
+    """
+    Загружает выгрузку из directory. Все таблицы - в одной транзакции,
+    внешние ключи проверяются при коммите. Возвращает {таблица: строк}.
+    """
+    if connection.vendor != 'postgresql':
+        raise BackupError('Загрузка поддерживается только для PostgreSQL')
+    manifest = read_manifest(directory)
+    compression = manifest['compression']
+    loaded = {}
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        # Медиафайлы распаковываются параллельно с загрузкой таблиц
+        media_future = None
+        if include_media and manifest.get('media'):
+            media_future = pool.submit(_extract_media, directory, manifest)
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute('SET CONSTRAINTS ALL DEFERRED')
+            cursor.execute('SET LOCAL synchronous_commit = off')
+            months = [
+                datetime.datetime.fromisoformat(month).replace(tzinfo=datetime.timezone.utc)
+                for month in manifest.get('archive_months', [])
+            ]
+            ensure_partitions(months)
+
+            models = []
+            for name, label, _ in TABLES:
+                info = manifest['tables'].get(name)
+                if info is None:
+                    continue
+                model = apps.get_model(label)
+                models.append(model)
+                empty = not model._base_manager.exists()
+                with _open_read(os.path.join(directory, info['file']), compression) as file:
+                    if manifest['format'] == 'copy':
+                        loaded[name] = _load_copy(cursor, model, info, file, empty)
+                    else:
+                        loaded[name] = _load_jsonl(model, file, empty)
+
+            # Счётчики id после загрузки с явными первичными ключами
+            for sql in connection.ops.sequence_reset_sql(no_style(), models):
+                cursor.execute(sql)
+
+        if media_future is not None:
+            media_future.result()
+
+    return loaded
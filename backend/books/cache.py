@@ -0,0 +1,85 @@
+"""
+Кэш ответов каталога (книги, жанры).
+
+Все ключи содержат версию каталога: любое изменение книги или жанра
+увеличивает версию (см. books.signals), и старые записи просто перестают
+читаться. Вместе с телом ответа хранятся его сжатые версии (см.
+library_api.response_cache): каждый кодек сжимается один раз на версию,
+а промах стоит одного сжатия.
+"""
+from django.core.cache import cache
+from django.db import transaction
+
+from library_api.response_cache import build_cached_response, request_digest, store_response
+
+CATALOG_VERSION_KEY = 'books:catalog:version'
+CATALOG_CACHE_TIMEOUT = 60 * 60
+
+
+def get_catalog_version():
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, 1, None)
+        version = cache.get(CATALOG_VERSION_KEY, 1)
+    return version
+
+
+def bump_catalog_version():
+    try:
+        return cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        cache.add(CATALOG_VERSION_KEY, 1, None)
+        return cache.incr(CATALOG_VERSION_KEY)
+
+
+def _bump_after_commit():
+    bump_catalog_version()
+
+
+def bump_catalog_version_on_commit():
+    """
+    Увеличивает версию после коммита текущей транзакции (вне её - сразу),
+    один раз, сколько бы изменений каталога в ней ни было.
+    """
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        bump_catalog_version()
+    elif not any(func is _bump_after_commit for _, func, _ in connection.run_on_commit):
+        transaction.on_commit(_bump_after_commit)
+
+
+def get_catalog_cache_key(prefix, request, *parts):
+    """
+    Ключ кэша для ответа каталога: версия + адрес запроса (включая хост,
+    от которого зависят абсолютные URL обложек) + формат ответа + доп. части.
+    """
+    return f'books:catalog:{get_catalog_version()}:{prefix}:{request_digest(request, *parts)}'
+
+
+class CatalogCacheMixin:
+    """
+    Кэширует GET-ответы каталога вместе со сжатыми версиями.
+
+    Кэшируются только машинные форматы (json, msgpack): HTML-страница
+    Browsable API зависит от пользователя.
+    """
+    catalog_cache_prefix = None
+    catalog_cache_formats = ('json', 'msgpack')
+    catalog_cache_timeout = CATALOG_CACHE_TIMEOUT
+
+    def get(self, request, *args, **kwargs):
+        if request.accepted_renderer.format not in self.catalog_cache_formats:
+            return super().get(request, *args, **kwargs)
+
+        key = get_catalog_cache_key(self.catalog_cache_prefix or type(self).__name__,
+                                    request, sorted(kwargs.items()))
+        cached = cache.get(key)
+        if cached is not None:
+            return build_cached_response(key, cached, self.catalog_cache_timeout)
+
+        response = super().get(request, *args, **kwargs)
+        if response.status_code == 200:
+            response.add_post_render_callback(
+                lambda rendered: store_response(key, request, rendered, self.catalog_cache_timeout)
+            )
+        return response
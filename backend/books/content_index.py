@@ -0,0 +1,82 @@
+"""
+Полнотекстовый индекс содержимого PDF: текст каждой страницы хранится
+в BookPage вместе с tsvector (русская и английская морфология).
+
+Извлечение текста выполняется в пуле процессов (books.workers),
+запись в БД - пачками в основном процессе.
+"""
+import logging
+
+from django.contrib.postgres.search import SearchQuery, SearchVector
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Book, BookPage
+from .pdf_tools import extract_pages
+from . import workers
+
+logger = logging.getLogger(__name__)
+
+BULK_BATCH_SIZE = 500
+
+# Книги на русском и английском: индексируем обеими морфологиями
+SEARCH_CONFIGS = ('russian', 'english')
+
+
+def build_search_vector():
+    vector = SearchVector('content', config=SEARCH_CONFIGS[0], weight='A')
+    for config in SEARCH_CONFIGS[1:]:
+        vector = vector + SearchVector('content', config=config, weight='B')
+    return vector
+
+
+def build_search_query(text):
+    query = SearchQuery(text, config=SEARCH_CONFIGS[0], search_type='websearch')
+    for config in SEARCH_CONFIGS[1:]:
+        query = query | SearchQuery(text, config=config, search_type='websearch')
+    return query
+
+
+@transaction.atomic
+def store_pages(book_id, pages):
+    """Заменяет страницы книги извлечённым текстом и пересчитывает tsvector."""
+    BookPage.objects.filter(book_id=book_id).delete()
+    BookPage.objects.bulk_create(
+        (BookPage(book_id=book_id, page_number=number, content=text) for number, text in pages),
+        batch_size=BULK_BATCH_SIZE,
+    )
+    BookPage.objects.filter(book_id=book_id).update(search_vector=build_search_vector())
+    Book.objects.filter(pk=book_id).update(content_indexed_at=timezone.now())
+
+
+def clear_pages(book_id):
+    with transaction.atomic():
+        BookPage.objects.filter(book_id=book_id).delete()
+        Book.objects.filter(pk=book_id).update(content_indexed_at=None)
+
+
+def index_book(book):
+    """Индексирует содержимое книги синхронно (в текущем процессе)."""
+    if not book.pdf_file:
+        clear_pages(book.pk)
+        return 0
+    pages = extract_pages(book.pdf_file.path)
+    store_pages(book.pk, pages)
+    return len(pages)
+
+
+def schedule_book_indexing(book):
+    """
+    Ставит индексацию книги в пул процессов после коммита транзакции,
+    в которой был загружен PDF.
+    """
+    book_id = book.pk
+    if not book.pdf_file:
+        transaction.on_commit(lambda: clear_pages(book_id))
+        return
+
+    path = book.pdf_file.path
+    transaction.on_commit(lambda: workers.submit(
+        extract_pages, path,
+        on_done=lambda pages: store_pages(book_id, pages),
+    ))
@@ -0,0 +1,223 @@
+"""
+Денормализованные счётчики каталога.
+
+Genre.books_count / available_books_count - книги жанра всего и свободные.
+Book.reservations_count - бронирования книги за всё время (включая архив),
+Book.queue_length - бронирования, ожидающие выдачи (Reservation.QUEUE_STATUSES),
+Book.available_copies и Book.status - сводка по экземплярам (books.inventory).
+
+Жанровые счётчики меняются через F() в транзакции сохранения книги
+(сигналы books.signals). Книжные бронирования в своей транзакции не
+трогают: book_dirty() после коммита кладёт id книги в буфер процесса, а
+фоновый поток раз в BOOK_COUNTERS_FLUSH_INTERVAL секунд пересчитывает
+все счётчики этих книг по строкам экземпляров и бронирований - короткой
+отдельной транзакцией на пачку книг, вместе со сменой счётчиков жанра.
+Строка популярной книги поэтому блокируется раз в интервал, а не каждым
+бронированием до его коммита.
+
+Счётчики не накапливаются приростами, поэтому потерянный буфер (SIGKILL
+или таймаут воркера, atexit не вызывается) ничего не теряет насовсем:
+сводка книги исправится при следующем её изменении. Книги, которые больше
+не меняются, исправляет reconcile_counters --every N - её запускают
+постоянно рядом с воркерами, как send_notifications.
+"""
+import threading
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from django.db.models.lookups import GreaterThan
+
+from .cache import bump_catalog_version, bump_catalog_version_on_commit
+from .models import ArchivedReservation, Book, BookCopy, Genre, Reservation
+from .workers import BufferedWriter
+
+# id книг, ожидающих пересчёта
+_pending = set()
+_lock = threading.Lock()
+
+# Книг в одной транзакции пересчёта
+FLUSH_BATCH_SIZE = 500
+
+
+def book_changed(old, new):
+    """
+    Обновляет счётчики жанров после добавления, изменения или удаления книги.
+    old/new - (genre_id, status) до и после; None, если книги не было или не стало.
+    """
+    deltas = defaultdict(lambda: [0, 0])
+    for state, sign in ((old, -1), (new, 1)):
+        if state is None or state[0] is None:
+            continue
+        genre_id, book_status = state
+        deltas[genre_id][0] += sign
+        if book_status == 'available':
+            deltas[genre_id][1] += sign
+
+    changed = False
+    for genre_id, (total, available) in deltas.items():
+        if not total and not available:
+            continue
+        Genre.objects.filter(pk=genre_id).update(
+            books_count=F('books_count') + total,
+            available_books_count=F('available_books_count') + available,
+        )
+        changed = True
+
+    # update() не вызывает сигналы, а счётчики жанров отдаются в каталоге
+    if changed:
+        bump_catalog_version_on_commit()
+
+
+def reservation_changed(book_id, old_status, new_status):
+    """
+    Пересчитывает счётчики книги после создания (old_status=None)
+    или смены статуса бронирования.
+    """
+    book_dirty(book_id)
+
+
+def book_dirty(book_id):
+    """Ставит книгу в очередь на пересчёт счётчиков после коммита текущей транзакции."""
+    transaction.on_commit(lambda: _enqueue(book_id))
+
+
+def _enqueue(book_id):
+    with _lock:
+        _pending.add(book_id)
+        full = len(_pending) >= FLUSH_BATCH_SIZE
+    _writer.start()
+    if full:
+        _writer.wake()
+
+
+def flush():
+    """Пересчитывает книги из буфера. Возвращает их число."""
+    global _pending
+    with _lock:
+        batch, _pending = _pending, set()
+    book_ids = list(batch)
+    for start in range(0, len(book_ids), FLUSH_BATCH_SIZE):
+        try:
+            refresh_books(book_ids[start:start + FLUSH_BATCH_SIZE])
+        except Exception:
+            # Непересчитанные книги вернутся в буфер до следующей попытки
+            with _lock:
+                _pending.update(book_ids[start:])
+            raise
+    return len(book_ids)
+
+
+_writer = BufferedWriter(
+    flush, 'BOOK_COUNTERS_FLUSH_INTERVAL', 0.2,
+    name='book-counters-flusher', error_message='Не удалось пересчитать счётчики книг',
+)
+
+
+def refresh_books(book_ids):
+    """
+    Пересчитывает счётчики книг book_ids по фактическим строкам одной
+    транзакцией; жанровые счётчики - при смене статуса.
+    """
+    expected = actual_book_counts()
+    changed = False
+    with transaction.atomic():
+        rows = (
+            Book.objects.select_for_update(of=('self',)).filter(pk__in=list(book_ids))
+            .annotate(**{f'actual_{name}': value for name, value in expected.items()})
+            .values('pk', 'genre_id', *expected, *(f'actual_{name}' for name in expected))
+        )
+        for row in rows:
+            updates = {
+                name: row[f'actual_{name}'] for name in expected
+                if row[name] != row[f'actual_{name}']
+            }
+            if not updates:
+                continue
+            Book.objects.filter(pk=row['pk']).update(**updates)
+            if 'status' in updates:
+                book_changed((row['genre_id'], row['status']), (row['genre_id'], updates['status']))
+            changed = True
+        if changed:
+            bump_catalog_version_on_commit()
+
+
+def _count_subquery(queryset, field):
+    counts = queryset.filter(**{field: OuterRef('pk')}).order_by().values(field).annotate(count=Count('pk'))
+    return Coalesce(Subquery(counts.values('count'), output_field=IntegerField()), Value(0))
+
+
+def actual_genre_counts():
+    books = Book.objects.all()
+    return {
+        'books_count': _count_subquery(books, 'genre'),
+        'available_books_count': _count_subquery(books.filter(status='available'), 'genre'),
+    }
+
+
+def _book_state():
+    """Сводка книги по экземплярам и бронированиям: свободные экземпляры, статус, очередь."""
+    free = _count_subquery(BookCopy.objects.filter(reservation__isnull=True), 'book')
+    waiting = _count_subquery(
+        BookCopy.objects.filter(reservation__status__in=Reservation.QUEUE_STATUSES), 'book'
+    )
+    return {
+        'available_copies': free,
+        # Свободен хоть один экземпляр - 'available'; иначе 'reserved', пока
+        # какой-то экземпляр ждёт выдачи, и 'taken', когда все на руках
+        'status': Case(
+            When(GreaterThan(free, 0), then=Value('available')),
+            When(GreaterThan(waiting, 0), then=Value('reserved')),
+            default=Value('taken'),
+        ),
+        'queue_length': _count_subquery(
+            Reservation.objects.filter(status__in=Reservation.QUEUE_STATUSES), 'book'
+        ),
+    }
+
+
+def actual_book_counts():
+    return {
+        'reservations_count': (
+            _count_subquery(Reservation.objects.all(), 'book')
+            + _count_subquery(ArchivedReservation.objects.all(), 'book')
+        ),
+        **_book_state(),
+    }
+
+
+def _drifted(queryset, expected):
+    """pk строк, у которых хотя бы один счётчик расходится с фактическим."""
+    annotated = queryset.annotate(**{f'actual_{name}': value for name, value in expected.items()})
+    condition = Q()
+    for name in expected:
+        condition |= ~Q(**{name: F(f'actual_{name}')})
+    return annotated.filter(condition).values('pk')
+
+
+def reconcile(dry_run=False):
+    """
+    Пересчитывает счётчики одним UPDATE на таблицу, только для строк
+    с расхождениями. Сначала экземпляры (inventory.sync_copies), затем
+    книги и жанры, т.к. свободные книги жанра зависят от статуса книги.
+    Возвращает (исправлено жанров, исправлено книг); при dry_run
+    экземпляры не сверяются.
+    """
+    from .inventory import sync_copies
+
+    if dry_run:
+        books = Book.objects.filter(pk__in=_drifted(Book.objects.all(), actual_book_counts()))
+        genres = Genre.objects.filter(pk__in=_drifted(Genre.objects.all(), actual_genre_counts()))
+        return genres.count(), books.count()
+
+    with transaction.atomic():
+        sync_copies()
+        books = Book.objects.filter(pk__in=_drifted(Book.objects.all(), actual_book_counts()))
+        fixed_books = books.update(**actual_book_counts())
+        genres = Genre.objects.filter(pk__in=_drifted(Genre.objects.all(), actual_genre_counts()))
+        fixed_genres = genres.update(**actual_genre_counts())
+
+    if fixed_genres or fixed_books:
+        bump_catalog_version()
+    return fixed_genres, fixed_books
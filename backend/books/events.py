@@ -0,0 +1,100 @@
+"""
+Журнал переходов бронирований (ReservationEvent) с отложенной записью.
+
+record() вызывается в транзакции перехода и ничего не пишет в БД:
+событие попадает в буфер процесса только после коммита (откаченный
+переход в журнал не попадает), а фоновый поток записывает буфер пачками
+одним INSERT - раз в RESERVATION_EVENT_FLUSH_INTERVAL секунд или сразу,
+как только накопилось FLUSH_BATCH_SIZE событий (поток -
+books.workers.BufferedWriter).
+
+Время события - момент перехода, а не записи, поэтому порядок в журнале
+не зависит от того, какой процесс сбросил буфер раньше. Журнал
+секционирован по месяцам created_at, недостающие секции создаются перед
+вставкой. При аварийном завершении теряются события за последний интервал.
+"""
+import datetime
+import threading
+
+from django.db import transaction
+from django.utils import timezone
+
+from .archive import ensure_partitions
+from .models import ReservationEvent
+from .workers import BufferedWriter
+
+_buffer = []
+_lock = threading.Lock()
+# Месяцы, секции которых уже созданы этим процессом
+_partitions = set()
+
+# Событий в одном INSERT
+FLUSH_BATCH_SIZE = 1000
+
+
+def record(reservation_id, from_status, to_status, actor=None, comment=''):
+    """Записывает переход бронирования в журнал после коммита текущей транзакции."""
+    record_many([(reservation_id, from_status)], to_status, actor, comment)
+
+
+def record_many(transitions, to_status, actor=None, comment=''):
+    """
+    То же для массовых переходов: transitions - пары (id бронирования,
+    прежний статус), все переходят в to_status.
+    """
+    now = timezone.now()
+    actor_id = actor.pk if actor is not None and actor.is_authenticated else None
+    events = [
+        ReservationEvent(
+            reservation_id=reservation_id, actor_id=actor_id,
+            from_status=from_status or '', to_status=to_status,
+            comment=str(comment) if comment else '', created_at=now,
+        )
+        for reservation_id, from_status in transitions
+    ]
+    if events:
+        transaction.on_commit(lambda: _enqueue(events))
+
+
+def _enqueue(events):
+    with _lock:
+        _buffer.extend(events)
+        full = len(_buffer) >= FLUSH_BATCH_SIZE
+    _writer.start()
+    if full:
+        _writer.wake()
+
+
+def _month(moment):
+    moment = moment.astimezone(datetime.timezone.utc)
+    return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def flush():
+    """Записывает буфер в БД. Возвращает число записанных событий."""
+    global _buffer
+    with _lock:
+        batch, _buffer = _buffer, []
+    if not batch:
+        return 0
+
+    try:
+        months = {_month(event.created_at) for event in batch} - _partitions
+        if months:
+            ensure_partitions(sorted(months), ReservationEvent)
+            _partitions.update(months)
+        for start in range(0, len(batch), FLUSH_BATCH_SIZE):
+            ReservationEvent.objects.bulk_create(batch[start:start + FLUSH_BATCH_SIZE])
+    except Exception:
+        # Вставленные пачки уже получили pk, остальное вернём в начало
+        # буфера до следующей попытки
+        with _lock:
+            _buffer[:0] = [event for event in batch if event.pk is None]
+        raise
+    return len(batch)
+
+
+_writer = BufferedWriter(
+    flush, 'RESERVATION_EVENT_FLUSH_INTERVAL', 1,
+    name='reservation-event-flusher', error_message='Не удалось записать журнал бронирований',
+)
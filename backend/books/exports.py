@@ -0,0 +1,90 @@
+"""
+Выгрузка бронирований и книг в CSV/XLSX (library_api.exports).
+
+Строки читаются .values_list().iterator() - на PostgreSQL это серверный
+курсор, модели не создаются. Связанные поля берутся JOIN'ом в том же
+запросе, коды статусов заменяются подписями по словарю.
+"""
+import itertools
+
+from library_api.exports import export_response
+
+from .models import Book, Reservation
+
+# Строк, читаемых из курсора за раз
+EXPORT_CHUNK_SIZE = 2000
+
+RESERVATION_COLUMNS = (
+    ('id', 'ID'),
+    ('user__username', 'Пользователь'),
+    ('user__email', 'Email'),
+    ('book_id', 'ID книги'),
+    ('book__title', 'Книга'),
+    ('book__author', 'Автор'),
+    ('status', 'Статус'),
+    ('reservation_date', 'Дата бронирования'),
+    ('confirmed_date', 'Дата подтверждения'),
+    ('taken_date', 'Дата выдачи'),
+    ('return_date', 'Дата возврата'),
+    ('pickup_date', 'Планируемая дата получения'),
+    ('pickup_time', 'Планируемое время получения'),
+    ('user_comment', 'Комментарий пользователя'),
+    ('admin_comment', 'Комментарий администратора'),
+)
+
+BOOK_COLUMNS = (
+    ('id', 'ID'),
+    ('title', 'Название'),
+    ('author', 'Автор'),
+    ('genre__name', 'Жанр'),
+    ('year_published', 'Год издания'),
+    ('isbn', 'ISBN'),
+    ('status', 'Статус'),
+    ('total_copies', 'Экземпляров'),
+    ('available_copies', 'Свободно'),
+    ('reservations_count', 'Бронирований'),
+    ('queue_length', 'В очереди'),
+    ('created_at', 'Дата добавления'),
+)
+
+
+def _rows(queryset, columns, choices):
+    fields = [field for field, _ in columns]
+    status_index = fields.index('status')
+    for row in queryset.values_list(*fields).iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        row = list(row)
+        row[status_index] = choices.get(row[status_index], row[status_index])
+        yield row
+
+
+def reservation_rows(queryset, archived_queryset=None):
+    """
+    Строки бронирований; archived_queryset - архивные бронирования
+    с теми же фильтрами, выгружаются следом.
+    """
+    choices = dict(Reservation.STATUS_CHOICES)
+    querysets = [queryset.order_by('-reservation_date')]
+    if archived_queryset is not None:
+        querysets.append(archived_queryset.order_by('-reservation_date'))
+    return itertools.chain.from_iterable(
+        _rows(qs, RESERVATION_COLUMNS, choices) for qs in querysets
+    )
+
+
+def book_rows(queryset):
+    return _rows(queryset.order_by('pk'), BOOK_COLUMNS, dict(Book.STATUS_CHOICES))
+
+
+def reservations_response(queryset, fmt, archived_queryset=None):
+    return export_response(
+        [title for _, title in RESERVATION_COLUMNS],
+        reservation_rows(queryset, archived_queryset),
+        'reservations', fmt, sheet_name='Бронирования'
+    )
+
+
+def books_response(queryset, fmt):
+    return export_response(
+        [title for _, title in BOOK_COLUMNS], book_rows(queryset),
+        'books', fmt, sheet_name='Книги'
+    )
@@ -0,0 +1,73 @@
+"""
+Фасетные счётчики каталога: количество книг по жанрам, статусам
+и интервалам годов издания для текущего поиска и фильтров.
+
+Все счётчики считаются одним SQL-запросом через GROUPING SETS
+(один проход по таблице).
+"""
+from django.db import connection
+from django.db.models import F, IntegerField, ExpressionWrapper
+
+from .models import Book
+
+# Значения GROUPING(f_genre, f_status, f_bucket): бит = 1, если колонка не группируется
+GENRE_SET = 0b011
+STATUS_SET = 0b101
+YEAR_SET = 0b110
+TOTAL_SET = 0b111
+
+
+def _source_sql(queryset, year_bucket):
+    source = queryset.order_by().values(
+        f_genre=F('genre_id'),
+        f_genre_name=F('genre__name'),
+        f_status=F('status'),
+        f_bucket=ExpressionWrapper(
+            F('year_published') / year_bucket * year_bucket,
+            output_field=IntegerField()
+        ),
+    )
+    return source.query.sql_with_params()
+
+
+def _fetch_rows(queryset, year_bucket):
+    sql, params = _source_sql(queryset, year_bucket)
+
+    query = f'''
+        SELECT GROUPING(f_genre, f_status, f_bucket), f_genre, MAX(f_genre_name),
+               f_status, f_bucket, COUNT(*)
+        FROM ({sql}) AS facet_source
+        GROUP BY GROUPING SETS ((f_genre), (f_status), (f_bucket), ())
+    '''
+    with connection.cursor() as cursor:
+        cursor.execute(query, params)
+        return cursor.fetchall()
+
+
+def compute_facets(queryset, year_bucket=10):
+    """
+    Счётчики по жанрам, статусам и интервалам годов для queryset книг.
+    """
+    status_labels = dict(Book.STATUS_CHOICES)
+    status_order = list(status_labels)
+    result = {'total': 0, 'genre': [], 'status': [], 'year': []}
+
+    for grouping, genre_id, genre_name, book_status, bucket, count in _fetch_rows(queryset, year_bucket):
+        if grouping == GENRE_SET:
+            result['genre'].append({'id': genre_id, 'name': genre_name, 'count': count})
+        elif grouping == STATUS_SET:
+            result['status'].append({
+                'value': book_status,
+                'label': status_labels.get(book_status, book_status),
+                'count': count,
+            })
+        elif grouping == YEAR_SET and bucket is not None:
+            result['year'].append({'from': bucket, 'to': bucket + year_bucket - 1, 'count': count})
+        elif grouping == TOTAL_SET:
+            result['total'] = count
+
+    result['genre'].sort(key=lambda item: (item['name'] is None, item['name'] or ''))
+    result['status'].sort(key=lambda item: status_order.index(item['value'])
+                          if item['value'] in status_order else len(status_order))
+    result['year'].sort(key=lambda item: item['from'])
+    return result
@@ -0,0 +1,204 @@
+"""
+Экземпляры книги: строки BookCopy, по одной на экземпляр (их столько,
+сколько Book.total_copies). Экземпляр с reservation = NULL свободен.
+
+Бронирование занимает любой свободный экземпляр одним UPDATE с
+подзапросом FOR UPDATE SKIP LOCKED: параллельные бронирования одной книги
+берут разные строки и не ждут друг друга, а строку самой книги не
+трогают вовсе. Отмена и возврат освобождают экземпляр своего
+бронирования (его строку держит только это бронирование).
+
+Book.available_copies и Book.status - сводка для каталога: её
+пересчитывает books.counters после коммита, пачками и вне транзакции
+бронирования (см. counters.book_dirty). Сводка отстаёт на доли секунды;
+решение «есть ли свободный экземпляр» принимается только по строкам
+экземпляров. SKIP LOCKED может вернуть «свободных нет», пока последние
+свободные экземпляры заняты транзакциями, которые ещё не завершились, -
+это честный ответ для такой нагрузки.
+"""
+from django.db import connection
+
+from .counters import book_dirty
+from .models import Book, BookCopy, Reservation
+
+
+def _execute(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(sql.format(
+            copies=connection.ops.quote_name(BookCopy._meta.db_table),
+            books=connection.ops.quote_name(Book._meta.db_table),
+            reservations=connection.ops.quote_name(Reservation._meta.db_table),
+        ), params)
+        return cursor.fetchall() if cursor.description else cursor.rowcount
+
+
+def take_copy(book_id, reservation_id):
+    """
+    Закрепляет за бронированием свободный экземпляр книги.
+    Возвращает False, если свободных нет.
+    """
+    rows = _execute(
+        '''
+        UPDATE {copies} SET reservation_id = %s
+        WHERE id = (
+            SELECT id FROM {copies}
+            WHERE book_id = %s AND reservation_id IS NULL
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING id
+        ''',
+        [reservation_id, book_id]
+    )
+    if not rows:
+        return False
+    book_dirty(book_id)
+    return True
+
+
+def lock_free_copy(book_id):
+    """
+    Блокирует до конца транзакции свободный экземпляр книги, не занимая
+    его: последующий take_copy в той же транзакции его получит (свои
+    блокировки SKIP LOCKED не пропускает). Возвращает False, если свободных нет.
+    """
+    return (
+        BookCopy.objects.select_for_update(skip_locked=True)
+        .filter(book_id=book_id, reservation__isnull=True)
+        .exists()
+    )
+
+
+def release_copy(reservation_id):
+    """
+    Освобождает экземпляр бронирования (отмена или возврат). Если
+    total_copies успели уменьшить, экземпляр списывается.
+    """
+    rows = _execute(
+        'UPDATE {copies} SET reservation_id = NULL WHERE reservation_id = %s RETURNING id, book_id',
+        [reservation_id]
+    )
+    for copy_id, book_id in rows:
+        _execute(
+            '''
+            DELETE FROM {copies}
+            WHERE id = %s
+              AND (SELECT count(*) FROM {copies} WHERE book_id = %s)
+                  > (SELECT total_copies FROM {books} WHERE id = %s)
+            ''',
+            [copy_id, book_id, book_id]
+        )
+        book_dirty(book_id)
+
+
+def mark_copy_taken(book_id):
+    """
+    Выдача не освобождает и не занимает экземпляр, но может сменить статус
+    книги на 'taken' (все экземпляры на руках).
+    """
+    book_dirty(book_id)
+
+
+def book_created(book):
+    BookCopy.objects.bulk_create(BookCopy(book_id=book.pk) for _ in range(book.total_copies))
+    book_dirty(book.pk)
+
+
+def total_copies_changed(book_id, delta):
+    """
+    Изменение total_copies в админке или API: новые экземпляры добавляются
+    свободными, при уменьшении списываются свободные; занятые сверх
+    total_copies списываются при освобождении (release_copy).
+    """
+    if delta > 0:
+        BookCopy.objects.bulk_create(BookCopy(book_id=book_id) for _ in range(delta))
+    elif delta < 0:
+        _execute(
+            '''
+            DELETE FROM {copies} WHERE id IN (
+                SELECT id FROM {copies}
+                WHERE book_id = %s AND reservation_id IS NULL
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+            ''',
+            [book_id, -delta]
+        )
+    if delta:
+        book_dirty(book_id)
+
+
+def reservation_moved(book_id, reservation_id, old_status, new_status):
+    """
+    Занимает или освобождает экземпляр при произвольной смене статуса
+    бронирования (ручное редактирование в админке). old_status=None - новое.
+    Возвращает False, если занять экземпляр не удалось.
+    """
+    was_active = old_status in Reservation.ACTIVE_STATUSES
+    is_active = new_status in Reservation.ACTIVE_STATUSES
+    if is_active and not was_active:
+        return take_copy(book_id, reservation_id)
+    if was_active and not is_active:
+        release_copy(reservation_id)
+    elif is_active and new_status != old_status:
+        mark_copy_taken(book_id)
+    return True
+
+
+def sync_copies():
+    """
+    Приводит экземпляры в соответствие с total_copies и активными
+    бронированиями (команда reconcile_counters, после import_library):
+    досоздаёт недостающие, освобождает экземпляры завершённых и удалённых
+    бронирований, закрепляет свободные за активными бронированиями без
+    экземпляра и списывает лишние свободные. Возвращает id затронутых книг.
+    """
+    active = list(Reservation.ACTIVE_STATUSES)
+    touched = set()
+    statements = (
+        ('''
+        INSERT INTO {copies} (book_id)
+        SELECT b.id FROM {books} b
+        CROSS JOIN LATERAL generate_series(
+            1, b.total_copies - (SELECT count(*) FROM {copies} c WHERE c.book_id = b.id)
+        )
+        RETURNING book_id
+        ''', []),
+        ('''
+        UPDATE {copies} SET reservation_id = NULL
+        WHERE reservation_id IS NOT NULL AND NOT EXISTS (
+            SELECT 1 FROM {reservations} r WHERE r.id = reservation_id AND r.status = ANY(%s)
+        )
+        RETURNING book_id
+        ''', [active]),
+        ('''
+        WITH holders AS (
+            SELECT r.id, r.book_id, row_number() OVER (PARTITION BY r.book_id ORDER BY r.id) AS n
+            FROM {reservations} r
+            WHERE r.status = ANY(%s)
+              AND NOT EXISTS (SELECT 1 FROM {copies} c WHERE c.reservation_id = r.id)
+        ), free AS (
+            SELECT id, book_id, row_number() OVER (PARTITION BY book_id ORDER BY id) AS n
+            FROM {copies} WHERE reservation_id IS NULL
+        )
+        UPDATE {copies} SET reservation_id = holders.id
+        FROM free JOIN holders ON holders.book_id = free.book_id AND holders.n = free.n
+        WHERE {copies}.id = free.id
+        RETURNING {copies}.book_id
+        ''', [active]),
+        ('''
+        WITH excess AS (
+            SELECT c.id, c.book_id,
+                   row_number() OVER (PARTITION BY c.book_id ORDER BY c.id DESC) AS n,
+                   (SELECT count(*) FROM {copies} a WHERE a.book_id = c.book_id) - b.total_copies AS extra
+            FROM {copies} c JOIN {books} b ON b.id = c.book_id
+            WHERE c.reservation_id IS NULL
+        )
+        DELETE FROM {copies} USING excess
+        WHERE {copies}.id = excess.id AND excess.n <= excess.extra
+        RETURNING {copies}.book_id
+        ''', []),
+    )
+    for sql, params in statements:
+        touched.update(book_id for book_id, in _execute(sql, params))
+    return touched
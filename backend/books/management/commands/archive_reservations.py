@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from books.archive import archive_reservations
+
+
+class Command(BaseCommand):
+    help = ('Переносит возвращённые и отменённые бронирования в архив, '
+            'секционированный по месяцам (запускать по расписанию, например раз в сутки)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.RESERVATION_ARCHIVE_AFTER_DAYS,
+                            help='Переносить бронирования старше этого числа дней')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Строк в одной транзакции')
+        parser.add_argument('--max-batches', type=int, default=None,
+                            help='Ограничить число пачек за один запуск')
+
+    def handle(self, *args, **options):
+        moved = archive_reservations(
+            options['days'],
+            batch_size=options['batch_size'],
+            max_batches=options['max_batches'],
+        )
+        self.stdout.write(self.style.SUCCESS(f'Перенесено в архив: {moved}'))
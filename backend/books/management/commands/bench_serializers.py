@@ -0,0 +1,79 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from books.models import Book, Reservation
+from books.serializers import BookListSerializer, ReservationSerializer
+from library_api.fieldsets import narrow_queryset
+from library_api.renderers import FastJSONRenderer, MessagePackRenderer, msgpack
+
+
+SCENARIOS = (
+    # (название, сериализатор, queryset, параметры запроса)
+    ('books: полный список', BookListSerializer,
+     lambda: Book.objects.select_related('genre'), {}),
+    ('books: без description', BookListSerializer,
+     lambda: Book.objects.select_related('genre'), {'exclude': 'description'}),
+    ('books: карточки сетки', BookListSerializer,
+     lambda: Book.objects.select_related('genre'),
+     {'fields': 'id,title,author,cover_image_url,status'}),
+    ('reservations: полный список', ReservationSerializer,
+     lambda: Reservation.objects.select_related('book', 'user'), {}),
+    ('reservations: без вложенных', ReservationSerializer,
+     lambda: Reservation.objects.select_related('book', 'user'),
+     {'fields': 'id,book,status,pickup_date,pickup_time'}),
+    ('reservations: с названием книги', ReservationSerializer,
+     lambda: Reservation.objects.select_related('book', 'user'),
+     {'fields': 'id,status,book_details.id,book_details.title'}),
+)
+
+
+def _median_ms(func, repeat):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings), result
+
+
+class Command(BaseCommand):
+    help = ('Замер размера ответа и времени сериализации/рендеринга: '
+            'полное представление, разреженные наборы полей, stdlib json, orjson и msgpack')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=100, help='Строк на страницу')
+        parser.add_argument('--repeat', type=int, default=20, help='Количество повторов')
+
+    def handle(self, *args, **options):
+        limit = options['limit']
+        repeat = options['repeat']
+        factory = APIRequestFactory()
+        renderers = [('json', JSONRenderer()), ('orjson', FastJSONRenderer())]
+        if msgpack is not None:
+            renderers.append(('msgpack', MessagePackRenderer()))
+
+        header = f'{"сценарий":<36}{"строк":>7}{"serialize мс":>14}'
+        for label, _ in renderers:
+            header += f'{label + " байт":>14}{label + " мс":>12}'
+        self.stdout.write(header)
+
+        for name, serializer_class, get_queryset, params in SCENARIOS:
+            request = Request(factory.get('/', params))
+
+            def serialize():
+                context = {'request': request}
+                queryset = narrow_queryset(get_queryset(), serializer_class(context=context))
+                return serializer_class(queryset[:limit], many=True, context=context).data
+
+            serialize_ms, data = _median_ms(serialize, repeat)
+            line = f'{name:<36}{len(data):>7}{serialize_ms:>14.2f}'
+            for _, renderer in renderers:
+                render_ms, payload = _median_ms(lambda: renderer.render(data), repeat)
+                line += f'{len(payload):>14}{render_ms:>12.2f}'
+            self.stdout.write(line)
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from books.snapshot import SnapshotError, build_snapshot
+
+
+class Command(BaseCommand):
+    help = ('Собирает офлайн-снимок каталога (SQLite) и дельту от предыдущей версии '
+            '(запускать по расписанию, например раз в час)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Строк, читаемых из БД за раз')
+        parser.add_argument('--keep-deltas', type=int, default=None,
+                            help='Сколько последних дельт хранить')
+        parser.add_argument('--force', action='store_true',
+                            help='Новая версия, даже если каталог не изменился')
+
+    def handle(self, *args, **options):
+        try:
+            manifest, changed = build_snapshot(
+                batch_size=options['batch_size'],
+                keep_deltas=options['keep_deltas'],
+                force=options['force'],
+            )
+        except SnapshotError as exc:
+            raise CommandError(str(exc))
+
+        if changed == 0 and not options['force']:
+            self.stdout.write(f'Каталог не изменился, версия {manifest["version"]}')
+            return
+        snapshot = manifest['snapshot']
+        message = f'Версия {manifest["version"]}: {snapshot["file"]} ({snapshot["size"]} байт)'
+        if changed is not None:
+            message += f', изменено строк: {changed}'
+        self.stdout.write(self.style.SUCCESS(message))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from books.similarity import SimilarityError, build_similarity
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает похожие книги (TF-IDF по названию, автору и описанию)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='Пересчитать все книги, а не только изменённые с прошлого запуска')
+        parser.add_argument('--top-k', type=int, default=None,
+                            help='Соседей на книгу (по умолчанию - SIMILAR_BOOKS_TOP_K)')
+
+    def handle(self, *args, **options):
+        try:
+            total, recomputed, inserted = build_similarity(full=options['full'], top_k=options['top_k'])
+        except SimilarityError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(
+            f'Книг в индексе: {total}, пересчитано списков: {recomputed}, дополнено: {inserted}'
+        ))
@@ -0,0 +1,26 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from books.models import BookUpload
+from books.uploads import abort_upload
+
+
+class Command(BaseCommand):
+    help = 'Удаляет незавершённые загрузки файлов, которые не продолжались дольше заданного времени'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=24,
+                            help='Возраст последнего изменения загрузки (часы)')
+
+    def handle(self, *args, **options):
+        threshold = timezone.now() - timedelta(hours=options['hours'])
+        stale = BookUpload.objects.filter(updated_at__lt=threshold)
+
+        removed = 0
+        for upload in stale.iterator():
+            abort_upload(upload)
+            removed += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Удалено загрузок: {removed}'))
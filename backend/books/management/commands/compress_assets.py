@@ -0,0 +1,60 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from library_api.compression import FILE_SUFFIXES, available_encodings, compress
+
+TEXT_EXTENSIONS = ('.css', '.js', '.mjs', '.json', '.svg', '.txt', '.html', '.xml', '.map')
+
+
+class Command(BaseCommand):
+    help = ('Заранее сжимает текстовые static/media файлы (.gz, .br, .zst рядом с оригиналом), '
+            'чтобы не сжимать их на каждом запросе')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--preset', default='max', choices=('fast', 'balanced', 'max'))
+        parser.add_argument('--min-size', type=int, default=settings.COMPRESSION_MIN_SIZE,
+                            help='Файлы меньше этого размера не сжимаются')
+        parser.add_argument('--force', action='store_true', help='Пересжать даже актуальные копии')
+
+    def handle(self, *args, **options):
+        created = skipped = 0
+        for root in (settings.STATIC_ROOT, settings.MEDIA_ROOT):
+            if not root or not os.path.isdir(root):
+                continue
+            for dirpath, _, filenames in os.walk(root):
+                for filename in filenames:
+                    if not filename.lower().endswith(TEXT_EXTENSIONS):
+                        continue
+                    path = os.path.join(dirpath, filename)
+                    if os.path.getsize(path) < options['min_size']:
+                        continue
+                    for encoding in available_encodings():
+                        if self.compress_file(path, encoding, options['preset'], options['force']):
+                            created += 1
+                        else:
+                            skipped += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано сжатых копий: {created}, пропущено (актуальны или не меньше оригинала): {skipped}'
+        ))
+
+    def compress_file(self, path, encoding, preset, force):
+        target = path + FILE_SUFFIXES[encoding]
+        if not force and os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(path):
+            return False
+
+        with open(path, 'rb') as f:
+            data = f.read()
+        compressed = compress(data, encoding, preset)
+        if len(compressed) >= len(data):
+            if os.path.exists(target):
+                os.remove(target)
+            return False
+
+        tmp = target + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(compressed)
+        os.replace(tmp, target)
+        return True
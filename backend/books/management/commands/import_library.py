@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from books.backup import BackupError, import_library
+from books.cache import bump_catalog_version
+from books.counters import reconcile
+
+
+class Command(BaseCommand):
+    help = ('Загружает выгрузку export_library одной транзакцией с отложенной проверкой '
+            'внешних ключей. В пустые таблицы - COPY/bulk insert, в непустые - upsert')
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help='Каталог с manifest.json')
+        parser.add_argument('--no-media', action='store_true', help='Не распаковывать media.tar')
+        parser.add_argument('--jobs', type=int, default=4)
+
+    def handle(self, *args, **options):
+        try:
+            loaded = import_library(
+                options['input'],
+                include_media=not options['no_media'],
+                jobs=options['jobs'],
+            )
+        except BackupError as exc:
+            raise CommandError(str(exc))
+
+        # Экземпляры книг не выгружаются: они строятся по total_copies и
+        # активным бронированиям, вместе со счётчиками
+        reconcile()
+        bump_catalog_version()
+        for name, rows in loaded.items():
+            self.stdout.write(f'{name}: {rows} строк')
+        self.stdout.write(self.style.SUCCESS(
+            'Загрузка завершена. Поиск по содержимому PDF пересоздаётся командой index_book_content'
+        ))
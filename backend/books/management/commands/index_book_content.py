@@ -0,0 +1,72 @@
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import F, Q
+
+from books import workers
+from books.content_index import store_pages, clear_pages
+from books.models import Book
+from books.pdf_tools import extract_pages, pypdf
+
+
+class Command(BaseCommand):
+    help = 'Индексирует текст PDF книг для поиска по содержимому (извлечение текста - в пуле процессов)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Переиндексировать все книги, а не только новые и изменённые')
+        parser.add_argument('--book', type=int, action='append', dest='book_ids',
+                            help='ID книги (можно указать несколько раз)')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Количество процессов (по умолчанию - BOOK_WORKERS)')
+
+    def handle(self, *args, **options):
+        if pypdf is None:
+            raise CommandError('Для извлечения текста из PDF установите пакет pypdf')
+
+        books = Book.objects.order_by('pk')
+        if options['book_ids']:
+            books = books.filter(pk__in=options['book_ids'])
+        elif not options['all']:
+            # Только новые PDF: updated_at меняется и от выдачи экземпляров,
+            # а замена файла сбрасывает content_indexed_at (books.pdf_pipeline),
+            # оптимизация - обновляет pdf_optimized_at
+            books = books.filter(
+                Q(content_indexed_at__isnull=True) | Q(content_indexed_at__lt=F('pdf_optimized_at'))
+            )
+
+        pool = workers.get_process_pool(options['workers'])
+        max_in_flight = pool._max_workers * 2
+        in_flight = {}
+        indexed = pages_total = failed = 0
+
+        def collect(done):
+            nonlocal indexed, pages_total, failed
+            for future in done:
+                book_id = in_flight.pop(future)
+                try:
+                    pages = future.result()
+                except Exception as exc:
+                    failed += 1
+                    self.stderr.write(f'Книга {book_id}: не удалось извлечь текст ({exc})')
+                    continue
+                store_pages(book_id, pages)
+                indexed += 1
+                pages_total += len(pages)
+
+        # Держим ограниченное число задач в работе, чтобы память не росла с размером каталога
+        for book_id, pdf_file in books.values_list('pk', 'pdf_file').iterator():
+            if not pdf_file:
+                clear_pages(book_id)
+                continue
+            path = Book._meta.get_field('pdf_file').storage.path(pdf_file)
+            in_flight[pool.submit(extract_pages, path)] = book_id
+            if len(in_flight) >= max_in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done)
+
+        collect(wait(in_flight).done)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Проиндексировано книг: {indexed}, страниц: {pages_total}, ошибок: {failed}'
+        ))
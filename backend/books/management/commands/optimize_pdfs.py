@@ -0,0 +1,84 @@
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from django.core.management.base import BaseCommand, CommandError
+
+from books import workers
+from books.content_index import index_book
+from books.models import Book
+from books.pdf_pipeline import is_referenced, optimize_args, restore_original, store_result
+from books.pdf_tools import optimize_pdf, pypdf
+
+
+class Command(BaseCommand):
+    help = ('Оптимизирует уже загруженные PDF книг (сжатие, дубликаты, линеаризация, '
+            'по желанию пережатие изображений) и записывает число страниц и размер')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Обработать заново и уже оптимизированные книги')
+        parser.add_argument('--book', type=int, action='append', dest='book_ids',
+                            help='ID книги (можно указать несколько раз)')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Количество процессов (по умолчанию - BOOK_WORKERS)')
+        parser.add_argument('--no-index', action='store_true',
+                            help='Не переиндексировать текст после замены файла')
+
+    def handle(self, *args, **options):
+        if pypdf is None:
+            raise CommandError('Для оптимизации PDF установите пакет pypdf')
+
+        books = Book.objects.exclude(pdf_file='').exclude(pdf_file__isnull=True).order_by('pk')
+        if options['book_ids']:
+            books = books.filter(pk__in=options['book_ids'])
+        elif not options['all']:
+            books = books.filter(pdf_optimized_at__isnull=True)
+
+        pool = workers.get_process_pool(options['workers'])
+        max_in_flight = pool._max_workers * 2
+        in_flight = {}
+        processed = failed = saved = 0
+
+        def collect(done):
+            nonlocal processed, failed, saved
+            for future in done:
+                book_id, source, target, previous = in_flight.pop(future)
+                try:
+                    result = future.result()
+                except Exception as exc:
+                    failed += 1
+                    self.stderr.write(f'Книга {book_id}: не удалось оптимизировать PDF ({exc})')
+                    continue
+                book = store_result(book_id, source, target, result)
+                if book is None:
+                    continue
+                processed += 1
+                saved += result['original_size'] - book.pdf_size
+                if previous and previous != book.pdf_file.name and not is_referenced(previous, None):
+                    # Прежний оптимизированный файл заменён новым
+                    Book._meta.get_field('pdf_file').storage.delete(previous)
+                if book.pdf_file.name != source and not options['no_index']:
+                    index_book(book)
+
+        # Держим ограниченное число задач в работе, как и index_book_content
+        for book_id, pdf_file in books.values_list('pk', 'pdf_file').iterator():
+            source, previous = pdf_file, None
+            # Повторная обработка (--all, --book) начинается с исходного файла
+            original = Book.objects.filter(pk=book_id).values_list('pdf_original', flat=True).first()
+            if original and original != pdf_file:
+                try:
+                    source, previous = restore_original(book_id, original), pdf_file
+                except OSError as exc:
+                    failed += 1
+                    self.stderr.write(f'Книга {book_id}: не удалось вернуть исходный PDF ({exc})')
+                    continue
+            args, target = optimize_args(source)
+            in_flight[pool.submit(optimize_pdf, *args)] = (book_id, source, target, previous)
+            if len(in_flight) >= max_in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done)
+
+        collect(wait(in_flight).done)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано книг: {processed}, сэкономлено байт: {saved}, ошибок: {failed}'
+        ))
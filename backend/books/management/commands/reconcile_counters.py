@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from books.counters import reconcile
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает денормализованные счётчики жанров и книг '
+            '(книги жанра, свободные книги, бронирования, очередь) там, где они разошлись. '
+            'С --every работает постоянно и сверяет раз в N секунд')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только показать число строк с расхождениями')
+        parser.add_argument('--every', type=float, default=None,
+                            help='Повторять раз в N секунд (для постоянного запуска рядом с воркерами)')
+
+    def handle(self, *args, **options):
+        verb = 'Расхождений' if options['dry_run'] else 'Исправлено'
+        try:
+            while True:
+                close_old_connections()
+                genres, books = reconcile(dry_run=options['dry_run'])
+                if options['every'] is None or genres or books:
+                    self.stdout.write(self.style.SUCCESS(f'{verb}: жанров {genres}, книг {books}'))
+                if options['every'] is None:
+                    return
+                time.sleep(options['every'])
+        except KeyboardInterrupt:
+            pass
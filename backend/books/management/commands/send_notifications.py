@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from books.notifications import dispatch_batch, schedule_pickup_reminders
+
+
+class Command(BaseCommand):
+    help = ('Отправляет уведомления из очереди (outbox) и ставит напоминания о получении книг. '
+            'Без --once работает постоянно; можно запускать несколько экземпляров')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Разобрать очередь и выйти')
+        parser.add_argument('--batch-size', type=int, default=500, help='Уведомлений в пачке')
+        parser.add_argument('--workers', type=int, default=16, help='Параллельных отправок')
+        parser.add_argument('--interval', type=float, default=5,
+                            help='Пауза (секунды), когда очередь пуста')
+        parser.add_argument('--reminders-every', type=float, default=600,
+                            help='Как часто (секунды) искать бронирования для напоминаний')
+
+    def handle(self, *args, **options):
+        reminders_at = 0
+        totals = [0, 0]
+        try:
+            while True:
+                close_old_connections()
+                if time.monotonic() >= reminders_at:
+                    queued = schedule_pickup_reminders()
+                    if queued:
+                        self.stdout.write(f'Напоминаний поставлено: {queued}')
+                    reminders_at = time.monotonic() + options['reminders_every']
+
+                started = time.perf_counter()
+                claimed, sent, failed = dispatch_batch(options['batch_size'], options['workers'])
+                totals[0] += sent
+                totals[1] += failed
+                if claimed:
+                    self.stdout.write(
+                        f'Отправлено {sent}, ошибок {failed} за {time.perf_counter() - started:.2f} с'
+                    )
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS(f'Всего отправлено: {totals[0]}, ошибок: {totals[1]}'))
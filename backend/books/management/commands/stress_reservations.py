@@ -0,0 +1,210 @@
+import statistics
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from books import counters
+from books.models import Book, BookCopy, Reservation
+from books.views import ReservationCreateView, cancel_reservation
+
+# Как часто (секунды) считаются запросы, ждущие блокировку
+LOCK_SAMPLE_INTERVAL = 0.005
+
+
+def _percentile(values, fraction):
+    if not values:
+        return 0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный тест экземпляров: много пользователей одновременно бронируют '
+            'одну популярную книгу, затем одновременно отменяют бронирования. '
+            'Проверяет, что экземпляров не выдано больше, чем есть, и сводка сходится; '
+            'для сравнения повторяет то же с блокировкой строки книги до коммита '
+            '(как при едином счётчике на книгу)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--copies', type=int, default=20, help='Экземпляров у книги')
+        parser.add_argument('--clients', type=int, default=100, help='Пользователей-конкурентов')
+        parser.add_argument('--threads', type=int, default=16, help='Одновременных запросов')
+        parser.add_argument('--keep', action='store_true', help='Не удалять тестовые данные')
+        parser.add_argument('--no-baseline', action='store_true',
+                            help='Не запускать сравнение с блокировкой строки книги')
+
+    def handle(self, *args, **options):
+        results = {'экземпляры': self.run(options, row_lock=False)}
+        if not options['no_baseline']:
+            results['строка книги'] = self.run(options, row_lock=True)
+
+        if len(results) > 1:
+            self.stdout.write('Бронирование, сравнение:')
+            for name, (rate, waiting) in results.items():
+                self.stdout.write(f'  {name}: {rate:.0f} запр/с, ждали блокировку в среднем {waiting:.1f} запросов')
+        self.stdout.write(self.style.SUCCESS('Экземпляры и сводка книги согласованы'))
+
+    def run(self, options, row_lock):
+        """
+        Один прогон на новой книге. row_lock - эмулировать прежнюю схему:
+        транзакция бронирования сразу блокирует строку книги и держит до коммита.
+        """
+        copies, clients = options['copies'], options['clients']
+        User = get_user_model()
+        tag = uuid.uuid4().hex[:8]
+        title = 'Строка книги' if row_lock else 'Экземпляры'
+        self.stdout.write(f'== {title} ==')
+
+        book = Book.objects.create(
+            title=f'Нагрузочный тест {tag}', author='stress', description='',
+            year_published=2000, total_copies=copies,
+        )
+        User.objects.bulk_create(
+            User(username=f'stress_{tag}_{i}', email=f'stress_{tag}_{i}@example.com')
+            for i in range(clients)
+        )
+        users = list(User.objects.filter(username__startswith=f'stress_{tag}_'))
+
+        def locked(func):
+            if not row_lock:
+                return func
+
+            def wrapper(*args, **kwargs):
+                with transaction.atomic():
+                    Book.objects.select_for_update().filter(pk=book.pk).exists()
+                    return func(*args, **kwargs)
+            return wrapper
+
+        try:
+            factory = APIRequestFactory()
+            create_view = locked(ReservationCreateView.as_view())
+            cancel_view = locked(cancel_reservation)
+            data = {'book': book.pk, 'pickup_date': '2030-01-01', 'pickup_time': '10:00'}
+
+            def reserve(user):
+                request = factory.post('/api/reservations/create/', data, format='json')
+                force_authenticate(request, user=user)
+                return create_view(request)
+
+            with LockSampler() as sampler:
+                created, elapsed, latencies = self.run_concurrently(reserve, users, options['threads'])
+            successes = sum(1 for response in created if response.status_code == 201)
+            self.report('Бронирование', len(users), successes, elapsed, latencies, sampler)
+            result = (len(users) / elapsed, sampler.average)
+
+            self.refresh_summary(book)
+            self.verify(successes == min(copies, clients),
+                        f'успешных бронирований {successes}, ожидалось {min(copies, clients)}')
+            self.verify(BookCopy.objects.filter(book=book, reservation__isnull=True).count() == copies - successes,
+                        'свободные экземпляры не сходятся с бронированиями')
+            self.verify(book.available_copies == copies - successes,
+                        f'available_copies={book.available_copies}, ожидалось {copies - successes}')
+            self.verify(Reservation.objects.filter(book=book).count() == successes,
+                        'лишние бронирования после отказов')
+
+            reservations = list(Reservation.objects.filter(book=book).select_related('user'))
+
+            def cancel(reservation):
+                request = factory.post(f'/api/reservations/{reservation.pk}/cancel/')
+                force_authenticate(request, user=reservation.user)
+                return cancel_view(request, pk=reservation.pk)
+
+            with LockSampler() as sampler:
+                cancelled, elapsed, latencies = self.run_concurrently(cancel, reservations, options['threads'])
+            self.report('Отмена', len(reservations),
+                        sum(1 for response in cancelled if response.status_code == 200),
+                        elapsed, latencies, sampler)
+            self.refresh_summary(book)
+            self.verify(book.available_copies == copies,
+                        f'после отмены available_copies={book.available_copies}, ожидалось {copies}')
+            self.verify(book.status == 'available', f'после отмены статус {book.status}')
+        finally:
+            if not options['keep']:
+                book.delete()
+                User.objects.filter(pk__in=[user.pk for user in users]).delete()
+        return result
+
+    def refresh_summary(self, book):
+        # Сводку книги пересчитывает фоновый поток; здесь - сразу и синхронно
+        counters.flush()
+        counters.refresh_books([book.pk])
+        book.refresh_from_db()
+
+    def run_concurrently(self, func, items, threads):
+        latencies = []
+
+        def timed(item):
+            started = time.perf_counter()
+            try:
+                return func(item)
+            finally:
+                latencies.append((time.perf_counter() - started) * 1000)
+                # Как и в обычном запросе Django (CONN_MAX_AGE=0), соединение закрывается
+                connection.close()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            results = list(pool.map(timed, items))
+        return results, time.perf_counter() - started, latencies
+
+    def report(self, title, total, succeeded, elapsed, latencies, sampler):
+        self.stdout.write(
+            f'{title}: запросов {total}, успешно {succeeded}, '
+            f'{total / elapsed:.0f} запр/с, '
+            f'p50 {statistics.median(latencies):.1f} мс, '
+            f'p95 {_percentile(latencies, 0.95):.1f} мс, '
+            f'max {max(latencies):.1f} мс; '
+            f'ждут блокировку: в среднем {sampler.average:.1f}, максимум {sampler.peak}'
+        )
+
+    def verify(self, condition, message):
+        if not condition:
+            raise CommandError(f'Нарушен инвариант: {message}')
+
+
+class LockSampler:
+    """
+    Раз в LOCK_SAMPLE_INTERVAL считает запросы к этой БД, ждущие
+    блокировку (pg_stat_activity.wait_event_type = 'Lock'), в отдельном
+    соединении.
+    """
+
+    def __init__(self):
+        self.samples = []
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop_event.set()
+        self.thread.join()
+
+    def _run(self):
+        connection = connections.create_connection('default')
+        try:
+            with connection.cursor() as cursor:
+                while not self.stop_event.wait(LOCK_SAMPLE_INTERVAL):
+                    cursor.execute(
+                        "SELECT count(*) FROM pg_stat_activity "
+                        "WHERE wait_event_type = 'Lock' AND datname = current_database()"
+                    )
+                    self.samples.append(cursor.fetchone()[0])
+        finally:
+            connection.close()
+
+    @property
+    def average(self):
+        return statistics.mean(self.samples) if self.samples else 0
+
+    @property
+    def peak(self):
+        return max(self.samples, default=0)
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:27
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0003_reservation_pickup_date_reservation_pickup_time'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='content_indexed_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Дата индексации содержимого PDF'),
+        ),
+        migrations.CreateModel(
+            name='BookPage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('page_number', models.PositiveIntegerField(verbose_name='Номер страницы')),
+                ('content', models.TextField(verbose_name='Текст страницы')),
+                ('search_vector', django.contrib.postgres.search.SearchVectorField(editable=False, null=True)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pages', to='books.book', verbose_name='Книга')),
+            ],
+            options={
+                'verbose_name': 'Страница книги',
+                'verbose_name_plural': 'Страницы книг',
+                'ordering': ['book', 'page_number'],
+                'indexes': [django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='books_page_search_gin')],
+                'constraints': [models.UniqueConstraint(fields=('book', 'page_number'), name='unique_book_page')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0005_bookupload'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='book',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Дата добавления'),
+        ),
+        migrations.AlterField(
+            model_name='reservation',
+            name='reservation_date',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Дата бронирования'),
+        ),
+    ]
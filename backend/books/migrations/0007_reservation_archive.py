@@ -0,0 +1,76 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:32
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Таблица секционируется по месяцам reservation_date (PARTITION BY RANGE).
+# Первичный ключ секционированной таблицы обязан включать ключ секционирования,
+# поэтому в БД он (id, reservation_date); id уникален, т.к. берётся из Reservation.
+# Секции создаёт books.archive.ensure_partitions перед переносом строк.
+CREATE_ARCHIVE_SQL = """
+CREATE TABLE "books_archivedreservation" (
+    "id" bigint NOT NULL,
+    "status" varchar(20) NOT NULL,
+    "reservation_date" timestamp with time zone NOT NULL,
+    "confirmed_date" timestamp with time zone NULL,
+    "taken_date" timestamp with time zone NULL,
+    "return_date" timestamp with time zone NULL,
+    "pickup_date" date NULL,
+    "pickup_time" time NULL,
+    "user_comment" text NULL,
+    "admin_comment" text NULL,
+    "archived_at" timestamp with time zone NOT NULL,
+    "book_id" bigint NOT NULL
+        REFERENCES "books_book" ("id") DEFERRABLE INITIALLY DEFERRED,
+    "user_id" bigint NOT NULL
+        REFERENCES "users_user" ("id") DEFERRABLE INITIALLY DEFERRED,
+    PRIMARY KEY ("id", "reservation_date")
+) PARTITION BY RANGE ("reservation_date");
+CREATE INDEX "books_archivedreservation_book_id_b5379d67" ON "books_archivedreservation" ("book_id");
+CREATE INDEX "books_archivedreservation_user_id_0495351d" ON "books_archivedreservation" ("user_id");
+CREATE INDEX "books_resarch_user_date_idx" ON "books_archivedreservation" ("user_id", "reservation_date" DESC);
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0006_admin_date_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(CREATE_ARCHIVE_SQL, 'DROP TABLE "books_archivedreservation" CASCADE;'),
+            ],
+            state_operations=[
+                migrations.CreateModel(
+                    name='ArchivedReservation',
+                    fields=[
+                        ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                        ('status', models.CharField(choices=[('pending', 'Ожидает подтверждения'), ('confirmed', 'Подтверждена'), ('taken', 'Книга выдана'), ('returned', 'Книга возвращена'), ('cancelled', 'Отменена')], max_length=20, verbose_name='Статус бронирования')),
+                        ('reservation_date', models.DateTimeField(verbose_name='Дата бронирования')),
+                        ('confirmed_date', models.DateTimeField(blank=True, null=True, verbose_name='Дата подтверждения')),
+                        ('taken_date', models.DateTimeField(blank=True, null=True, verbose_name='Дата выдачи')),
+                        ('return_date', models.DateTimeField(blank=True, null=True, verbose_name='Дата возврата')),
+                        ('pickup_date', models.DateField(blank=True, null=True, verbose_name='Планируемая дата получения')),
+                        ('pickup_time', models.TimeField(blank=True, null=True, verbose_name='Планируемое время получения')),
+                        ('user_comment', models.TextField(blank=True, null=True, verbose_name='Комментарий пользователя')),
+                        ('admin_comment', models.TextField(blank=True, null=True, verbose_name='Комментарий администратора')),
+                        ('archived_at', models.DateTimeField(verbose_name='Дата переноса в архив')),
+                        ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_reservations', to='books.book', verbose_name='Книга')),
+                        ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_reservations', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                    ],
+                    options={
+                        'verbose_name': 'Архивное бронирование',
+                        'verbose_name_plural': 'Архив бронирований',
+                        'ordering': ['-reservation_date'],
+                        'indexes': [models.Index(fields=['user', '-reservation_date'], name='books_resarch_user_date_idx')],
+                    },
+                ),
+            ],
+        ),
+    ]
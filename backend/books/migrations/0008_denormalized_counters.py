@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:36
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def _count(queryset, field):
+    counts = queryset.filter(**{field: OuterRef('pk')}).order_by().values(field).annotate(count=Count('pk'))
+    return Coalesce(Subquery(counts.values('count'), output_field=IntegerField()), Value(0))
+
+
+def fill_counters(apps, schema_editor):
+    Genre = apps.get_model('books', 'Genre')
+    Book = apps.get_model('books', 'Book')
+    Reservation = apps.get_model('books', 'Reservation')
+    ArchivedReservation = apps.get_model('books', 'ArchivedReservation')
+
+    Genre.objects.update(
+        books_count=_count(Book.objects.all(), 'genre'),
+        available_books_count=_count(Book.objects.filter(status='available'), 'genre'),
+    )
+    Book.objects.update(
+        reservations_count=_count(Reservation.objects.all(), 'book') + _count(ArchivedReservation.objects.all(), 'book'),
+        queue_length=_count(Reservation.objects.filter(status__in=('pending', 'confirmed')), 'book'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0007_reservation_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='queue_length',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Бронирований в очереди'),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='reservations_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Всего бронирований'),
+        ),
+        migrations.AddField(
+            model_name='genre',
+            name='available_books_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Свободных книг'),
+        ),
+        migrations.AddField(
+            model_name='genre',
+            name='books_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Всего книг'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
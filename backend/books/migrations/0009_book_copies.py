@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:38
+
+import django.core.validators
+from django.db import migrations, models
+
+
+def init_available_copies(apps, schema_editor):
+    # До этой миграции у каждой книги был один экземпляр
+    Book = apps.get_model('books', 'Book')
+    Book.objects.exclude(status='available').update(available_copies=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0008_denormalized_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='available_copies',
+            field=models.IntegerField(default=1, editable=False, verbose_name='Свободных экземпляров'),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='total_copies',
+            field=models.PositiveIntegerField(default=1, validators=[django.core.validators.MinValueValidator(1)], verbose_name='Всего экземпляров'),
+        ),
+        migrations.RunPython(init_available_copies, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='book',
+            constraint=models.CheckConstraint(condition=models.Q(('available_copies__gte', 0)), name='books_book_available_copies_gte_0'),
+        ),
+    ]
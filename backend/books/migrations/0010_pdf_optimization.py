@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0009_book_copies'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='pdf_optimized_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Дата оптимизации PDF'),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='pdf_original',
+            field=models.FileField(blank=True, editable=False, null=True, upload_to='pdfs/', verbose_name='Исходный PDF'),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='pdf_page_count',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Страниц в PDF'),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='pdf_sha256',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=64, verbose_name='SHA-256 исходного PDF'),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='pdf_size',
+            field=models.BigIntegerField(blank=True, editable=False, null=True, verbose_name='Размер PDF, байт'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:47
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0010_pdf_optimization'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReadingProgress',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('page', models.PositiveIntegerField(verbose_name='Текущая страница')),
+                ('total_pages', models.PositiveIntegerField(blank=True, null=True, verbose_name='Всего страниц')),
+                ('updated_at', models.DateTimeField(verbose_name='Дата обновления')),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reading_progress', to='books.book', verbose_name='Книга')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reading_progress', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Прогресс чтения',
+                'verbose_name_plural': 'Прогресс чтения',
+                'ordering': ['-updated_at'],
+                'constraints': [models.UniqueConstraint(fields=('user', 'book'), name='unique_reading_progress')],
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:56
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0011_reading_progress'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Notification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reservation_id', models.BigIntegerField(blank=True, null=True, verbose_name='Бронирование')),
+                ('kind', models.CharField(choices=[('reservation_confirmed', 'Бронирование подтверждено'), ('reservation_taken', 'Книга выдана'), ('pickup_reminder', 'Напоминание о получении')], max_length=30, verbose_name='Тип')),
+                ('channel', models.CharField(choices=[('email', 'Email'), ('push', 'Push')], max_length=10, verbose_name='Канал')),
+                ('address', models.CharField(blank=True, max_length=255, verbose_name='Адрес')),
+                ('subject', models.CharField(max_length=255, verbose_name='Заголовок')),
+                ('body', models.TextField(verbose_name='Текст')),
+                ('dedupe_key', models.CharField(max_length=255, unique=True, verbose_name='Ключ дедупликации')),
+                ('status', models.CharField(choices=[('pending', 'Ожидает отправки'), ('sent', 'Отправлено'), ('failed', 'Ошибка')], default='pending', max_length=10, verbose_name='Статус')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Попыток')),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Следующая попытка')),
+                ('last_error', models.TextField(blank=True, verbose_name='Последняя ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Дата создания')),
+                ('sent_at', models.DateTimeField(blank=True, null=True, verbose_name='Дата отправки')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Уведомление',
+                'verbose_name_plural': 'Уведомления',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(condition=models.Q(('status', 'pending')), fields=['next_attempt_at'], name='books_notif_pending_idx')],
+            },
+        ),
+    ]
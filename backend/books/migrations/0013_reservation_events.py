@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:04
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Журнал секционируется по месяцам created_at (PARTITION BY RANGE), как и
+# архив бронирований; первичный ключ включает ключ секционирования.
+# bigserial, а не IDENTITY: identity-столбцы секционированных таблиц
+# поддерживаются не во всех версиях PostgreSQL.
+# Секции создаёт books.events перед вставкой.
+CREATE_EVENTS_SQL = """
+CREATE TABLE "books_reservationevent" (
+    "id" bigserial NOT NULL,
+    "reservation_id" bigint NOT NULL,
+    "from_status" varchar(20) NOT NULL,
+    "to_status" varchar(20) NOT NULL,
+    "comment" text NOT NULL,
+    "created_at" timestamp with time zone NOT NULL,
+    "actor_id" bigint NULL,
+    PRIMARY KEY ("id", "created_at")
+) PARTITION BY RANGE ("created_at");
+CREATE INDEX "books_reservationevent_actor_id_a571b031" ON "books_reservationevent" ("actor_id");
+CREATE INDEX "books_resevent_res_idx" ON "books_reservationevent" ("reservation_id", "created_at");
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0012_notification_outbox'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(CREATE_EVENTS_SQL, 'DROP TABLE "books_reservationevent" CASCADE;'),
+            ],
+            state_operations=[
+                migrations.CreateModel(
+                    name='ReservationEvent',
+                    fields=[
+                        ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                        ('reservation_id', models.BigIntegerField(verbose_name='Бронирование')),
+                        ('from_status', models.CharField(blank=True, choices=[('pending', 'Ожидает подтверждения'), ('confirmed', 'Подтверждена'), ('taken', 'Книга выдана'), ('returned', 'Книга возвращена'), ('cancelled', 'Отменена')], max_length=20, verbose_name='Из статуса')),
+                        ('to_status', models.CharField(choices=[('pending', 'Ожидает подтверждения'), ('confirmed', 'Подтверждена'), ('taken', 'Книга выдана'), ('returned', 'Книга возвращена'), ('cancelled', 'Отменена')], max_length=20, verbose_name='В статус')),
+                        ('comment', models.TextField(blank=True, verbose_name='Комментарий')),
+                        ('created_at', models.DateTimeField(verbose_name='Время')),
+                        ('actor', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Кто изменил')),
+                    ],
+                    options={
+                        'verbose_name': 'Событие бронирования',
+                        'verbose_name_plural': 'Журнал бронирований',
+                        'ordering': ['-created_at'],
+                        'indexes': [models.Index(fields=['reservation_id', 'created_at'], name='books_resevent_res_idx')],
+                    },
+                ),
+            ],
+        ),
+    ]
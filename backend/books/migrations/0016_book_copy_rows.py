@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Экземпляры по total_copies каждой книги; активные бронирования занимают
+# их по порядку id (бронирования сверх total_copies остаются без экземпляра,
+# как и было со счётчиком)
+CREATE_COPIES = '''
+INSERT INTO books_bookcopy (book_id)
+SELECT b.id FROM books_book b CROSS JOIN LATERAL generate_series(1, b.total_copies);
+
+WITH holders AS (
+    SELECT id, book_id, row_number() OVER (PARTITION BY book_id ORDER BY id) AS n
+    FROM books_reservation WHERE status IN ('pending', 'confirmed', 'taken')
+), copies AS (
+    SELECT id, book_id, row_number() OVER (PARTITION BY book_id ORDER BY id) AS n
+    FROM books_bookcopy
+)
+UPDATE books_bookcopy SET reservation_id = holders.id
+FROM copies JOIN holders ON holders.book_id = copies.book_id AND holders.n = copies.n
+WHERE books_bookcopy.id = copies.id;
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0015_book_updated_at_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookCopy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='copies', to='books.book', verbose_name='Книга')),
+                ('reservation', models.OneToOneField(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='copy', to='books.reservation', verbose_name='Бронирование')),
+            ],
+            options={
+                'verbose_name': 'Экземпляр книги',
+                'verbose_name_plural': 'Экземпляры книг',
+                'indexes': [models.Index(condition=models.Q(('reservation__isnull', True)), fields=['book'], name='books_bookcopy_free_idx')],
+            },
+        ),
+        migrations.RunSQL(CREATE_COPIES, migrations.RunSQL.noop),
+    ]
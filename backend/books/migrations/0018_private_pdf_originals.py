@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:46
+
+import os
+
+from django.db import migrations, models
+
+
+def move_originals(apps, schema_editor):
+    # Исходные PDF лежали в раздаваемом pdfs/ - переносим в pdf_originals/
+    Book = apps.get_model('books', 'Book')
+    field = Book._meta.get_field('pdf_original')
+    storage = field.storage
+    names = (Book.objects.exclude(pdf_original='').exclude(pdf_original__isnull=True)
+             .exclude(pdf_original__startswith='pdf_originals/')
+             .values_list('pdf_original', flat=True).distinct())
+    for name in list(names):
+        if Book.objects.filter(pdf_file=name).exists() or not storage.exists(name):
+            # Неоптимизированный исходник - это и есть pdf_file; пропавший файл не переносим
+            Book.objects.filter(pdf_original=name).update(pdf_original=None)
+            continue
+        target = storage.get_available_name(field.generate_filename(None, os.path.basename(name)))
+        os.makedirs(os.path.dirname(storage.path(target)), exist_ok=True)
+        os.replace(storage.path(name), storage.path(target))
+        Book.objects.filter(pdf_original=name).update(pdf_original=target)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0017_genre_reservation_updated_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='book',
+            name='pdf_original',
+            field=models.FileField(blank=True, editable=False, null=True, upload_to='pdf_originals/', verbose_name='Исходный PDF'),
+        ),
+        migrations.RunPython(move_originals, migrations.RunPython.noop),
+    ]
@@ -1,10 +1,43 @@
-from django.db import models
+import os
+import uuid
+
+from django.db import models, transaction
 from django.conf import settings
+from django.core.validators import MinValueValidator
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.utils import timezone
+
+
+class CounterFieldsMixin:
+    """
+    Поля-счётчики меняются только через F() (books.counters), поэтому
+    обычный save() существующего объекта их не записывает: иначе значение,
+    прочитанное вместе с объектом, затёрло бы параллельные инкременты.
+    """
+    COUNTER_FIELDS = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.COUNTER_FIELDS
+                and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+
+
+class Genre(CounterFieldsMixin, models.Model):
+    COUNTER_FIELDS = ('books_count', 'available_books_count')
 
-class Genre(models.Model):
     name = models.CharField(max_length=100, unique=True, verbose_name='Название жанра')
     description = models.TextField(blank=True, null=True, verbose_name='Описание')
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True, verbose_name='Дата обновления')
+    books_count = models.IntegerField(default=0, editable=False, verbose_name='Всего книг')
+    available_books_count = models.IntegerField(default=0, editable=False, verbose_name='Свободных книг')
     
     class Meta:
         verbose_name = 'Жанр'
@@ -15,7 +48,9 @@ class Genre(models.Model):
         return self.name
 
 
-class Book(models.Model):
+class Book(CounterFieldsMixin, models.Model):
+    COUNTER_FIELDS = ('reservations_count', 'queue_length', 'available_copies')
+
     STATUS_CHOICES = (
         ('available', 'Свободна'),
         ('reserved', 'Забронирована'),
@@ -52,17 +87,140 @@ class Book(models.Model):
         default='available',
         verbose_name='Статус'
     )
-    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата добавления')
-    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата обновления')
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Дата добавления')
+    # Индекс - для инкрементального обновления подсказок и похожих книг
+    updated_at = models.DateTimeField(auto_now=True, db_index=True, verbose_name='Дата обновления')
+    content_indexed_at = models.DateTimeField(
+        blank=True,
+        null=True,
+        verbose_name='Дата индексации содержимого PDF'
+    )
+    # Заполняются после оптимизации PDF (books.pdf_pipeline). Исходный файл
+    # лежит в каталоге, который не раздаётся (PRIVATE_MEDIA_DIRS), и
+    # скачивается только из админки
+    pdf_original = models.FileField(
+        upload_to='pdf_originals/',
+        blank=True,
+        null=True,
+        editable=False,
+        verbose_name='Исходный PDF'
+    )
+    pdf_page_count = models.PositiveIntegerField(blank=True, null=True, editable=False, verbose_name='Страниц в PDF')
+    pdf_size = models.BigIntegerField(blank=True, null=True, editable=False, verbose_name='Размер PDF, байт')
+    pdf_sha256 = models.CharField(max_length=64, blank=True, db_index=True, editable=False,
+                                  verbose_name='SHA-256 исходного PDF')
+    pdf_optimized_at = models.DateTimeField(blank=True, null=True, editable=False,
+                                            verbose_name='Дата оптимизации PDF')
+    # Экземпляры: свободные меняются только через books.inventory
+    total_copies = models.PositiveIntegerField(
+        default=1,
+        validators=[MinValueValidator(1)],
+        verbose_name='Всего экземпляров'
+    )
+    available_copies = models.IntegerField(default=1, editable=False, verbose_name='Свободных экземпляров')
+    reservations_count = models.IntegerField(default=0, editable=False, verbose_name='Всего бронирований')
+    queue_length = models.IntegerField(default=0, editable=False, verbose_name='Бронирований в очереди')
     
     class Meta:
         verbose_name = 'Книга'
         verbose_name_plural = 'Книги'
         ordering = ['-created_at']
+        constraints = [
+            models.CheckConstraint(
+                condition=models.Q(available_copies__gte=0),
+                name='books_book_available_copies_gte_0'
+            ),
+        ]
     
     def __str__(self):
         return f"{self.title} - {self.author}"
 
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            # Экземпляры создаются свободными (books.inventory.book_created)
+            self.available_copies = self.total_copies
+        # Счётчики жанров обновляются сигналами в той же транзакции (books.signals)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+
+class BookPage(models.Model):
+    """Текст страницы PDF для полнотекстового поиска по содержимому книги"""
+    book = models.ForeignKey(
+        Book,
+        on_delete=models.CASCADE,
+        related_name='pages',
+        verbose_name='Книга'
+    )
+    page_number = models.PositiveIntegerField(verbose_name='Номер страницы')
+    content = models.TextField(verbose_name='Текст страницы')
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        verbose_name = 'Страница книги'
+        verbose_name_plural = 'Страницы книг'
+        ordering = ['book', 'page_number']
+        constraints = [
+            models.UniqueConstraint(fields=['book', 'page_number'], name='unique_book_page'),
+        ]
+        indexes = [
+            GinIndex(fields=['search_vector'], name='books_page_search_gin'),
+        ]
+
+    def __str__(self):
+        return f"{self.book_id}: стр. {self.page_number}"
+
+
+class BookUpload(models.Model):
+    """Возобновляемая загрузка файла книги по частям (PDF или обложка)"""
+    FIELD_CHOICES = (
+        ('pdf_file', 'PDF файл'),
+        ('cover_image', 'Обложка книги'),
+    )
+    STATUS_CHOICES = (
+        ('in_progress', 'Загружается'),
+        ('complete', 'Завершена'),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='book_uploads',
+        verbose_name='Пользователь'
+    )
+    book = models.ForeignKey(
+        Book,
+        on_delete=models.CASCADE,
+        related_name='uploads',
+        verbose_name='Книга'
+    )
+    field = models.CharField(max_length=20, choices=FIELD_CHOICES, verbose_name='Поле книги')
+    filename = models.CharField(max_length=255, verbose_name='Имя файла')
+    size = models.BigIntegerField(verbose_name='Размер файла')
+    offset = models.BigIntegerField(default=0, verbose_name='Загружено байт')
+    checksum = models.CharField(max_length=64, blank=True, verbose_name='SHA-256')
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default='in_progress',
+        verbose_name='Статус'
+    )
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата обновления')
+
+    class Meta:
+        verbose_name = 'Загрузка файла'
+        verbose_name_plural = 'Загрузки файлов'
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.size})"
+
+    @property
+    def temp_path(self):
+        return os.path.join(settings.RESUMABLE_UPLOAD_DIR, f'{self.pk}.part')
+
 
 class Reservation(models.Model):
     STATUS_CHOICES = (
@@ -72,6 +230,10 @@ class Reservation(models.Model):
         ('returned', 'Книга возвращена'),
         ('cancelled', 'Отменена'),
     )
+    # Бронирования, которые ещё занимают книгу
+    ACTIVE_STATUSES = ('pending', 'confirmed', 'taken')
+    # Бронирования, ожидающие выдачи (Book.queue_length)
+    QUEUE_STATUSES = ('pending', 'confirmed')
     
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL, 
@@ -91,10 +253,12 @@ class Reservation(models.Model):
         default='pending',
         verbose_name='Статус бронирования'
     )
-    reservation_date = models.DateTimeField(auto_now_add=True, verbose_name='Дата бронирования')
+    reservation_date = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Дата бронирования')
     confirmed_date = models.DateTimeField(blank=True, null=True, verbose_name='Дата подтверждения')
     taken_date = models.DateTimeField(blank=True, null=True, verbose_name='Дата выдачи')
     return_date = models.DateTimeField(blank=True, null=True, verbose_name='Дата возврата')
+    # Любое изменение, включая отмену (инкрементальная выгрузка books.backup)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True, verbose_name='Дата обновления')
 
     # Планируемая дата и время получения книги
     pickup_date = models.DateField(blank=True, null=True, verbose_name='Планируемая дата получения')
@@ -109,4 +273,290 @@ class Reservation(models.Model):
         ordering = ['-reservation_date']
     
     def __str__(self):
-        return f"{self.user.username} - {self.book.title} ({self.get_status_display()})"
\ No newline at end of file
+        return f"{self.user.username} - {self.book.title} ({self.get_status_display()})"
+
+class BookCopy(models.Model):
+    """
+    Экземпляр книги. Бронирование занимает свободный экземпляр
+    (books.inventory): строки экземпляров блокируются по отдельности,
+    поэтому бронирования одной популярной книги не ждут друг друга.
+    Book.available_copies и Book.status - сводка по этим строкам.
+    """
+    book = models.ForeignKey(
+        Book,
+        on_delete=models.CASCADE,
+        related_name='copies',
+        verbose_name='Книга'
+    )
+    # Без ограничения в БД: архив удаляет завершённые бронирования напрямую
+    # SQL, а экземпляр к этому моменту уже свободен (или его освободит
+    # inventory.sync_copies)
+    reservation = models.OneToOneField(
+        Reservation,
+        on_delete=models.SET_NULL,
+        db_constraint=False,
+        null=True,
+        blank=True,
+        related_name='copy',
+        verbose_name='Бронирование'
+    )
+
+    class Meta:
+        verbose_name = 'Экземпляр книги'
+        verbose_name_plural = 'Экземпляры книг'
+        indexes = [
+            # Поиск свободного экземпляра книги
+            models.Index(fields=['book'], condition=models.Q(reservation__isnull=True),
+                         name='books_bookcopy_free_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.book_id} #{self.pk}"
+
+
+class ArchivedReservation(models.Model):
+    """
+    Архив завершённых бронирований (возвращённые и отменённые).
+    В PostgreSQL таблица секционирована по месяцам reservation_date,
+    строки переносит books.archive.archive_reservations.
+    """
+    # id переносится из Reservation без изменений
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='archived_reservations',
+        verbose_name='Пользователь'
+    )
+    book = models.ForeignKey(
+        Book,
+        on_delete=models.CASCADE,
+        related_name='archived_reservations',
+        verbose_name='Книга'
+    )
+    status = models.CharField(
+        max_length=20,
+        choices=Reservation.STATUS_CHOICES,
+        verbose_name='Статус бронирования'
+    )
+    reservation_date = models.DateTimeField(verbose_name='Дата бронирования')
+    confirmed_date = models.DateTimeField(blank=True, null=True, verbose_name='Дата подтверждения')
+    taken_date = models.DateTimeField(blank=True, null=True, verbose_name='Дата выдачи')
+    return_date = models.DateTimeField(blank=True, null=True, verbose_name='Дата возврата')
+    pickup_date = models.DateField(blank=True, null=True, verbose_name='Планируемая дата получения')
+    pickup_time = models.TimeField(blank=True, null=True, verbose_name='Планируемое время получения')
+    user_comment = models.TextField(blank=True, null=True, verbose_name='Комментарий пользователя')
+    admin_comment = models.TextField(blank=True, null=True, verbose_name='Комментарий администратора')
+    archived_at = models.DateTimeField(verbose_name='Дата переноса в архив')
+
+    class Meta:
+        verbose_name = 'Архивное бронирование'
+        verbose_name_plural = 'Архив бронирований'
+        ordering = ['-reservation_date']
+        indexes = [
+            models.Index(fields=['user', '-reservation_date'], name='books_resarch_user_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.book.title} ({self.get_status_display()})"
+
+    def as_reservation(self):
+        """
+        Несохраняемый экземпляр Reservation с теми же данными, чтобы архивные
+        строки отдавались тем же ReservationSerializer. Отложенные (.only)
+        поля не копируются, уже загруженные user/book переносятся.
+        """
+        deferred = self.get_deferred_fields()
+        # updated_at в архиве не хранится: после переноса строка не меняется
+        archived = {field.attname for field in self._meta.concrete_fields}
+        reservation = Reservation(**{
+            field.attname: getattr(self, field.attname)
+            for field in Reservation._meta.concrete_fields
+            if field.attname in archived and field.attname not in deferred
+        })
+        reservation._state.adding = False
+        reservation._state.db = self._state.db
+        reservation._state.fields_cache.update(self._state.fields_cache)
+        return reservation
+
+
+class ReadingProgress(models.Model):
+    """
+    Позиция чтения книги пользователем. Частые обновления копит
+    books.progress и записывает пачками, поэтому updated_at - время
+    последнего обновления у клиента, а не момент записи в БД.
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='reading_progress',
+        verbose_name='Пользователь'
+    )
+    book = models.ForeignKey(
+        Book,
+        on_delete=models.CASCADE,
+        related_name='reading_progress',
+        verbose_name='Книга'
+    )
+    page = models.PositiveIntegerField(verbose_name='Текущая страница')
+    total_pages = models.PositiveIntegerField(blank=True, null=True, verbose_name='Всего страниц')
+    updated_at = models.DateTimeField(verbose_name='Дата обновления')
+
+    class Meta:
+        verbose_name = 'Прогресс чтения'
+        verbose_name_plural = 'Прогресс чтения'
+        ordering = ['-updated_at']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'book'], name='unique_reading_progress'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} - {self.book_id}: стр. {self.page}"
+
+
+class Notification(models.Model):
+    """
+    Исходящее уведомление (outbox). Строка пишется в той же транзакции,
+    что и переход бронирования, отправляет её books.notifications
+    (команда send_notifications). dedupe_key не даёт поставить одно
+    и то же уведомление дважды.
+    """
+    KIND_CHOICES = (
+        ('reservation_confirmed', 'Бронирование подтверждено'),
+        ('reservation_taken', 'Книга выдана'),
+        ('pickup_reminder', 'Напоминание о получении'),
+    )
+    CHANNEL_CHOICES = (
+        ('email', 'Email'),
+        ('push', 'Push'),
+    )
+    STATUS_CHOICES = (
+        ('pending', 'Ожидает отправки'),
+        ('sent', 'Отправлено'),
+        ('failed', 'Ошибка'),
+    )
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='notifications',
+        verbose_name='Пользователь'
+    )
+    # Не внешний ключ: бронирование может уйти в архив раньше отправки
+    reservation_id = models.BigIntegerField(blank=True, null=True, verbose_name='Бронирование')
+    kind = models.CharField(max_length=30, choices=KIND_CHOICES, verbose_name='Тип')
+    channel = models.CharField(max_length=10, choices=CHANNEL_CHOICES, verbose_name='Канал')
+    address = models.CharField(max_length=255, blank=True, verbose_name='Адрес')
+    subject = models.CharField(max_length=255, verbose_name='Заголовок')
+    body = models.TextField(verbose_name='Текст')
+    dedupe_key = models.CharField(max_length=255, unique=True, verbose_name='Ключ дедупликации')
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default='pending',
+        verbose_name='Статус'
+    )
+    attempts = models.PositiveIntegerField(default=0, verbose_name='Попыток')
+    next_attempt_at = models.DateTimeField(default=timezone.now, verbose_name='Следующая попытка')
+    last_error = models.TextField(blank=True, verbose_name='Последняя ошибка')
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Дата создания')
+    sent_at = models.DateTimeField(blank=True, null=True, verbose_name='Дата отправки')
+
+    class Meta:
+        verbose_name = 'Уведомление'
+        verbose_name_plural = 'Уведомления'
+        ordering = ['-created_at']
+        indexes = [
+            # Очередь отправки: только ожидающие, по времени попытки
+            models.Index(
+                fields=['next_attempt_at'],
+                name='books_notif_pending_idx',
+                condition=models.Q(status='pending'),
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} → {self.user_id} ({self.channel}, {self.get_status_display()})"
+
+
+class ReservationEvent(models.Model):
+    """
+    Журнал переходов бронирования (только добавление): кто, из какого
+    статуса в какой, когда и с каким комментарием. Пишет books.events
+    пачками после коммита перехода. В PostgreSQL таблица секционирована
+    по месяцам created_at, секции создаются перед вставкой.
+    """
+    id = models.BigAutoField(primary_key=True)
+    # Не внешний ключ: бронирование уходит в архив, а история остаётся
+    reservation_id = models.BigIntegerField(verbose_name='Бронирование')
+    actor = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        blank=True,
+        null=True,
+        related_name='+',
+        verbose_name='Кто изменил'
+    )
+    from_status = models.CharField(
+        max_length=20,
+        choices=Reservation.STATUS_CHOICES,
+        blank=True,
+        verbose_name='Из статуса'
+    )
+    to_status = models.CharField(
+        max_length=20,
+        choices=Reservation.STATUS_CHOICES,
+        verbose_name='В статус'
+    )
+    comment = models.TextField(blank=True, verbose_name='Комментарий')
+    created_at = models.DateTimeField(verbose_name='Время')
+
+    class Meta:
+        verbose_name = 'Событие бронирования'
+        verbose_name_plural = 'Журнал бронирований'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['reservation_id', 'created_at'], name='books_resevent_res_idx'),
+        ]
+
+    def __str__(self):
+        return f"#{self.reservation_id}: {self.from_status or '—'} → {self.to_status}"
+
+
+class BookSimilarity(models.Model):
+    """
+    Похожие по содержанию книги (TF-IDF по названию, автору и описанию):
+    top-K соседей каждой книги, rank - место в списке с 1. Пересчитывает
+    books.similarity (команда build_similarity).
+    """
+    # Отдельный индекс не нужен: его заменяет уникальный (book, rank)
+    book = models.ForeignKey(
+        Book,
+        on_delete=models.CASCADE,
+        db_index=False,
+        related_name='similar_entries',
+        verbose_name='Книга'
+    )
+    # Без ограничения в БД: ссылки на удалённые книги нужны пересчёту,
+    # чтобы найти затронутые списки; в ответ они не попадают (JOIN)
+    similar = models.ForeignKey(
+        Book,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='similar_to',
+        verbose_name='Похожая книга'
+    )
+    rank = models.PositiveSmallIntegerField(verbose_name='Место')
+    score = models.FloatField(verbose_name='Сходство')
+
+    class Meta:
+        verbose_name = 'Похожая книга'
+        verbose_name_plural = 'Похожие книги'
+        ordering = ['book', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['book', 'rank'], name='unique_book_similarity_rank'),
+        ]
+
+    def __str__(self):
+        return f"{self.book_id} → {self.similar_id} ({self.score:.3f})"
@@ -0,0 +1,284 @@
+"""
+Уведомления о бронированиях через outbox.
+
+Переходы бронирования (подтверждение, выдача) ставят строки Notification
+в той же транзакции, что и сам переход: откатится переход - не будет и
+уведомления, закоммитится - оно обязательно уйдёт. Напоминания о получении
+ставит schedule_pickup_reminders. Текст формируется при постановке, поэтому
+отправке не нужны JOIN'ы. Повторная постановка того же уведомления
+отбрасывается уникальным dedupe_key.
+
+Отправитель (dispatch_batch, команда send_notifications):
+  1. забирает пачку ожидающих строк одним UPDATE ... FOR UPDATE SKIP LOCKED
+     и сдвигает им next_attempt_at на NOTIFICATION_LEASE: параллельные
+     отправители не берут одно и то же, а строки упавшего вернутся в очередь;
+  2. отправляет пачку параллельно в пуле потоков через транспорт канала;
+  3. отмечает отправленные одним UPDATE, неудачные - с экспоненциальной
+     задержкой и разбросом, после NOTIFICATION_MAX_ATTEMPTS - 'failed'.
+Доставка "хотя бы один раз": упав между отправкой и отметкой, отправитель
+повторит уведомление.
+
+Транспорты задаются в NOTIFICATION_TRANSPORTS (канал -> класс):
+EmailTransport - почтовый бэкенд Django (SMTP, для разработки - локальный
+отладочный SMTP-сервер), PushGatewayTransport - HTTP-шлюз push-уведомлений.
+"""
+import datetime
+import json
+import logging
+import random
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Notification, Reservation
+
+logger = logging.getLogger(__name__)
+
+TEMPLATES = {
+    'reservation_confirmed': (
+        'Бронирование подтверждено',
+        'Книга «{title}» ждёт вас {pickup}.',
+    ),
+    'reservation_taken': (
+        'Книга выдана',
+        'Вы получили книгу «{title}». Приятного чтения!',
+    ),
+    'pickup_reminder': (
+        'Напоминание о получении книги',
+        'Не забудьте забрать книгу «{title}» {pickup}.',
+    ),
+}
+
+RESERVATION_FIELDS = ('pk', 'user_id', 'user__email', 'book__title', 'pickup_date', 'pickup_time')
+ENQUEUE_BATCH_SIZE = 1000
+
+
+# ==================== ПОСТАНОВКА ====================
+
+def _pickup_text(pickup_date, pickup_time):
+    if pickup_date is None:
+        return 'в библиотеке'
+    text = pickup_date.strftime('%d.%m.%Y')
+    if pickup_time is not None:
+        text += pickup_time.strftime(' в %H:%M')
+    return text
+
+
+def _build(kind, row):
+    pk, user_id, email, title, pickup_date, pickup_time = row
+    subject, body = TEMPLATES[kind]
+    body = body.format(title=title, pickup=_pickup_text(pickup_date, pickup_time))
+    key = f'{kind}:{pk}'
+    if kind == 'pickup_reminder':
+        # Перенесли дату получения - нужно новое напоминание
+        key += f':{pickup_date}'
+
+    for channel in settings.NOTIFICATION_TRANSPORTS:
+        address = email if channel == 'email' else str(user_id)
+        if not address:
+            continue
+        yield Notification(
+            user_id=user_id, reservation_id=pk, kind=kind, channel=channel,
+            address=address, subject=subject, body=body,
+            dedupe_key=f'{key}:{channel}',
+        )
+
+
+def _enqueue_rows(kind, rows):
+    batch, total = [], 0
+    for row in rows:
+        batch.extend(_build(kind, row))
+        if len(batch) >= ENQUEUE_BATCH_SIZE:
+            Notification.objects.bulk_create(batch, ignore_conflicts=True)
+            total += len(batch)
+            batch = []
+    if batch:
+        Notification.objects.bulk_create(batch, ignore_conflicts=True)
+        total += len(batch)
+    return total
+
+
+def enqueue(kind, reservation_ids):
+    """
+    Ставит уведомления kind по бронированиям. Вызывать внутри транзакции
+    перехода. Возвращает число строк (включая отброшенные как дубликаты).
+    """
+    rows = Reservation.objects.filter(pk__in=reservation_ids).values_list(*RESERVATION_FIELDS)
+    return _enqueue_rows(kind, rows)
+
+
+def schedule_pickup_reminders(today=None):
+    """Напоминания по подтверждённым бронированиям, которые пора забрать."""
+    today = today or timezone.localdate()
+    target = today + datetime.timedelta(days=settings.PICKUP_REMINDER_DAYS_BEFORE)
+    rows = (
+        Reservation.objects.filter(status='confirmed', pickup_date=target)
+        .values_list(*RESERVATION_FIELDS)
+        .iterator(chunk_size=ENQUEUE_BATCH_SIZE)
+    )
+    return _enqueue_rows('pickup_reminder', rows)
+
+
+# ==================== ТРАНСПОРТЫ ====================
+
+class Transport:
+    """Отправляет одно уведомление; исключение означает неудачную попытку."""
+
+    def send(self, notification):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class EmailTransport(Transport):
+    """
+    Письмо через почтовый бэкенд Django. У каждого потока пула своё
+    SMTP-соединение на всю пачку, а не новое на каждое письмо.
+    """
+
+    def __init__(self):
+        self.local = threading.local()
+        self.connections = []
+        self.lock = threading.Lock()
+
+    def _connection(self):
+        mail_connection = getattr(self.local, 'connection', None)
+        if mail_connection is None:
+            mail_connection = get_connection()
+            mail_connection.open()
+            self.local.connection = mail_connection
+            with self.lock:
+                self.connections.append(mail_connection)
+        return mail_connection
+
+    def send(self, notification):
+        mail_connection = self._connection()
+        try:
+            EmailMessage(
+                notification.subject, notification.body,
+                settings.DEFAULT_FROM_EMAIL, [notification.address],
+                connection=mail_connection,
+            ).send()
+        except Exception:
+            # Соединение могло оборваться: следующее письмо откроет новое
+            self.local.connection = None
+            raise
+
+    def close(self):
+        for mail_connection in self.connections:
+            try:
+                mail_connection.close()
+            except Exception:
+                pass
+
+
+class PushGatewayTransport(Transport):
+    """
+    Push через внешний шлюз: POST PUSH_GATEWAY_URL с JSON
+    {user_id, title, body, data}. Устройства пользователя знает шлюз.
+    """
+
+    def send(self, notification):
+        payload = {
+            'user_id': notification.user_id,
+            'title': notification.subject,
+            'body': notification.body,
+            'data': {'kind': notification.kind, 'reservation_id': notification.reservation_id},
+        }
+        headers = {'Content-Type': 'application/json'}
+        if settings.PUSH_GATEWAY_TOKEN:
+            headers['Authorization'] = f'Bearer {settings.PUSH_GATEWAY_TOKEN}'
+        request = urllib.request.Request(
+            settings.PUSH_GATEWAY_URL, data=json.dumps(payload).encode(),
+            headers=headers, method='POST',
+        )
+        with urllib.request.urlopen(request, timeout=10) as response:
+            response.read()
+
+
+# ==================== ОТПРАВКА ====================
+
+def _claim(batch_size):
+    now = timezone.now()
+    table = connection.ops.quote_name(Notification._meta.db_table)
+    return list(Notification.objects.raw(
+        f'''
+        UPDATE {table}
+        SET attempts = attempts + 1, next_attempt_at = %s
+        WHERE id IN (
+            SELECT id FROM {table}
+            WHERE status = 'pending' AND next_attempt_at <= %s
+            ORDER BY next_attempt_at
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING *
+        ''',
+        [now + datetime.timedelta(seconds=settings.NOTIFICATION_LEASE), now, batch_size]
+    ))
+
+
+def retry_delay(attempts):
+    """Экспоненциальная задержка со случайным разбросом ±50%."""
+    delay = min(settings.NOTIFICATION_RETRY_BASE * 2 ** (attempts - 1), settings.NOTIFICATION_RETRY_MAX)
+    return datetime.timedelta(seconds=delay * random.uniform(0.5, 1.5))
+
+
+def dispatch_batch(batch_size=500, workers=16):
+    """
+    Отправляет одну пачку из очереди.
+    Возвращает (взято, отправлено, ошибок).
+    """
+    notifications = _claim(batch_size)
+    if not notifications:
+        return 0, 0, 0
+
+    transports = {
+        channel: import_string(path)()
+        for channel, path in settings.NOTIFICATION_TRANSPORTS.items()
+    }
+
+    def send(notification):
+        transport = transports.get(notification.channel)
+        if transport is None:
+            return f'Канал {notification.channel} не настроен'
+        try:
+            transport.send(notification)
+        except Exception as exc:
+            return f'{type(exc).__name__}: {exc}'
+        return None
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            errors = list(pool.map(send, notifications))
+    finally:
+        for transport in transports.values():
+            transport.close()
+
+    now = timezone.now()
+    sent = [n.pk for n, error in zip(notifications, errors) if error is None]
+    failed = []
+    for notification, error in zip(notifications, errors):
+        if error is None:
+            continue
+        notification.last_error = error[:1000]
+        if notification.attempts >= settings.NOTIFICATION_MAX_ATTEMPTS:
+            notification.status = 'failed'
+        else:
+            notification.next_attempt_at = now + retry_delay(notification.attempts)
+        failed.append(notification)
+        logger.warning('Уведомление %s не отправлено (попытка %s): %s',
+                       notification.pk, notification.attempts, error)
+
+    if sent:
+        Notification.objects.filter(pk__in=sent).update(status='sent', sent_at=now, last_error='')
+    if failed:
+        Notification.objects.bulk_update(failed, ['status', 'next_attempt_at', 'last_error'])
+    return len(notifications), len(sent), len(failed)
@@ -0,0 +1,161 @@
+"""
+Обработка PDF после загрузки: оптимизация в пуле процессов (books.workers,
+books.pdf_tools.optimize_pdf), затем индексация текста.
+
+Оптимизированный файл сохраняется рядом с исходным (<имя>_opt.pdf) и
+становится Book.pdf_file; исходный переносится в pdf_originals/ (Book.pdf_original).
+Этот каталог library_api.files не раздаёт (PRIVATE_MEDIA_DIRS): исходник
+скачивается только из админки. Повторно загруженный файл (тот же SHA-256,
+что у уже обработанной книги) не хранится дважды: книга ссылается на файлы
+первой копии.
+"""
+import logging
+import os
+import shutil
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .cache import bump_catalog_version
+from .content_index import schedule_book_indexing
+from .models import Book
+from .pdf_tools import optimize_pdf
+from . import workers
+
+logger = logging.getLogger(__name__)
+
+PDF_METADATA_RESET = {
+    'pdf_original': None,
+    'pdf_page_count': None,
+    'pdf_size': None,
+    'pdf_sha256': '',
+    'pdf_optimized_at': None,
+    # Страницы прежнего файла неактуальны: книга снова попадёт в index_book_content
+    'content_indexed_at': None,
+}
+
+
+def _storage():
+    return Book._meta.get_field('pdf_file').storage
+
+
+def optimized_name(name):
+    stem, ext = os.path.splitext(name)
+    return _storage().get_available_name(f'{stem}_opt{ext or ".pdf"}')
+
+
+def _free_name(field_name, name):
+    field = Book._meta.get_field(field_name)
+    return field.storage.get_available_name(field.generate_filename(None, os.path.basename(name)))
+
+
+def _relocate(name, target, exclude_pk):
+    """Переносит файл name в target; если на него ссылаются другие книги - копирует."""
+    storage = _storage()
+    os.makedirs(os.path.dirname(storage.path(target)), exist_ok=True)
+    if is_referenced(name, exclude_pk):
+        shutil.copyfile(storage.path(name), storage.path(target))
+    else:
+        os.replace(storage.path(name), storage.path(target))
+
+
+def optimize_args(source):
+    """Аргументы optimize_pdf для файла source; путь результата выбирается свободным."""
+    storage = _storage()
+    target = optimized_name(source)
+    return (storage.path(source), storage.path(target), settings.PDF_IMAGE_DPI,
+            settings.PDF_JPEG_QUALITY), target
+
+
+def is_referenced(name, exclude_pk):
+    return Book.objects.filter(Q(pdf_file=name) | Q(pdf_original=name)).exclude(pk=exclude_pk).exists()
+
+
+def restore_original(book_id, original):
+    """
+    Перед повторной оптимизацией возвращает исходный PDF из закрытого
+    каталога в pdf_file книги. Возвращает новое имя файла.
+    """
+    name = _free_name('pdf_file', original)
+    with transaction.atomic():
+        Book.objects.filter(pk=book_id).update(pdf_file=name, pdf_original=None)
+        _relocate(original, name, book_id)
+    return name
+
+
+def store_result(book_id, source, target, result):
+    """
+    Записывает результат оптимизации, если у книги всё ещё тот же PDF.
+    Возвращает обновлённую книгу или None.
+    """
+    storage = _storage()
+    duplicate = (
+        Book.objects.filter(pdf_sha256=result['sha256'], pdf_optimized_at__isnull=False)
+        .exclude(pk=book_id)
+        .exclude(pdf_file='')
+        .values('pdf_file', 'pdf_original', 'pdf_page_count', 'pdf_size')
+        .first()
+    )
+
+    updates = {
+        'pdf_page_count': result['pages'],
+        'pdf_size': result['size'],
+        'pdf_sha256': result['sha256'],
+        'pdf_optimized_at': timezone.now(),
+        'pdf_original': None,
+    }
+    if duplicate is not None:
+        updates.update(duplicate)
+    elif result['optimized']:
+        updates['pdf_file'] = target
+        updates['pdf_original'] = _free_name('pdf_original', source)
+
+    with transaction.atomic():
+        updated = Book.objects.filter(pk=book_id, pdf_file=source).update(**updates)
+        if updated and updates['pdf_original'] and duplicate is None:
+            # Исходник больше не pdf_file - убираем его из раздаваемого media
+            _relocate(source, updates['pdf_original'], book_id)
+
+    if not updated or duplicate is not None:
+        # Результат не нужен: PDF успели заменить или такой файл уже есть
+        if result['optimized'] and storage.exists(target):
+            storage.delete(target)
+    if not updated:
+        return None
+
+    if duplicate is not None and not is_referenced(source, book_id):
+        storage.delete(source)
+
+    bump_catalog_version()
+    logger.info('PDF книги %s: %s -> %s байт, страниц %s%s', book_id, result['original_size'],
+                updates['pdf_size'], updates['pdf_page_count'],
+                ' (дубликат)' if duplicate is not None else '')
+    return Book.objects.get(pk=book_id)
+
+
+def schedule_pdf_processing(book):
+    """
+    Ставит оптимизацию и затем индексацию PDF книги в пул процессов
+    после коммита транзакции, в которой был загружен файл.
+    """
+    Book.objects.filter(pk=book.pk).update(**PDF_METADATA_RESET)
+    if not book.pdf_file:
+        schedule_book_indexing(book)
+        return
+
+    book_id = book.pk
+    source = book.pdf_file.name
+
+    def submit():
+        args, target = optimize_args(source)
+
+        def on_done(result):
+            processed = store_result(book_id, source, target, result)
+            if processed is not None:
+                schedule_book_indexing(processed)
+
+        workers.submit(optimize_pdf, *args, on_done=on_done)
+
+    transaction.on_commit(submit)
@@ -0,0 +1,153 @@
+"""
+Обработка PDF-файлов в отдельных процессах.
+
+Модуль не импортирует Django: функции отсюда выполняются в пуле
+процессов (см. books.workers) и должны импортироваться без настройки
+приложения.
+"""
+import hashlib
+import os
+import shutil
+import subprocess
+
+try:
+    import pypdf
+except ImportError:  # pypdf необязателен, без него индекс содержимого не строится
+    pypdf = None
+
+try:
+    import pikepdf
+except ImportError:  # pikepdf необязателен, без него линеаризация через qpdf (если установлен)
+    pikepdf = None
+
+try:
+    from PIL import Image
+except ImportError:  # без Pillow изображения не пережимаются
+    Image = None
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def extract_pages(path):
+    """
+    Текст каждой страницы PDF: [(номер страницы с 1, текст), ...].
+    Страницы без текста (сканы) пропускаются.
+    """
+    if pypdf is None:
+        raise RuntimeError('Для извлечения текста из PDF установите пакет pypdf')
+
+    reader = pypdf.PdfReader(path)
+    pages = []
+    for number, page in enumerate(reader.pages, start=1):
+        try:
+            text = page.extract_text() or ''
+        except Exception:  # битая страница не должна ронять весь файл
+            continue
+        # PostgreSQL не принимает NUL в текстовых полях
+        text = ' '.join(text.replace('\x00', ' ').split())
+        if text:
+            pages.append((number, text))
+    return pages
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _downsample_images(page, image_dpi, jpeg_quality):
+    """
+    Пережимает изображения страницы, чьё разрешение при растягивании на всю
+    ширину страницы выше image_dpi. Реальный размер вывода не вычисляется,
+    поэтому оценка консервативная: картинка не станет хуже image_dpi.
+    """
+    page_width_inches = float(page.mediabox.width) / 72
+    if page_width_inches <= 0:
+        return 0
+    max_width = int(page_width_inches * image_dpi)
+
+    replaced = 0
+    for image_file in page.images:
+        try:
+            image = image_file.image
+            if image is None or image.width <= max_width or image.mode not in ('RGB', 'L', 'CMYK'):
+                continue
+            height = max(1, round(image.height * max_width / image.width))
+            image_file.replace(image.resize((max_width, height), Image.LANCZOS), quality=jpeg_quality)
+            replaced += 1
+        except Exception:  # нестандартное изображение оставляем как есть
+            continue
+    return replaced
+
+
+def _linearize(src, dst):
+    """Линеаризация ("быстрый веб-просмотр"): pikepdf, иначе утилита qpdf."""
+    if pikepdf is not None:
+        with pikepdf.open(src) as pdf:
+            pdf.save(dst, linearize=True, compress_streams=True,
+                     object_stream_mode=pikepdf.ObjectStreamMode.generate)
+        return True
+    qpdf = shutil.which('qpdf')
+    if qpdf:
+        # Код 3 - предупреждения, файл при этом записан
+        result = subprocess.run([qpdf, '--linearize', '--object-streams=generate', src, dst],
+                                capture_output=True)
+        return result.returncode in (0, 3) and os.path.exists(dst)
+    return False
+
+
+def optimize_pdf(src, dst, image_dpi=None, jpeg_quality=75):
+    """
+    Оптимизирует PDF src в dst: сжатие потоков страниц, удаление одинаковых
+    объектов, по желанию пережатие изображений до image_dpi и линеаризация.
+    Если результат не меньше исходного и не линеаризован, dst не создаётся.
+
+    Возвращает {'sha256', 'pages', 'original_size', 'size', 'linearized',
+    'images', 'optimized'}; sha256 - исходного файла, для поиска дубликатов.
+    """
+    if pypdf is None:
+        raise RuntimeError('Для оптимизации PDF установите пакет pypdf')
+
+    sha256 = file_sha256(src)
+    original_size = os.path.getsize(src)
+    writer = pypdf.PdfWriter(clone_from=src)
+    images = 0
+    for page in writer.pages:
+        if image_dpi and Image is not None:
+            images += _downsample_images(page, image_dpi, jpeg_quality)
+        page.compress_content_streams(level=9)
+    writer.compress_identical_objects(remove_identicals=True, remove_orphans=True)
+    pages = len(writer.pages)
+
+    tmp = dst + '.tmp'
+    with open(tmp, 'wb') as f:
+        writer.write(f)
+
+    linearized = False
+    try:
+        linearized = _linearize(tmp, dst)
+    except Exception:  # без линеаризации файл всё равно полезен
+        linearized = False
+    if linearized:
+        os.remove(tmp)
+    else:
+        os.replace(tmp, dst)
+
+    size = os.path.getsize(dst)
+    optimized = linearized or size < original_size
+    if not optimized:
+        os.remove(dst)
+        size = original_size
+
+    return {
+        'sha256': sha256,
+        'pages': pages,
+        'original_size': original_size,
+        'size': size,
+        'linearized': linearized,
+        'images': images,
+        'optimized': optimized,
+    }
@@ -0,0 +1,104 @@
+"""
+Прогресс чтения с отложенной записью.
+
+Клиент отправляет позицию при каждом перелистывании, поэтому запрос
+не пишет в БД: последнее значение для (user_id, book_id) кладётся в буфер
+процесса, а фоновый поток раз в READING_PROGRESS_FLUSH_INTERVAL секунд
+записывает весь буфер одним INSERT ... ON CONFLICT DO UPDATE (поток -
+books.workers.BufferedWriter).
+
+Чтение объединяет буфер с сохранённым значением. У каждого процесса свой
+буфер, поэтому в БД побеждает более позднее updated_at, а не порядок
+записи. При аварийном завершении теряются обновления за последний интервал.
+"""
+import threading
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.utils import timezone
+
+from .models import Book, ReadingProgress
+from .workers import BufferedWriter
+
+_buffer = {}
+_lock = threading.Lock()
+
+# Позиций в одном INSERT
+FLUSH_BATCH_SIZE = 1000
+
+
+def record_progress(user_id, book_id, page, total_pages=None):
+    """Запоминает позицию чтения; в БД она попадёт при следующем сбросе буфера."""
+    progress = ReadingProgress(
+        user_id=user_id, book_id=book_id, page=page,
+        total_pages=total_pages, updated_at=timezone.now(),
+    )
+    with _lock:
+        _buffer[user_id, book_id] = progress
+    _writer.start()
+    return progress
+
+
+def get_progress(user_id, book_id):
+    """
+    Более поздняя из позиций в буфере процесса и в БД (её мог записать
+    другой процесс); None - книгу ещё не открывали.
+    """
+    with _lock:
+        pending = _buffer.get((user_id, book_id))
+    stored = ReadingProgress.objects.filter(user_id=user_id, book_id=book_id).first()
+    if pending is None or (stored is not None and stored.updated_at >= pending.updated_at):
+        return stored
+    return pending
+
+
+def flush():
+    """Записывает буфер в БД. Возвращает число отправленных позиций."""
+    global _buffer
+    with _lock:
+        batch, _buffer = _buffer, {}
+    if not batch:
+        return 0
+
+    rows = list(batch.values())
+    try:
+        for start in range(0, len(rows), FLUSH_BATCH_SIZE):
+            _upsert(rows[start:start + FLUSH_BATCH_SIZE])
+    except Exception:
+        # Возвращаем в буфер то, что не успели перезаписать новыми значениями
+        with _lock:
+            for key, progress in batch.items():
+                _buffer.setdefault(key, progress)
+        raise
+    return len(batch)
+
+
+def _upsert(rows):
+    quote = connection.ops.quote_name
+    table = quote(ReadingProgress._meta.db_table)
+    # JOIN отбрасывает позиции книг и пользователей, удалённых после записи в буфер
+    sql = f'''
+        INSERT INTO {table} (user_id, book_id, page, total_pages, updated_at)
+        SELECT v.user_id, v.book_id, v.page, v.total_pages::integer, v.updated_at
+        FROM (VALUES {', '.join(['(%s, %s, %s, %s, %s)'] * len(rows))})
+            AS v (user_id, book_id, page, total_pages, updated_at)
+        JOIN {quote(Book._meta.db_table)} b ON b.id = v.book_id
+        JOIN {quote(get_user_model()._meta.db_table)} u ON u.id = v.user_id
+        ON CONFLICT (user_id, book_id) DO UPDATE
+        SET page = EXCLUDED.page,
+            total_pages = EXCLUDED.total_pages,
+            updated_at = EXCLUDED.updated_at
+        WHERE {table}.updated_at < EXCLUDED.updated_at
+    '''
+    params = []
+    for progress in rows:
+        params += [progress.user_id, progress.book_id, progress.page,
+                   progress.total_pages, progress.updated_at]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+_writer = BufferedWriter(
+    flush, 'READING_PROGRESS_FLUSH_INTERVAL', 5,
+    name='reading-progress-flusher', error_message='Не удалось записать прогресс чтения',
+)
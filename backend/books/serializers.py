@@ -1,14 +1,45 @@
+import os
+from django.conf import settings
+from django.db import transaction
+from django.core.files.storage import FileSystemStorage
+from django.utils.encoding import filepath_to_uri
 from rest_framework import serializers
-from .models import Genre, Book, Reservation
+from .models import Genre, Book, BookPage, BookUpload, Reservation, ReadingProgress
+from . import counters, events, inventory
 from users.serializers import UserSerializer
+from library_api.fieldsets import SparseFieldsetMixin
 
-class GenreSerializer(serializers.ModelSerializer):
+
+class MediaURLMixin:
+    """
+    Абсолютные URL медиафайлов без build_absolute_uri на каждую строку:
+    базовый адрес MEDIA_URL вычисляется один раз на запрос и кэшируется в context.
+    """
+
+    def build_media_url(self, file):
+        if not file:
+            return None
+
+        request = self.context.get('request')
+        if not isinstance(file.storage, FileSystemStorage):
+            return request.build_absolute_uri(file.url) if request else file.url
+
+        base_url = self.context.get('media_base_url')
+        if base_url is None:
+            base_url = file.storage.base_url
+            if request:
+                base_url = request.build_absolute_uri(base_url)
+            self.context['media_base_url'] = base_url
+        return base_url + filepath_to_uri(file.name).lstrip('/')
+
+
+class GenreSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Genre
-        fields = ('id', 'name', 'description', 'created_at')
-        read_only_fields = ('id', 'created_at')
+        fields = ('id', 'name', 'description', 'books_count', 'available_books_count', 'created_at')
+        read_only_fields = ('id', 'books_count', 'available_books_count', 'created_at')
 
-class BookSerializer(serializers.ModelSerializer):
+class BookSerializer(MediaURLMixin, SparseFieldsetMixin, serializers.ModelSerializer):
     genre_name = serializers.CharField(source='genre.name', read_only=True)
     cover_image_url = serializers.SerializerMethodField()
     pdf_file_url = serializers.SerializerMethodField()
@@ -17,31 +48,24 @@ class BookSerializer(serializers.ModelSerializer):
         model = Book
         fields = ('id', 'title', 'author', 'description', 'genre', 'genre_name',
                   'year_published', 'isbn', 'cover_image', 'cover_image_url',
-                  'pdf_file', 'pdf_file_url', 'status', 'created_at', 'updated_at')
-        read_only_fields = ('id', 'created_at', 'updated_at')
+                  'pdf_file', 'pdf_file_url', 'status', 'total_copies', 'available_copies',
+                  'reservations_count', 'queue_length', 'created_at', 'updated_at')
+        read_only_fields = ('id', 'available_copies', 'reservations_count', 'queue_length',
+                            'created_at', 'updated_at')
+        sparse_sources = {
+            'cover_image_url': ('cover_image',),
+            'pdf_file_url': ('pdf_file',),
+        }
     
     def get_cover_image_url(self, obj):
         # ✅ ИСПРАВЛЕНО: добавлена проверка на существование файла
-        if obj.cover_image and hasattr(obj.cover_image, 'url'):
-            request = self.context.get('request')
-            if request:
-                return request.build_absolute_uri(obj.cover_image.url)
-            return obj.cover_image.url
-        return None
+        return self.build_media_url(obj.cover_image)
     
     def get_pdf_file_url(self, obj):
         # ✅ ИСПРАВЛЕНО: добавлена проверка на существование файла
-        if obj.pdf_file and hasattr(obj.pdf_file, 'url'):
-            request = self.context.get('request')
-            if request:
-                url = request.build_absolute_uri(obj.pdf_file.url)
-                print(f'📄 PDF URL для книги {obj.title}: {url}')  # Для отладки
-                return url
-            return obj.pdf_file.url
-        print(f'⚠️ PDF отсутствует для книги {obj.title}')  # Для отладки
-        return None
-
-class BookListSerializer(serializers.ModelSerializer):
+        return self.build_media_url(obj.pdf_file)
+
+class BookListSerializer(MediaURLMixin, SparseFieldsetMixin, serializers.ModelSerializer):
     genre_name = serializers.CharField(source='genre.name', read_only=True)
     cover_image_url = serializers.SerializerMethodField()
     pdf_file_url = serializers.SerializerMethodField()
@@ -49,26 +73,81 @@ class BookListSerializer(serializers.ModelSerializer):
     class Meta:
         model = Book
         fields = ('id', 'title', 'author', 'description', 'genre_name', 'year_published',
-                  'cover_image_url', 'pdf_file_url', 'status')  # ✅ ДОБАВЛЕНО description
+                  'cover_image_url', 'pdf_file_url', 'status',
+                  'total_copies', 'available_copies')  # ✅ ДОБАВЛЕНО description
+        sparse_sources = {
+            'cover_image_url': ('cover_image',),
+            'pdf_file_url': ('pdf_file',),
+        }
     
     def get_cover_image_url(self, obj):
-        if obj.cover_image and hasattr(obj.cover_image, 'url'):
-            request = self.context.get('request')
-            if request:
-                return request.build_absolute_uri(obj.cover_image.url)
-            return obj.cover_image.url
-        return None
+        return self.build_media_url(obj.cover_image)
     
     # ✅ ДОБАВЛЕНО: метод для PDF URL в списке книг
     def get_pdf_file_url(self, obj):
-        if obj.pdf_file and hasattr(obj.pdf_file, 'url'):
-            request = self.context.get('request')
-            if request:
-                return request.build_absolute_uri(obj.pdf_file.url)
-            return obj.pdf_file.url
-        return None
+        return self.build_media_url(obj.pdf_file)
+
+class SimilarBookSerializer(BookListSerializer):
+    score = serializers.FloatField(read_only=True)
+
+    class Meta(BookListSerializer.Meta):
+        fields = BookListSerializer.Meta.fields + ('score',)
+
+
+class BookContentSearchSerializer(serializers.ModelSerializer):
+    book_title = serializers.CharField(source='book.title', read_only=True)
+    book_author = serializers.CharField(source='book.author', read_only=True)
+    snippet = serializers.CharField(read_only=True)
+
+    class Meta:
+        model = BookPage
+        fields = ('book', 'book_title', 'book_author', 'page_number', 'snippet')
 
-class ReservationSerializer(serializers.ModelSerializer):
+class BookUploadSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = BookUpload
+        fields = ('id', 'book', 'field', 'filename', 'size', 'offset',
+                  'checksum', 'status', 'created_at')
+        read_only_fields = ('id', 'offset', 'status', 'created_at')
+        # Сумма - единственная проверка целостности собранного файла
+        extra_kwargs = {'checksum': {'required': True, 'allow_blank': False}}
+
+    def validate_size(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("Размер файла должен быть больше нуля.")
+        if value > settings.RESUMABLE_UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError("Файл слишком большой.")
+        return value
+
+    def validate_checksum(self, value):
+        value = value.lower()
+        if len(value) != 64 or any(c not in '0123456789abcdef' for c in value):
+            raise serializers.ValidationError("Ожидается SHA-256 в шестнадцатеричном виде.")
+        return value
+
+    def validate_filename(self, value):
+        return os.path.basename(value.replace('\\', '/'))
+
+
+class ReadingProgressSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ReadingProgress
+        fields = ('book', 'page', 'total_pages', 'updated_at')
+        read_only_fields = ('book', 'updated_at')
+
+    def validate_page(self, value):
+        if value < 1:
+            raise serializers.ValidationError("Номер страницы начинается с 1.")
+        return value
+
+    def validate(self, attrs):
+        # Число страниц из PDF книги надёжнее присланного клиентом
+        total_pages = self.context.get('page_count') or attrs.get('total_pages')
+        if total_pages and attrs['page'] > total_pages:
+            raise serializers.ValidationError({'page': f'В книге {total_pages} стр.'})
+        return attrs
+
+class ReservationSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     user_details = UserSerializer(source='user', read_only=True)
     book_details = BookListSerializer(source='book', read_only=True)
     status_display = serializers.CharField(source='get_status_display', read_only=True)
@@ -82,6 +161,11 @@ class ReservationSerializer(serializers.ModelSerializer):
                   'user_comment', 'admin_comment')
         read_only_fields = ('id', 'reservation_date', 'confirmed_date',
                            'taken_date', 'return_date')
+        # В разреженном режиме вложенные объекты отдаются только через ?expand=
+        expandable_fields = ('user_details', 'book_details')
+        sparse_sources = {
+            'status_display': ('status',),
+        }
 
 class ReservationCreateSerializer(serializers.ModelSerializer):
     pickup_date = serializers.DateField(required=True, allow_null=False)
@@ -111,23 +195,28 @@ class ReservationCreateSerializer(serializers.ModelSerializer):
         active_reservation = Reservation.objects.filter(
             user=user,
             book=book,
-            status__in=['pending', 'confirmed', 'taken']
+            status__in=Reservation.ACTIVE_STATUSES
         ).exists()
 
         if active_reservation:
             raise serializers.ValidationError("У вас уже есть активное бронирование этой книги.")
 
-        # validated_data уже гарантированно содержит pickup_date/time
-        reservation = Reservation.objects.create(
-            user=user,
-            book=book,
-            user_comment=validated_data.get('user_comment', ''),
-            pickup_date=validated_data['pickup_date'],
-            pickup_time=validated_data['pickup_time'],
-            status='pending'
-        )
-
-        book.status = 'reserved'
-        book.save()
+        with transaction.atomic():
+            # validated_data уже гарантированно содержит pickup_date/time
+            reservation = Reservation.objects.create(
+                user=user,
+                book=book,
+                user_comment=validated_data.get('user_comment', ''),
+                pickup_date=validated_data['pickup_date'],
+                pickup_time=validated_data['pickup_time'],
+                status='pending'
+            )
+
+            # Свободный экземпляр закрепляется за бронированием; строку книги
+            # транзакция не блокирует (books.inventory)
+            if not inventory.take_copy(book.pk, reservation.pk):
+                raise serializers.ValidationError("Эта книга недоступна для бронирования.")
+            counters.reservation_changed(book.pk, None, reservation.status)
+            events.record(reservation.pk, None, reservation.status, user, reservation.user_comment)
 
         return reservation
\ No newline at end of file
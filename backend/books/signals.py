@@ -0,0 +1,60 @@
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from users.cache import bump_user_generation
+
+from .cache import bump_catalog_version_on_commit
+from .counters import book_changed
+from .inventory import book_created, total_copies_changed
+from .models import Genre, Book, Reservation
+
+
+@receiver([post_save, post_delete], sender=Book)
+@receiver([post_save, post_delete], sender=Genre)
+def invalidate_catalog(sender, **kwargs):
+    """Любое изменение книги или жанра делает кэш каталога неактуальным."""
+    bump_catalog_version_on_commit()
+
+
+@receiver([post_save, post_delete], sender=Reservation)
+def invalidate_user_reservations(sender, instance, **kwargs):
+    """
+    Создание, отмена и переходы бронирования сбрасывают кэш «моих бронирований»
+    владельца. Массовые .update() в админке сбрасывают его сами.
+    """
+    bump_user_generation(instance.user_id)
+
+
+@receiver(pre_save, sender=Book)
+def remember_book_state(sender, instance, raw=False, **kwargs):
+    """
+    Жанр и статус книги в БД до сохранения. Строка блокируется до конца
+    транзакции (Book.save атомарен), чтобы параллельные изменения статуса
+    не посчитались дважды.
+    """
+    instance._counters_state = None
+    if raw or instance._state.adding:
+        return
+    instance._counters_state = (
+        Book.objects.select_for_update()
+        .filter(pk=instance.pk)
+        .values_list('genre_id', 'status', 'total_copies')
+        .first()
+    )
+
+
+@receiver(post_save, sender=Book)
+def update_genre_counters_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    old = None if created else getattr(instance, '_counters_state', None)
+    book_changed(old and old[:2], (instance.genre_id, instance.status))
+    if created:
+        book_created(instance)
+    elif old is not None:
+        total_copies_changed(instance.pk, instance.total_copies - old[2])
+
+
+@receiver(post_delete, sender=Book)
+def update_genre_counters_on_delete(sender, instance, **kwargs):
+    book_changed((instance.genre_id, instance.status), None)
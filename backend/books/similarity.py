@@ -0,0 +1,337 @@
+"""
+Похожие книги («ещё похожие»): TF-IDF по названию, автору и описанию.
+
+Термы извлекает PostgreSQL конфигурацией 'russian' (как и поиск по
+содержимому): кириллица - русский стеммер, латиница - английский, стоп-слова
+обоих языков отброшены. Вес терма - число вхождений с коэффициентом поля
+(FIELD_WEIGHTS: название важнее автора, автор - описания).
+
+Векторы - разреженная матрица SciPy (строки нормированы, сходство -
+скалярное произведение), соседи считаются блоками по N книг, top-K
+сохраняются в BookSimilarity. Ответ API - один запрос по уникальному
+индексу (book_id, rank).
+
+Частоты термов хранятся между запусками в SIMILARITY_INDEX_DIR вместе с
+хешем названия, автора и описания каждой книги, поэтому повторная сборка
+обрабатывает только книги, у которых изменился этот хеш (смена статуса,
+счётчиков или файлов книги его не меняет):
+  - их термы читаются заново, их списки пересчитываются целиком;
+  - списки, где встречалась изменённая или удалённая книга, - тоже;
+  - в остальные списки изменённая книга вставляется, если она ближе
+    последнего соседа.
+IDF при этом пересчитывается, но списки, которых изменения не коснулись,
+остаются с прежними весами - периодически стоит собирать заново (--full).
+"""
+import json
+import logging
+import os
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Min
+
+from .cache import bump_catalog_version
+from .content_index import SEARCH_CONFIGS
+from .models import Book, BookSimilarity
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:  # numpy и scipy необязательны: без них индекс не строится
+    np = sparse = None
+
+logger = logging.getLogger(__name__)
+
+# Коэффициенты полей (веса tsvector): A - название, B - автор, D - описание
+FIELD_WEIGHTS = {'A': 3.0, 'B': 2.0, 'C': 1.0, 'D': 1.0}
+
+# Ячеек плотного блока сходств (блок x все книги) за раз: 16M float32 = 64 МБ
+BLOCK_CELLS = 16 * 1024 * 1024
+# Книг, чьи термы читаются одним запросом
+FETCH_BATCH_SIZE = 2000
+# Доля изменённых книг, при которой проще пересчитать всё
+FULL_REBUILD_RATIO = 0.3
+
+
+class SimilarityError(Exception):
+    pass
+
+
+def _index_dir():
+    return getattr(settings, 'SIMILARITY_INDEX_DIR', os.path.join(settings.BASE_DIR, 'similarity'))
+
+
+# ==================== ТЕРМЫ ====================
+
+def _fetch_terms(book_ids):
+    """{book_id: {терм: вес}} для книг book_ids."""
+    config = SEARCH_CONFIGS[0]
+    weight_case = ' '.join(f"WHEN '{name}' THEN {value}" for name, value in FIELD_WEIGHTS.items())
+    terms = {book_id: {} for book_id in book_ids}
+    with connection.cursor() as cursor:
+        for start in range(0, len(book_ids), FETCH_BATCH_SIZE):
+            cursor.execute(
+                f'''
+                SELECT b.id, t.lexeme,
+                       (SELECT sum(CASE w {weight_case} ELSE 1 END) FROM unnest(t.weights) AS w)
+                FROM {Book._meta.db_table} b
+                CROSS JOIN LATERAL unnest(
+                    setweight(to_tsvector(%s::regconfig, b.title), 'A')
+                    || setweight(to_tsvector(%s::regconfig, b.author), 'B')
+                    || to_tsvector(%s::regconfig, b.description)
+                ) AS t
+                WHERE b.id = ANY(%s)
+                ''',
+                [config, config, config, list(book_ids[start:start + FETCH_BATCH_SIZE])]
+            )
+            for book_id, lexeme, weight in cursor.fetchall():
+                terms[book_id][lexeme] = float(weight)
+    return terms
+
+
+def _content_digests():
+    """
+    {book_id: хеш названия, автора и описания} для всех книг - первые 64
+    бита md5, посчитанные в БД, чтобы не читать описания в Python.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'''
+            SELECT id, ('x' || left(md5(concat_ws(E'\\x1f', title, author, description)), 16))::bit(64)::bigint
+            FROM {Book._meta.db_table}
+            '''
+        )
+        return dict(cursor.fetchall())
+
+
+class TermIndex:
+    """
+    Частоты термов книг: ids[i] - книга строки i матрицы tf, digests[i] -
+    хеш её текста (_content_digests), по которому были прочитаны термы.
+    """
+
+    def __init__(self, ids, tf, vocabulary, digests):
+        self.ids = ids
+        self.tf = tf
+        self.vocabulary = vocabulary
+        self.digests = digests
+
+    @classmethod
+    def empty(cls):
+        return cls(np.zeros(0, dtype=np.int64), sparse.csr_matrix((0, 0), dtype=np.float32), {},
+                   np.zeros(0, dtype=np.int64))
+
+    def replace_rows(self, remove_ids, terms, digests):
+        """
+        Убирает строки remove_ids и добавляет (заменяет) строки из terms;
+        digests - хеши текста книг из terms.
+        """
+        drop = set(remove_ids) | set(terms)
+        keep = np.array([book_id not in drop for book_id in self.ids.tolist()], dtype=bool)
+
+        rows, cols, values = [], [], []
+        new_ids = sorted(terms)
+        for row, book_id in enumerate(new_ids):
+            for term, weight in terms[book_id].items():
+                col = self.vocabulary.get(term)
+                if col is None:
+                    col = self.vocabulary[term] = len(self.vocabulary)
+                rows.append(row)
+                cols.append(col)
+                values.append(weight)
+
+        width = len(self.vocabulary)
+        old = self.tf[keep]
+        old.resize((old.shape[0], width))
+        new = sparse.csr_matrix((values, (rows, cols)), shape=(len(new_ids), width), dtype=np.float32)
+        self.tf = sparse.vstack([old, new], format='csr')
+        self.ids = np.concatenate([self.ids[keep], np.array(new_ids, dtype=np.int64)])
+        self.digests = np.concatenate([
+            self.digests[keep], np.array([digests[book_id] for book_id in new_ids], dtype=np.int64)
+        ])
+
+    def vectors(self):
+        """TF-IDF с нормированными строками."""
+        count = self.tf.shape[0]
+        df = np.bincount(self.tf.indices, minlength=self.tf.shape[1])
+        idf = (np.log((1 + count) / (1 + df)) + 1).astype(np.float32)
+        matrix = self.tf @ sparse.diags(idf)
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        norms[norms == 0] = 1
+        return sparse.csr_matrix(sparse.diags(1 / norms) @ matrix, dtype=np.float32)
+
+    # Файлы: tf.npz (матрица, ids и хеши) и meta.json (словарь)
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        tmp = os.path.join(directory, 'tf.tmp.npz')
+        np.savez(tmp, ids=self.ids, digests=self.digests, data=self.tf.data, indices=self.tf.indices,
+                 indptr=self.tf.indptr, shape=np.array(self.tf.shape))
+        os.replace(tmp, os.path.join(directory, 'tf.npz'))
+        tmp = os.path.join(directory, 'meta.json.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'vocabulary': self.vocabulary}, f, ensure_ascii=False)
+        os.replace(tmp, os.path.join(directory, 'meta.json'))
+
+    @classmethod
+    def load(cls, directory):
+        try:
+            with open(os.path.join(directory, 'meta.json'), encoding='utf-8') as f:
+                meta = json.load(f)
+            with np.load(os.path.join(directory, 'tf.npz')) as data:
+                tf = sparse.csr_matrix((data['data'], data['indices'], data['indptr']),
+                                       shape=tuple(data['shape']))
+                ids = data['ids']
+                digests = data['digests']
+        except (OSError, ValueError, KeyError):
+            return None
+        return cls(ids, tf, meta['vocabulary'], digests)
+
+
+# ==================== СОСЕДИ ====================
+
+def _top_k(vectors, rows, k):
+    """Для строк rows: [(строки соседей, сходства)] по убыванию сходства."""
+    count = vectors.shape[0]
+    block = max(1, BLOCK_CELLS // max(count, 1))
+    transposed = vectors.T.tocsc()
+    for start in range(0, len(rows), block):
+        part = rows[start:start + block]
+        scores = (vectors[part] @ transposed).toarray()
+        scores[np.arange(len(part)), part] = 0
+        if count > k:
+            top = np.argpartition(-scores, k, axis=1)[:, :k]
+        else:
+            top = np.tile(np.arange(count), (len(part), 1))
+        for line, candidates in zip(scores, top):
+            candidates = candidates[np.argsort(-line[candidates], kind='stable')]
+            candidates = candidates[line[candidates] > 0]
+            yield candidates, line[candidates]
+
+
+def _write(lists):
+    """lists - {book_id: [(similar_id, score)]}; старые списки этих книг заменяются."""
+    book_ids = list(lists)
+    for start in range(0, len(book_ids), FETCH_BATCH_SIZE):
+        chunk = book_ids[start:start + FETCH_BATCH_SIZE]
+        with transaction.atomic():
+            BookSimilarity.objects.filter(book_id__in=chunk).delete()
+            # min(): погрешность float32 у совпадающих книг
+            BookSimilarity.objects.bulk_create([
+                BookSimilarity(book_id=book_id, similar_id=similar_id, rank=rank, score=min(score, 1.0))
+                for book_id in chunk
+                for rank, (similar_id, score) in enumerate(lists[book_id], start=1)
+            ], batch_size=5000)
+
+
+def _recompute(index, vectors, book_ids, k):
+    positions = {book_id: row for row, book_id in enumerate(index.ids.tolist())}
+    rows = np.array(sorted(positions[book_id] for book_id in book_ids if book_id in positions), dtype=np.int64)
+    lists = {}
+    for row, (neighbors, scores) in zip(rows.tolist(), _top_k(vectors, rows, k)):
+        lists[int(index.ids[row])] = [
+            (int(index.ids[neighbor]), float(score)) for neighbor, score in zip(neighbors, scores)
+        ]
+        if len(lists) >= FETCH_BATCH_SIZE:
+            _write(lists)
+            lists = {}
+    _write(lists)
+    return len(rows)
+
+
+def _insert_changed(index, vectors, changed, skip, k):
+    """
+    Вставляет изменённые книги в чужие списки, если они ближе последнего
+    соседа. Возвращает число изменённых списков.
+    """
+    positions = {book_id: row for row, book_id in enumerate(index.ids.tolist())}
+    changed_rows = np.array([positions[book_id] for book_id in changed if book_id in positions], dtype=np.int64)
+    if not len(changed_rows):
+        return 0
+
+    # Последний сосед и длина каждого списка
+    bounds = {
+        row['book_id']: (row['weakest'], row['size'])
+        for row in BookSimilarity.objects.values('book_id').annotate(weakest=Min('score'), size=Count('id'))
+    }
+    best = {}
+    block = max(1, BLOCK_CELLS // max(len(index.ids), 1))
+    for start in range(0, len(changed_rows), block):
+        part = changed_rows[start:start + block]
+        scores = (vectors[part] @ vectors.T).toarray()
+        for line, changed_row in zip(scores, part.tolist()):
+            changed_id = int(index.ids[changed_row])
+            for column in np.nonzero(line > 0)[0].tolist():
+                book_id = int(index.ids[column])
+                if book_id in skip:
+                    continue
+                weakest, size = bounds.get(book_id, (0.0, 0))
+                if size < k or line[column] > weakest:
+                    best.setdefault(book_id, []).append((changed_id, float(line[column])))
+
+    lists = {}
+    current = {}
+    for entry in BookSimilarity.objects.filter(book_id__in=list(best)).values_list('book_id', 'similar_id', 'score'):
+        current.setdefault(entry[0], []).append(entry[1:])
+    for book_id, candidates in best.items():
+        merged = current.get(book_id, []) + candidates
+        merged.sort(key=lambda item: -item[1])
+        lists[book_id] = merged[:k]
+    _write(lists)
+    return len(lists)
+
+
+def build_similarity(full=False, top_k=None):
+    """
+    Пересчитывает похожие книги. Возвращает (книг в индексе, пересчитано
+    списков, дополнено списков).
+    """
+    if np is None:
+        raise SimilarityError('Для похожих книг нужны numpy и scipy')
+    k = top_k or settings.SIMILAR_BOOKS_TOP_K
+    directory = _index_dir()
+
+    index = None if full else TermIndex.load(directory)
+    # Хеши читаются до термов: книга, изменённая между ними, попадёт в
+    # следующую сборку - её хеш не совпадёт с сохранённым
+    digests = _content_digests()
+    book_ids = set(digests)
+    if index is None:
+        full = True
+        index = TermIndex.empty()
+        changed = book_ids
+    else:
+        known = dict(zip(index.ids.tolist(), index.digests.tolist()))
+        changed = {book_id for book_id, digest in digests.items() if known.get(book_id) != digest}
+    deleted = set(index.ids.tolist()) - book_ids
+
+    if not changed and not deleted:
+        return len(index.ids), 0, 0
+
+    index.replace_rows(deleted, _fetch_terms(sorted(changed)), digests)
+    vectors = index.vectors()
+
+    if full or len(changed) + len(deleted) > FULL_REBUILD_RATIO * max(len(book_ids), 1):
+        full = True
+        recompute = book_ids
+    else:
+        # Списки, где были изменённые или удалённые книги: соседа на его место
+        # можно найти только полным пересчётом строки
+        affected = set(
+            BookSimilarity.objects.filter(similar_id__in=list(changed | deleted))
+            .values_list('book_id', flat=True)
+        )
+        recompute = changed | (affected - deleted)
+
+    recomputed = _recompute(index, vectors, recompute, k)
+    inserted = 0 if full else _insert_changed(index, vectors, changed, recompute, k)
+    # Списки удалённых книг: ON DELETE CASCADE их уже убрал, здесь - на случай
+    # удаления мимо ORM
+    BookSimilarity.objects.filter(book_id__in=list(deleted)).delete()
+    if full:
+        BookSimilarity.objects.exclude(book_id__in=list(book_ids)).delete()
+
+    index.save(directory)
+    bump_catalog_version()
+    logger.info('Похожие книги: %s книг, пересчитано %s списков, дополнено %s',
+                len(index.ids), recomputed, inserted)
+    return len(index.ids), recomputed, inserted
@@ -0,0 +1,256 @@
+"""
+Снимок каталога для офлайн-загрузки мобильным приложением.
+
+Вместо постраничного обхода /api/books/ и /api/genres/ при установке
+приложение скачивает один файл SQLite (сжатый gzip - его распаковывает
+стандартная библиотека любого клиента) со всеми жанрами и полями списка
+книг. Каждая сборка получает версию; вместе со снимком собирается дельта
+от предыдущей версии: изменённые и новые строки плюс id удалённых.
+Приложение с версией X скачивает цепочку дельт после X, а если X уже
+не хранится - полный снимок.
+
+Файлы неизменяемы (версия в имени) и отдаются с долгим кэшированием,
+актуальная версия - в manifest.json (GET /api/catalog/). Книги читаются
+серверным курсором в одном снимке БД, сравнение с предыдущей версией
+делает SQLite на диске, поэтому память не зависит от размера каталога.
+"""
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Book, Genre
+
+# Версия схемы файла; меняется при несовместимых изменениях таблиц
+SCHEMA_VERSION = 1
+MANIFEST_NAME = 'manifest.json'
+
+# Произвольный ключ advisory-блокировки: одновременно строится один снимок
+BUILD_LOCK_ID = 0x6361746c
+
+GENRE_COLUMNS = ('id', 'name', 'description', 'books_count', 'available_books_count')
+BOOK_COLUMNS = ('id', 'title', 'author', 'description', 'genre_id', 'year_published',
+                'isbn', 'cover_image', 'pdf_file', 'status',
+                'total_copies', 'available_copies', 'updated_at')
+
+SCHEMA = '''
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE genres (
+    id INTEGER PRIMARY KEY, name TEXT NOT NULL, description TEXT,
+    books_count INTEGER NOT NULL, available_books_count INTEGER NOT NULL
+);
+CREATE TABLE books (
+    id INTEGER PRIMARY KEY, title TEXT NOT NULL, author TEXT NOT NULL, description TEXT,
+    genre_id INTEGER, year_published INTEGER, isbn TEXT,
+    cover_image TEXT, pdf_file TEXT, status TEXT NOT NULL,
+    total_copies INTEGER NOT NULL, available_copies INTEGER NOT NULL, updated_at TEXT
+);
+'''
+SNAPSHOT_INDEXES = 'CREATE INDEX books_genre_idx ON books (genre_id);'
+DELTA_SCHEMA = '''
+CREATE TABLE deleted_genres (id INTEGER PRIMARY KEY);
+CREATE TABLE deleted_books (id INTEGER PRIMARY KEY);
+'''
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def snapshot_dir():
+    return os.path.join(settings.MEDIA_ROOT, settings.CATALOG_SNAPSHOT_DIR)
+
+
+def read_manifest():
+    """Манифест последней сборки или None, если снимок ещё не строился."""
+    try:
+        with open(os.path.join(snapshot_dir(), MANIFEST_NAME), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _new_version(previous):
+    version = timezone.now().strftime('%Y%m%d%H%M%S')
+    if previous is not None and version <= previous['version']:
+        # Две сборки за одну секунду
+        version = str(int(previous['version']) + 1)
+    return version
+
+
+def _insert_rows(db, table, columns, rows, batch_size):
+    sql = f'INSERT INTO {table} ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))})'
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            db.executemany(sql, batch)
+            batch.clear()
+    if batch:
+        db.executemany(sql, batch)
+
+
+def _book_rows(batch_size):
+    # iterator() на PostgreSQL читает именованным (серверным) курсором
+    for row in Book.objects.order_by('pk').values_list(*BOOK_COLUMNS).iterator(chunk_size=batch_size):
+        *values, updated_at = row
+        yield (*values, updated_at.isoformat() if updated_at else None)
+
+
+def _fill_snapshot(path, batch_size):
+    db = sqlite3.connect(path)
+    try:
+        db.executescript(SCHEMA)
+        with transaction.atomic(), connection.cursor() as cursor:
+            # Жанры и книги из одного снимка БД
+            cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+            cursor.execute('SELECT pg_try_advisory_xact_lock(%s)', [BUILD_LOCK_ID])
+            if not cursor.fetchone()[0]:
+                raise SnapshotError('Снимок каталога уже строится')
+            _insert_rows(db, 'genres', GENRE_COLUMNS,
+                         Genre.objects.order_by('pk').values_list(*GENRE_COLUMNS).iterator(),
+                         batch_size)
+            _insert_rows(db, 'books', BOOK_COLUMNS, _book_rows(batch_size), batch_size)
+        db.executescript(SNAPSHOT_INDEXES)
+        db.commit()
+    finally:
+        db.close()
+
+
+def _fill_delta(path, snapshot_path, previous_path):
+    """Строки, новые или изменённые относительно предыдущего снимка, и удалённые id."""
+    db = sqlite3.connect(path)
+    try:
+        db.executescript(SCHEMA + DELTA_SCHEMA)
+        db.execute('ATTACH DATABASE ? AS new', [snapshot_path])
+        db.execute('ATTACH DATABASE ? AS old', [previous_path])
+        changed = 0
+        for table, deleted in (('genres', 'deleted_genres'), ('books', 'deleted_books')):
+            changed += db.execute(
+                f'INSERT INTO main.{table} SELECT * FROM new.{table} EXCEPT SELECT * FROM old.{table}'
+            ).rowcount
+            changed += db.execute(
+                f'INSERT INTO main.{deleted} SELECT id FROM old.{table} EXCEPT SELECT id FROM new.{table}'
+            ).rowcount
+        db.commit()
+        return changed
+    finally:
+        db.close()
+
+
+def _write_meta(path, **values):
+    db = sqlite3.connect(path)
+    try:
+        db.executemany('INSERT INTO meta (key, value) VALUES (?, ?)',
+                       [(key, str(value)) for key, value in values.items()])
+        db.commit()
+        db.execute('VACUUM')
+    finally:
+        db.close()
+
+
+def _publish(src, name):
+    """Сжимает файл в каталог снимков; возвращает описание для манифеста."""
+    target = os.path.join(snapshot_dir(), name)
+    digest = hashlib.sha256()
+    with open(src, 'rb') as raw, open(target + '.tmp', 'wb') as out:
+        # mtime=0: одинаковые данные дают одинаковый файл
+        with gzip.GzipFile(filename='', mode='wb', fileobj=out, compresslevel=9, mtime=0) as gz:
+            shutil.copyfileobj(raw, gz)
+    with open(target + '.tmp', 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    os.replace(target + '.tmp', target)
+    return {'file': name, 'size': os.path.getsize(target), 'sha256': digest.hexdigest()}
+
+
+def _unpack(name, dst):
+    with gzip.open(os.path.join(snapshot_dir(), name), 'rb') as src, open(dst, 'wb') as out:
+        shutil.copyfileobj(src, out)
+
+
+def _cleanup(manifest):
+    """Удаляет файлы, на которые манифест больше не ссылается."""
+    keep = {MANIFEST_NAME, manifest['snapshot']['file']}
+    if manifest.get('previous_snapshot'):
+        # Предыдущий снимок могут ещё докачивать
+        keep.add(manifest['previous_snapshot']['file'])
+    keep.update(delta['file'] for delta in manifest['deltas'])
+    for name in os.listdir(snapshot_dir()):
+        if name not in keep and not name.endswith('.tmp'):
+            os.remove(os.path.join(snapshot_dir(), name))
+
+
+def build_snapshot(batch_size=5000, keep_deltas=None, force=False):
+    """
+    Собирает снимок каталога и дельту от предыдущей версии.
+    Если с прошлой сборки ничего не изменилось (и не force), версия
+    не меняется. Возвращает (манифест, изменённых строк или None для первой сборки).
+    """
+    if connection.vendor != 'postgresql':
+        raise SnapshotError('Снимок каталога строится только на PostgreSQL')
+    if keep_deltas is None:
+        keep_deltas = settings.CATALOG_SNAPSHOT_KEEP_DELTAS
+    os.makedirs(snapshot_dir(), exist_ok=True)
+    previous = read_manifest()
+    if previous is not None and previous.get('schema') != SCHEMA_VERSION:
+        previous = None
+
+    with tempfile.TemporaryDirectory() as tmp:
+        snapshot_path = os.path.join(tmp, 'snapshot.sqlite')
+        _fill_snapshot(snapshot_path, batch_size)
+
+        changed = None
+        delta_path = os.path.join(tmp, 'delta.sqlite')
+        if previous is not None:
+            previous_path = os.path.join(tmp, 'previous.sqlite')
+            _unpack(previous['snapshot']['file'], previous_path)
+            changed = _fill_delta(delta_path, snapshot_path, previous_path)
+            if not changed and not force:
+                return previous, 0
+
+        version = _new_version(previous)
+        built_at = timezone.now().isoformat()
+        _write_meta(snapshot_path, schema=SCHEMA_VERSION, version=version, built_at=built_at)
+        manifest = {
+            'schema': SCHEMA_VERSION,
+            'version': version,
+            'built_at': built_at,
+            'compression': 'gzip',
+            'snapshot': _publish(snapshot_path, f'catalog-{version}.sqlite.gz'),
+            'previous_snapshot': previous and previous['snapshot'],
+            'deltas': [],
+        }
+        if previous is not None:
+            _write_meta(delta_path, schema=SCHEMA_VERSION, version=version,
+                        base_version=previous['version'], built_at=built_at)
+            delta = _publish(delta_path, f'delta-{previous["version"]}-{version}.sqlite.gz')
+            delta.update({'from': previous['version'], 'to': version})
+            manifest['deltas'] = (previous['deltas'] + [delta])[-keep_deltas:] if keep_deltas else []
+
+    path = os.path.join(snapshot_dir(), MANIFEST_NAME)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(path + '.tmp', path)
+    _cleanup(manifest)
+    return manifest, changed
+
+
+def deltas_since(manifest, version):
+    """
+    Цепочка дельт от version до текущей версии; [] - обновлять нечего,
+    None - version слишком старая (или неизвестная), нужен полный снимок.
+    """
+    if version == manifest['version']:
+        return []
+    for index, delta in enumerate(manifest['deltas']):
+        if delta['from'] == version:
+            return manifest['deltas'][index:]
+    return None
@@ -0,0 +1,174 @@
+"""
+Возобновляемые загрузки файлов книг по частям (по мотивам протокола tus).
+
+1. POST /api/uploads/ - создать загрузку (книга, поле, имя файла, размер,
+   sha256 - обязателен, finalize без совпадения не прикрепит файл)
+2. PATCH /api/uploads/<id>/ с заголовком Upload-Offset - дописать часть файла;
+   HEAD/GET возвращает текущее смещение, с которого нужно продолжить
+3. POST /api/uploads/<id>/finalize/ - проверить размер и контрольную сумму
+   и атомарно прикрепить файл к Book.pdf_file / Book.cover_image
+
+Части пишутся сразу во временный файл кусками по CHUNK_SIZE байт,
+поэтому память не зависит от размера файла.
+"""
+import base64
+import hashlib
+import os
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from PIL import Image
+
+from .pdf_pipeline import schedule_pdf_processing
+from .models import Book, BookUpload
+
+CHUNK_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+class PartFile(File):
+    """
+    Временный файл загрузки. temporary_file_path() позволяет
+    FileSystemStorage переместить его на место, а не копировать.
+    """
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def parse_checksum_header(value):
+    """'sha256 <base64>' -> bytes дайджеста (заголовок Upload-Checksum)."""
+    algorithm, _, encoded = value.strip().partition(' ')
+    if algorithm.lower() != 'sha256':
+        raise UploadError('Поддерживается только Upload-Checksum: sha256', 400)
+    try:
+        return base64.b64decode(encoded, validate=True)
+    except ValueError:
+        raise UploadError('Некорректный Upload-Checksum', 400)
+
+
+def write_chunk(upload, offset, length, stream, checksum=None):
+    """
+    Дописывает часть файла с позиции offset и сдвигает смещение загрузки.
+    Возвращает новое смещение.
+    """
+    if upload.status != 'in_progress':
+        raise UploadError('Загрузка уже завершена', 409)
+    if offset != upload.offset:
+        raise UploadError('Смещение не совпадает с загруженным объёмом', 409)
+    if length > settings.RESUMABLE_UPLOAD_CHUNK_MAX_SIZE:
+        raise UploadError('Слишком большая часть файла', 413)
+    if offset + length > upload.size:
+        raise UploadError('Часть выходит за объявленный размер файла', 400)
+
+    os.makedirs(settings.RESUMABLE_UPLOAD_DIR, exist_ok=True)
+    digest = hashlib.sha256() if checksum is not None else None
+    written = 0
+    mode = 'r+b' if os.path.exists(upload.temp_path) else 'wb'
+    with open(upload.temp_path, mode) as f:
+        f.seek(offset)
+        while written < length:
+            chunk = stream.read(min(CHUNK_SIZE, length - written))
+            if not chunk:
+                break
+            f.write(chunk)
+            if digest is not None:
+                digest.update(chunk)
+            written += len(chunk)
+
+    if digest is not None and (written != length or digest.digest() != checksum):
+        # Смещение не сдвигаем: клиент повторит эту часть
+        raise UploadError('Контрольная сумма части не совпала', 460)
+
+    # Условное обновление: параллельный PATCH с тем же смещением получит 409
+    new_offset = offset + written
+    updated = BookUpload.objects.filter(
+        pk=upload.pk, offset=offset, status='in_progress'
+    ).update(offset=new_offset)
+    if not updated:
+        raise UploadError('Загрузка изменена параллельным запросом', 409)
+    upload.offset = new_offset
+    return new_offset
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def validate_content(upload):
+    with open(upload.temp_path, 'rb') as f:
+        if upload.field == 'pdf_file':
+            if f.read(5) != b'%PDF-':
+                raise UploadError('Файл не является PDF', 400)
+            return
+
+        try:
+            Image.open(f).verify()
+        except Exception:
+            raise UploadError('Файл не является изображением', 400)
+
+
+def finalize_upload(upload_id, user, checksum=''):
+    """
+    Проверяет загруженный файл и атомарно прикрепляет его к книге.
+    Возвращает книгу.
+    """
+    with transaction.atomic():
+        try:
+            upload = BookUpload.objects.select_for_update().get(pk=upload_id, user=user)
+        except BookUpload.DoesNotExist:
+            raise UploadError('Загрузка не найдена', 404)
+
+        if upload.status != 'in_progress':
+            raise UploadError('Загрузка уже завершена', 409)
+        if upload.offset != upload.size or not os.path.exists(upload.temp_path):
+            raise UploadError('Файл загружен не полностью', 409)
+
+        # Проверка обязательна: параллельные PATCH с одним смещением могут
+        # оба успеть записать в .part-файл, прежде чем один из них отклонят
+        expected = (checksum or upload.checksum).lower()
+        if not expected:
+            raise UploadError('Нужна контрольная сумма файла (sha256)', 400)
+        if file_sha256(upload.temp_path) != expected:
+            raise UploadError('Контрольная сумма файла не совпала', 460)
+        validate_content(upload)
+
+        book = Book.objects.select_for_update().get(pk=upload.book_id)
+        field_file = getattr(book, upload.field)
+        with open(upload.temp_path, 'rb') as f:
+            # FileSystemStorage перемещает временный файл, без копирования
+            field_file.save(upload.filename, PartFile(f), save=False)
+        new_name = field_file.name
+
+        try:
+            book.save()
+            upload.status = 'complete'
+            upload.save(update_fields=['status', 'updated_at'])
+        except Exception:
+            field_file.storage.delete(new_name)
+            raise
+
+        if upload.field == 'pdf_file':
+            schedule_pdf_processing(book)
+
+        # Для хранилищ без перемещения файла временная копия остаётся - удаляем её
+        temp_path = upload.temp_path
+        transaction.on_commit(lambda: os.path.exists(temp_path) and os.remove(temp_path))
+
+    return book
+
+
+def abort_upload(upload):
+    if os.path.exists(upload.temp_path):
+        os.remove(upload.temp_path)
+    upload.delete()
@@ -11,10 +11,25 @@ urlpatterns = [
     # Книги
     path('books/', views.BookListView.as_view(), name='book-list'),
     path('books/search/', views.search_books, name='book-search'),
+    path('books/suggest/', views.suggest_books, name='book-suggest'),
+    path('books/search/content/', views.BookContentSearchView.as_view(), name='book-content-search'),
+    path('books/batch/', views.batch_books, name='book-batch'),
+    path('books/facets/', views.BookFacetsView.as_view(), name='book-facets'),
     path('books/create/', views.BookCreateView.as_view(), name='book-create'),
     path('books/<int:pk>/', views.BookDetailView.as_view(), name='book-detail'),
     path('books/<int:pk>/update/', views.BookUpdateView.as_view(), name='book-update'),
     path('books/<int:pk>/delete/', views.BookDeleteView.as_view(), name='book-delete'),
+    path('books/<int:pk>/similar/', views.BookSimilarView.as_view(), name='book-similar'),
+    path('books/<int:pk>/progress/', views.reading_progress, name='book-progress'),
+    
+    # Офлайн-снимок каталога
+    path('catalog/', views.catalog_snapshot, name='catalog-snapshot'),
+    path('catalog/<str:name>', views.catalog_snapshot_file, name='catalog-snapshot-file'),
+    
+    # Загрузка файлов по частям
+    path('uploads/', views.upload_create, name='upload-create'),
+    path('uploads/<uuid:pk>/', views.upload_detail, name='upload-detail'),
+    path('uploads/<uuid:pk>/finalize/', views.upload_finalize, name='upload-finalize'),
     
     # Бронирования
     path('reservations/', views.ReservationListView.as_view(), name='reservation-list'),
@@ -22,8 +37,13 @@ urlpatterns = [
     path('reservations/<int:pk>/', views.ReservationDetailView.as_view(), name='reservation-detail'),
     path('reservations/<int:pk>/cancel/', views.cancel_reservation, name='reservation-cancel'),
     
+    # Главный экран
+    path('home/', views.home_view, name='home'),
+    
     # Админ
     path('admin/reservations/', views.AllReservationsView.as_view(), name='admin-reservations'),
+    path('admin/reservations/export/<str:fmt>/', views.ReservationExportView.as_view(), name='admin-reservations-export'),
+    path('admin/books/export/<str:fmt>/', views.BookExportView.as_view(), name='admin-books-export'),
     path('admin/reservations/<int:pk>/confirm/', views.confirm_reservation, name='admin-confirm'),
     path('admin/reservations/<int:pk>/taken/', views.mark_as_taken, name='admin-taken'),
     path('admin/reservations/<int:pk>/returned/', views.mark_as_returned, name='admin-returned'),
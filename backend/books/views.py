@@ -1,23 +1,46 @@
+import os
+import re
+
 from rest_framework import generics, filters, status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny  # ✅ ДОБАВЛЕНО
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Q
+from django.contrib.postgres.search import SearchHeadline, SearchRank
+from django.db.models import F, Q
+from django.conf import settings
 from django.db import transaction
-from .models import Genre, Book, Reservation
+from django.http import FileResponse, Http404
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import require_safe
+from library_api.exports import FORMATS as EXPORT_FORMATS
+from library_api.fieldsets import SparseFieldsetViewMixin, narrow_queryset
+from library_api.ratelimit import throttle_scope
+from .cache import CatalogCacheMixin, get_catalog_version
+from .facets import compute_facets
+from .content_index import build_search_query, SEARCH_CONFIGS
+from .pdf_pipeline import schedule_pdf_processing
+from . import counters, events, exports, inventory, notifications, progress, snapshot, suggest, uploads
+from .archive import load_history, reservation_history
+from .models import Genre, Book, BookPage, BookUpload, Reservation, ArchivedReservation
 from .serializers import (
     GenreSerializer,
     BookSerializer,
     BookListSerializer,
+    SimilarBookSerializer,
+    BookContentSearchSerializer,
+    BookUploadSerializer,
+    ReadingProgressSerializer,
     ReservationSerializer,
     ReservationCreateSerializer
 )
+from users.cache import UserCacheMixin
+from users.serializers import UserSerializer
 
 
 # ==================== ЖАНРЫ ====================
 
-class GenreListView(generics.ListAPIView):
+class GenreListView(CatalogCacheMixin, SparseFieldsetViewMixin, generics.ListAPIView):
     """
     Список всех жанров
     GET /api/genres/
@@ -39,7 +62,7 @@ class GenreCreateView(generics.CreateAPIView):
 
 # ==================== КНИГИ ====================
 
-class BookListView(generics.ListAPIView):
+class BookListView(CatalogCacheMixin, SparseFieldsetViewMixin, generics.ListAPIView):
     """
     Список всех книг с поиском и фильтрацией
     GET /api/books/
@@ -54,7 +77,34 @@ class BookListView(generics.ListAPIView):
     ordering = ['-created_at']
 
 
-class BookDetailView(generics.RetrieveAPIView):
+class BookFacetsView(CatalogCacheMixin, generics.ListAPIView):
+    """
+    Счётчики книг по жанрам, статусам и годам для текущего поиска и фильтров
+    GET /api/books/facets/?search=...&genre=...&status=...&year_bucket=10
+    """
+    queryset = Book.objects.all()
+    permission_classes = [AllowAny]
+    filter_backends = [DjangoFilterBackend, filters.SearchFilter]
+    filterset_fields = BookListView.filterset_fields
+    search_fields = BookListView.search_fields
+    catalog_cache_prefix = 'facets'
+
+    def list(self, request, *args, **kwargs):
+        try:
+            year_bucket = int(request.query_params.get('year_bucket', 10))
+        except ValueError:
+            year_bucket = 0
+        if not 1 <= year_bucket <= 100:
+            return Response(
+                {'error': 'Параметр "year_bucket" должен быть числом от 1 до 100'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        queryset = self.filter_queryset(self.get_queryset())
+        return Response(compute_facets(queryset, year_bucket))
+
+
+class BookDetailView(CatalogCacheMixin, SparseFieldsetViewMixin, generics.RetrieveAPIView):
     """
     Детальная информация о книге
     GET /api/books/<id>/
@@ -64,6 +114,28 @@ class BookDetailView(generics.RetrieveAPIView):
     permission_classes = [AllowAny]  #  ВРЕМЕННО ИЗМЕНЕНО для тестирования
 
 
+class BookSimilarView(CatalogCacheMixin, SparseFieldsetViewMixin, generics.ListAPIView):
+    """
+    Похожие книги, от самой близкой (список считает команда build_similarity)
+    GET /api/books/<id>/similar/
+    """
+    serializer_class = SimilarBookSerializer
+    permission_classes = [AllowAny]
+    pagination_class = None
+    filter_backends = []
+
+    def get_queryset(self):
+        return Book.objects.filter(similar_to__book_id=self.kwargs['pk']).select_related('genre').annotate(
+            score=F('similar_to__score'),
+        ).order_by('similar_to__rank')
+
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        if not response.data and not Book.objects.filter(pk=kwargs['pk']).exists():
+            raise Http404
+        return response
+
+
 class BookCreateView(generics.CreateAPIView):
     """
     Создание книги (только для админов)
@@ -73,6 +145,11 @@ class BookCreateView(generics.CreateAPIView):
     serializer_class = BookSerializer
     permission_classes = [IsAdminUser]
 
+    def perform_create(self, serializer):
+        book = serializer.save()
+        if book.pdf_file:
+            schedule_pdf_processing(book)
+
 
 class BookUpdateView(generics.UpdateAPIView):
     """
@@ -83,6 +160,11 @@ class BookUpdateView(generics.UpdateAPIView):
     serializer_class = BookSerializer
     permission_classes = [IsAdminUser]
 
+    def perform_update(self, serializer):
+        book = serializer.save()
+        if 'pdf_file' in serializer.validated_data:
+            schedule_pdf_processing(book)
+
 
 class BookDeleteView(generics.DestroyAPIView):
     """
@@ -115,7 +197,7 @@ class GenreDeleteView(generics.DestroyAPIView):
     def delete(self, request, *args, **kwargs):
         genre = self.get_object()
 
-        if Book.objects.filter(genre=genre).exists():
+        if genre.books_count > 0:
             return Response(
                 {'error': 'Нельзя удалить жанр, к которому привязаны книги'},
                 status=status.HTTP_400_BAD_REQUEST
@@ -123,6 +205,7 @@ class GenreDeleteView(generics.DestroyAPIView):
 
         return super().delete(request, *args, **kwargs)
 
+@throttle_scope('search')
 @api_view(['GET'])
 @permission_classes([AllowAny])  # ✅ ВРЕМЕННО ИЗМЕНЕНО для тестирования
 def search_books(request):
@@ -143,23 +226,342 @@ def search_books(request):
         Q(author__icontains=query) |
         Q(description__icontains=query)
     )
+    books = narrow_queryset(books, BookListSerializer(context={'request': request}))
 
     serializer = BookListSerializer(books, many=True, context={'request': request})
     return Response(serializer.data)
 
 
+SUGGEST_MAX_LIMIT = 50
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def suggest_books(request):
+    """
+    Подсказки для строки поиска: книги, название или слово названия
+    (автора) которых начинается с q. Регистр и ё/е не различаются.
+    GET /api/books/suggest/?q=войн&limit=10
+    """
+    query = suggest.normalize(request.query_params.get('q', ''))
+    if not query:
+        return Response(
+            {'error': 'Параметр поиска "q" обязателен'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    try:
+        limit = int(request.query_params.get('limit', settings.SUGGEST_LIMIT))
+    except ValueError:
+        limit = 0
+    if not 1 <= limit <= SUGGEST_MAX_LIMIT:
+        return Response(
+            {'error': f'Параметр "limit" должен быть числом от 1 до {SUGGEST_MAX_LIMIT}'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    suggester = suggest.get_suggester()
+    if suggester is not None:
+        found = suggester.suggest(query, limit)
+    else:
+        found = suggest.suggest_from_db(request.query_params['q'].strip(), limit)
+    return Response([
+        {'id': book_id, 'title': title, 'author': author}
+        for book_id, title, author in found
+    ])
+
+
+class BookContentSearchView(generics.ListAPIView):
+    """
+    Поиск по тексту внутри PDF книг: книга, страница и фрагмент
+    GET /api/books/search/content/?q=фраза
+    """
+    serializer_class = BookContentSearchSerializer
+    permission_classes = [AllowAny]
+    throttle_scope = 'content_search'
+    filter_backends = []
+
+    def list(self, request, *args, **kwargs):
+        if not request.query_params.get('q', '').strip():
+            return Response(
+                {'error': 'Параметр поиска "q" обязателен'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return super().list(request, *args, **kwargs)
+
+    def get_queryset(self):
+        query = build_search_query(self.request.query_params['q'].strip())
+        return BookPage.objects.filter(search_vector=query).select_related('book').only(
+            'book__id', 'book__title', 'book__author', 'page_number'
+        ).annotate(
+            rank=SearchRank(F('search_vector'), query),
+            snippet=SearchHeadline('content', query, config=SEARCH_CONFIGS[0],
+                                   max_words=35, min_words=15),
+        ).order_by('-rank', 'book_id', 'page_number')
+
+
+BATCH_MAX_IDS = 500
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def batch_books(request):
+    """
+    Несколько книг одним запросом (вместо N запросов к /api/books/<id>/)
+    GET /api/books/batch/?ids=1,2,3
+    """
+    raw_ids = [value for value in request.GET.get('ids', '').split(',') if value.strip()]
+    if not raw_ids:
+        return Response(
+            {'error': 'Параметр "ids" обязателен'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    try:
+        ids = list(dict.fromkeys(int(value) for value in raw_ids))
+    except ValueError:
+        return Response(
+            {'error': 'Параметр "ids" должен быть списком чисел через запятую'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    if len(ids) > BATCH_MAX_IDS:
+        return Response(
+            {'error': f'Можно запросить не более {BATCH_MAX_IDS} книг за раз'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    context = {'request': request}
+    books = Book.objects.select_related('genre').filter(id__in=ids)
+    books = {book.id: book for book in narrow_queryset(books, BookSerializer(context=context))}
+
+    serializer = BookSerializer([books[pk] for pk in ids if pk in books], many=True, context=context)
+    return Response({
+        'results': serializer.data,
+        'missing': [pk for pk in ids if pk not in books],
+    })
+
+
+# ==================== СНИМОК КАТАЛОГА ====================
+
+CATALOG_FILE_RE = re.compile(r'^(catalog|delta)-[0-9-]+\.sqlite\.gz$')
+
+
+def _catalog_file_info(request, info):
+    return dict(info, url=request.build_absolute_uri(f'/api/catalog/{info["file"]}'))
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def catalog_snapshot(request):
+    """
+    Актуальная версия офлайн-снимка каталога (см. books.snapshot)
+    GET /api/catalog/?since=<версия у клиента>
+    deltas - дельты для применения по порядку; null - скачать полный snapshot.
+    """
+    manifest = snapshot.read_manifest()
+    if manifest is None:
+        return Response(
+            {'error': 'Снимок каталога ещё не собран'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    since = request.GET.get('since')
+    deltas = manifest['deltas'] if since is None else snapshot.deltas_since(manifest, since)
+    response = Response({
+        'schema': manifest['schema'],
+        'version': manifest['version'],
+        'built_at': manifest['built_at'],
+        'compression': manifest['compression'],
+        'media_base_url': request.build_absolute_uri(settings.MEDIA_URL),
+        'snapshot': _catalog_file_info(request, manifest['snapshot']),
+        'deltas': None if deltas is None else [_catalog_file_info(request, delta) for delta in deltas],
+    })
+    # Версия меняется не чаще сборки снимка
+    patch_cache_control(response, public=True, max_age=settings.CATALOG_MANIFEST_MAX_AGE)
+    return response
+
+
+@require_safe
+def catalog_snapshot_file(request, name):
+    """
+    Файл снимка или дельты. Имена содержат версию и не переиспользуются,
+    поэтому кэшируются навсегда.
+    GET /api/catalog/<file>
+    """
+    if not CATALOG_FILE_RE.match(name):
+        raise Http404
+    try:
+        file = open(os.path.join(snapshot.snapshot_dir(), name), 'rb')
+    except FileNotFoundError:
+        raise Http404
+    response = FileResponse(file, content_type='application/gzip')
+    patch_cache_control(response, public=True, max_age=365 * 24 * 60 * 60, immutable=True)
+    return response
+
+
+# ==================== ЗАГРУЗКА ФАЙЛОВ ПО ЧАСТЯМ ====================
+
+def _upload_response(upload, status_code=status.HTTP_200_OK, data=None):
+    response = Response(data, status=status_code)
+    response['Upload-Offset'] = str(upload.offset)
+    response['Upload-Length'] = str(upload.size)
+    response['Cache-Control'] = 'no-store'
+    return response
+
+
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def upload_create(request):
+    """
+    Начать возобновляемую загрузку файла книги (только админ)
+    POST /api/uploads/  {book, field, filename, size, checksum}
+    """
+    serializer = BookUploadSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    upload = serializer.save(user=request.user)
+
+    response = _upload_response(upload, status.HTTP_201_CREATED, serializer.data)
+    response['Location'] = request.build_absolute_uri(f'{upload.pk}/')
+    return response
+
+
+@api_view(['GET', 'HEAD', 'PATCH', 'DELETE'])
+@permission_classes([IsAdminUser])
+def upload_detail(request, pk):
+    """
+    Состояние загрузки / дописать часть / отменить (только админ)
+    GET|HEAD /api/uploads/<id>/ - Upload-Offset, с которого продолжать
+    PATCH /api/uploads/<id>/ - тело запроса = часть файла, заголовок Upload-Offset
+    DELETE /api/uploads/<id>/
+    """
+    try:
+        upload = BookUpload.objects.get(pk=pk, user=request.user)
+    except BookUpload.DoesNotExist:
+        return Response(
+            {'error': 'Загрузка не найдена'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    if request.method == 'DELETE':
+        uploads.abort_upload(upload)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    if request.method in ('GET', 'HEAD'):
+        return _upload_response(upload, data=BookUploadSerializer(upload).data)
+
+    try:
+        offset = int(request.headers['Upload-Offset'])
+        length = int(request.headers['Content-Length'])
+    except (KeyError, ValueError):
+        return Response(
+            {'error': 'Нужны заголовки Upload-Offset и Content-Length'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    try:
+        checksum = request.headers.get('Upload-Checksum')
+        if checksum is not None:
+            checksum = uploads.parse_checksum_header(checksum)
+        # Тело читается потоком, request.data не трогаем
+        uploads.write_chunk(upload, offset, length, request.stream, checksum)
+    except uploads.UploadError as exc:
+        return _upload_response(upload, exc.status_code, {'error': exc.message})
+
+    return _upload_response(upload, status.HTTP_204_NO_CONTENT)
+
+
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def upload_finalize(request, pk):
+    """
+    Завершить загрузку: проверить sha256 и прикрепить файл к книге (только админ)
+    POST /api/uploads/<id>/finalize/  {checksum}
+    """
+    try:
+        book = uploads.finalize_upload(pk, request.user, request.data.get('checksum', ''))
+    except uploads.UploadError as exc:
+        return Response({'error': exc.message}, status=exc.status_code)
+
+    return Response(
+        BookSerializer(book, context={'request': request}).data,
+        status=status.HTTP_200_OK
+    )
+
+
+# ==================== ПРОГРЕСС ЧТЕНИЯ ====================
+
+@api_view(['GET', 'PUT'])
+@permission_classes([IsAuthenticated])
+def reading_progress(request, pk):
+    """
+    Позиция чтения книги текущим пользователем
+    GET /api/books/<id>/progress/
+    PUT /api/books/<id>/progress/  {page, total_pages}
+    PUT не пишет в БД: позиция копится в буфере books.progress.
+    """
+    book = Book.objects.filter(pk=pk).values('pdf_page_count').first()
+    if book is None:
+        return Response(
+            {'error': 'Книга не найдена'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    if request.method == 'GET':
+        current = progress.get_progress(request.user.pk, pk)
+        if current is None:
+            return Response(
+                {'error': 'Книгу ещё не открывали'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return Response(ReadingProgressSerializer(current).data)
+
+    serializer = ReadingProgressSerializer(
+        data=request.data, context={'page_count': book['pdf_page_count']}
+    )
+    serializer.is_valid(raise_exception=True)
+    current = progress.record_progress(
+        request.user.pk, pk,
+        serializer.validated_data['page'],
+        serializer.validated_data.get('total_pages') or book['pdf_page_count'],
+    )
+    return Response(ReadingProgressSerializer(current).data, status=status.HTTP_200_OK)
+
+
 # ==================== БРОНИРОВАНИЯ ====================
 
-class ReservationListView(generics.ListAPIView):
+class ReservationListView(UserCacheMixin, SparseFieldsetViewMixin, generics.ListAPIView):
     """
-    Список бронирований текущего пользователя
+    Список бронирований текущего пользователя, включая архивные
     GET /api/reservations/
+    Кэшируется по поколению пользователя (users.cache) и версии каталога:
+    в ответ встроены данные книг.
     """
+    queryset = Reservation.objects.select_related('book', 'user').all()
     serializer_class = ReservationSerializer
     permission_classes = [IsAuthenticated]
+    user_cache_prefix = 'reservations'
+
+    def get_user_cache_parts(self):
+        return (get_catalog_version(),)
 
     def get_queryset(self):
-        return Reservation.objects.select_related('book', 'user').filter(user=self.request.user)
+        return super().get_queryset().filter(user=self.request.user)
+
+    def get_archive_queryset(self):
+        queryset = ArchivedReservation.objects.select_related('book', 'user').filter(user=self.request.user)
+        return narrow_queryset(queryset, self.get_serializer())
+
+    def list(self, request, *args, **kwargs):
+        # Пагинируется объединение ключей из обеих таблиц, объекты грузятся только для страницы
+        history = reservation_history(request.user)
+        page = self.paginate_queryset(history)
+        rows = page if page is not None else list(history)
+        reservations = load_history(rows, self.get_queryset(), self.get_archive_queryset())
+
+        serializer = self.get_serializer(reservations, many=True)
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
+        return Response(serializer.data)
 
 
 class ReservationCreateView(generics.CreateAPIView):
@@ -172,7 +574,7 @@ class ReservationCreateView(generics.CreateAPIView):
     permission_classes = [IsAuthenticated]
 
 
-class ReservationDetailView(generics.RetrieveAPIView):
+class ReservationDetailView(SparseFieldsetViewMixin, generics.RetrieveAPIView):
     """
     Детали бронирования
     GET /api/reservations/<id>/
@@ -182,9 +584,25 @@ class ReservationDetailView(generics.RetrieveAPIView):
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
+        queryset = super().get_queryset()
         if self.request.user.user_type == 'admin':
-            return Reservation.objects.select_related('book', 'user').all()
-        return Reservation.objects.select_related('book', 'user').filter(user=self.request.user)
+            return queryset
+        return queryset.filter(user=self.request.user)
+
+    def get_object(self):
+        try:
+            return super().get_object()
+        except Http404:
+            pass
+        # Завершённые бронирования могли быть перенесены в архив
+        queryset = ArchivedReservation.objects.select_related('book', 'user')
+        if self.request.user.user_type != 'admin':
+            queryset = queryset.filter(user=self.request.user)
+        try:
+            archived = narrow_queryset(queryset, self.get_serializer()).get(pk=self.kwargs['pk'])
+        except ArchivedReservation.DoesNotExist:
+            raise Http404
+        return archived.as_reservation()
 
 
 @api_view(['POST'])
@@ -193,10 +611,10 @@ class ReservationDetailView(generics.RetrieveAPIView):
 def cancel_reservation(request, pk):
     """
     Отмена бронирования
-    POST /api/reservations/<id>/cancel/
+    POST /api/reservations/<id>/cancel/  {comment} - необязательно, для журнала
     """
     try:
-        reservation = Reservation.objects.get(pk=pk, user=request.user)
+        reservation = Reservation.objects.select_for_update().get(pk=pk, user=request.user)
     except Reservation.DoesNotExist:
         return Response(
             {'error': 'Бронирование не найдено'},
@@ -209,11 +627,13 @@ def cancel_reservation(request, pk):
             status=status.HTTP_400_BAD_REQUEST
         )
 
+    old_status = reservation.status
     reservation.status = 'cancelled'
     reservation.save()
+    events.record(reservation.pk, old_status, 'cancelled', request.user, request.data.get('comment'))
 
-    reservation.book.status = 'available'
-    reservation.book.save()
+    counters.reservation_changed(reservation.book_id, old_status, 'cancelled')
+    inventory.release_copy(reservation.pk)
 
     return Response(
         {'message': 'Бронирование отменено'},
@@ -221,9 +641,35 @@ def cancel_reservation(request, pk):
     )
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def home_view(request):
+    """
+    Данные главного экрана приложения одним запросом:
+    профиль, активные бронирования и жанры
+    GET /api/home/
+    """
+    reservation_serializer = ReservationSerializer(
+        context={'request': request}, expand='book_details'
+    )
+    reservations = Reservation.objects.select_related('book__genre').filter(
+        user=request.user,
+        status__in=Reservation.ACTIVE_STATUSES
+    )
+    reservations = narrow_queryset(reservations, reservation_serializer)
+
+    return Response({
+        'profile': UserSerializer(request.user).data,
+        'active_reservations': ReservationSerializer(
+            reservations, many=True, context={'request': request}, expand='book_details'
+        ).data,
+        'genres': GenreSerializer(Genre.objects.all(), many=True).data,
+    })
+
+
 # ==================== АДМИН ЭНДПОИНТЫ ====================
 
-class AllReservationsView(generics.ListAPIView):
+class AllReservationsView(SparseFieldsetViewMixin, generics.ListAPIView):
     """
     Все бронирования (только для админов)
     GET /api/admin/reservations/
@@ -236,17 +682,67 @@ class AllReservationsView(generics.ListAPIView):
     ordering = ['-reservation_date']
 
 
+class ExportView(generics.GenericAPIView):
+    """
+    Потоковая выгрузка в CSV/XLSX (формат - из URL) с фильтрами списка.
+    Сериализаторы не используются: строки идут из курсора напрямую (books.exports).
+    """
+    permission_classes = [IsAdminUser]
+    filter_backends = [DjangoFilterBackend]
+    throttle_scope = 'export'
+
+    def perform_content_negotiation(self, request, force=False):
+        # Ответ - файл, а не данные для рендерера, поэтому Accept не проверяется
+        return super().perform_content_negotiation(request, force=True)
+
+    def get(self, request, fmt):
+        if fmt not in EXPORT_FORMATS:
+            raise Http404
+        return self.export(self.filter_queryset(self.get_queryset()), fmt)
+
+
+class ReservationExportView(ExportView):
+    """
+    Выгрузка бронирований (только для админов)
+    GET /api/admin/reservations/export/csv|xlsx/?status=&user=&book=&archived=1
+    archived=1 - добавить архивные бронирования с теми же фильтрами.
+    """
+    queryset = Reservation.objects.all()
+    filterset_fields = AllReservationsView.filterset_fields
+
+    def export(self, queryset, fmt):
+        archived = None
+        if self.request.GET.get('archived') in ('1', 'true'):
+            archived = self.filter_queryset(ArchivedReservation.objects.all())
+        return exports.reservations_response(queryset, fmt, archived)
+
+
+class BookExportView(ExportView):
+    """
+    Выгрузка книг (только для админов)
+    GET /api/admin/books/export/csv|xlsx/?genre=&status=&year_published=&search=
+    """
+    queryset = Book.objects.all()
+    filter_backends = [DjangoFilterBackend, filters.SearchFilter]
+    filterset_fields = BookListView.filterset_fields
+    search_fields = BookListView.search_fields
+
+    def export(self, queryset, fmt):
+        return exports.books_response(queryset, fmt)
+
+
 @api_view(['POST'])
 @permission_classes([IsAdminUser])
+@transaction.atomic()
 def confirm_reservation(request, pk):
     """
     Подтвердить бронирование (только админ)
-    POST /api/admin/reservations/<id>/confirm/
+    POST /api/admin/reservations/<id>/confirm/  {comment} - необязательно, для журнала
     """
     from django.utils import timezone
     
     try:
-        reservation = Reservation.objects.get(pk=pk)
+        reservation = Reservation.objects.select_for_update().get(pk=pk)
     except Reservation.DoesNotExist:
         return Response(
             {'error': 'Бронирование не найдено'},
@@ -262,6 +758,8 @@ def confirm_reservation(request, pk):
     reservation.status = 'confirmed'
     reservation.confirmed_date = timezone.now()
     reservation.save()
+    events.record(reservation.pk, 'pending', 'confirmed', request.user, request.data.get('comment'))
+    notifications.enqueue('reservation_confirmed', [reservation.pk])
     
     return Response(
         ReservationSerializer(reservation).data,
@@ -275,12 +773,12 @@ def confirm_reservation(request, pk):
 def mark_as_taken(request, pk):
     """
     Отметить книгу как выданную (только админ)
-    POST /api/admin/reservations/<id>/taken/
+    POST /api/admin/reservations/<id>/taken/  {comment} - необязательно, для журнала
     """
     from django.utils import timezone
 
     try:
-        reservation = Reservation.objects.get(pk=pk)
+        reservation = Reservation.objects.select_for_update().get(pk=pk)
     except Reservation.DoesNotExist:
         return Response(
             {'error': 'Бронирование не найдено'},
@@ -293,12 +791,15 @@ def mark_as_taken(request, pk):
             status=status.HTTP_400_BAD_REQUEST
         )
 
+    old_status = reservation.status
     reservation.status = 'taken'
     reservation.taken_date = timezone.now()
     reservation.save()
+    events.record(reservation.pk, old_status, 'taken', request.user, request.data.get('comment'))
 
-    reservation.book.status = 'taken'
-    reservation.book.save()
+    notifications.enqueue('reservation_taken', [reservation.pk])
+    counters.reservation_changed(reservation.book_id, old_status, 'taken')
+    inventory.mark_copy_taken(reservation.book_id)
 
     return Response(
         ReservationSerializer(reservation).data,
@@ -312,12 +813,12 @@ def mark_as_taken(request, pk):
 def mark_as_returned(request, pk):
     """
     Отметить книгу как возвращенную (только админ)
-    POST /api/admin/reservations/<id>/returned/
+    POST /api/admin/reservations/<id>/returned/  {comment} - необязательно, для журнала
     """
     from django.utils import timezone
 
     try:
-        reservation = Reservation.objects.get(pk=pk)
+        reservation = Reservation.objects.select_for_update().get(pk=pk)
     except Reservation.DoesNotExist:
         return Response(
             {'error': 'Бронирование не найдено'},
@@ -333,9 +834,9 @@ def mark_as_returned(request, pk):
     reservation.status = 'returned'
     reservation.return_date = timezone.now()
     reservation.save()
+    events.record(reservation.pk, 'taken', 'returned', request.user, request.data.get('comment'))
 
-    reservation.book.status = 'available'
-    reservation.book.save()
+    inventory.release_copy(reservation.pk)
 
     return Response(
         ReservationSerializer(reservation).data,
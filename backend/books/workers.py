@@ -0,0 +1,115 @@
+"""
+Фоновая работа вне запросов.
+
+Общий пул процессов для тяжёлой обработки файлов книг (разбор PDF).
+Пул создаётся лениво при первой задаче. Процессы запускаются через
+spawn, поэтому в них выполняются только функции, не зависящие от Django
+(см. books.pdf_tools). Результат обрабатывается колбэком в основном
+процессе; соединение с БД, открытое колбэком, закрывается после него.
+
+BufferedWriter - поток отложенной записи для буферов процесса (журнал
+бронирований, прогресс чтения, счётчики книг): сбрасывает буфер раз в
+интервал или по wake(), а остаток - при завершении процесса (atexit;
+SIGKILL и таймаут воркера его пропускают).
+"""
+import atexit
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_process_pool(max_workers=None):
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=max_workers or getattr(settings, 'BOOK_WORKERS', 2),
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _pool
+
+
+def submit(func, *args, on_done=None):
+    """
+    Выполняет func(*args) в пуле процессов, затем on_done(result) в основном процессе.
+    """
+    future = get_process_pool().submit(func, *args)
+
+    def callback(done):
+        try:
+            close_old_connections()
+            result = done.result()
+            if on_done is not None:
+                on_done(result)
+        except Exception:
+            logger.exception('Фоновая обработка %s%r завершилась ошибкой', func.__name__, args)
+        finally:
+            connection.close()
+
+    future.add_done_callback(callback)
+    return future
+
+
+class BufferedWriter:
+    """
+    Поток, вызывающий flush() раз в getattr(settings, interval_setting,
+    default_interval) секунд или сразу после wake(). Буфер и его блокировку
+    держит модуль-владелец; здесь - только поток и сброс при выходе.
+    """
+
+    def __init__(self, flush, interval_setting, default_interval, name, error_message):
+        self.flush = flush
+        self.interval_setting = interval_setting
+        self.default_interval = default_interval
+        self.name = name
+        self.error_message = error_message
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        atexit.register(self._flush_on_exit)
+
+    def interval(self):
+        return getattr(settings, self.interval_setting, self.default_interval)
+
+    def start(self):
+        """Запускает поток, если его ещё нет в этом процессе."""
+        # После fork (gunicorn --preload) поток мастера в воркере не существует
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+
+    def wake(self):
+        """Сбросить буфер, не дожидаясь интервала."""
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval())
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception(self.error_message)
+            finally:
+                connection.close()
+
+    def _flush_on_exit(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('%s при завершении', self.error_message)
@@ -0,0 +1,67 @@
+"""
+Боевой запуск: из каталога backend просто `gunicorn` (этот файл
+подхватывается автоматически).
+
+Настройки из окружения:
+    SERVER_INTERFACE   'wsgi' (по умолчанию, потоковые воркеры gthread)
+                       или 'asgi' (воркеры uvicorn, library_api.asgi)
+    BIND / PORT        адрес, по умолчанию 0.0.0.0:8000
+    WEB_CONCURRENCY    процессов, по умолчанию 2 * CPU + 1
+    GUNICORN_THREADS   потоков на процесс (wsgi), по умолчанию 4
+    GUNICORN_TIMEOUT, GUNICORN_KEEPALIVE, GUNICORN_GRACEFUL_TIMEOUT - секунды
+    GUNICORN_MAX_REQUESTS  перезапуск воркера после N запросов (0 - никогда)
+    NUM_PROXIES        прокси перед gunicorn - IP для ограничения частоты
+                       берётся из X-Forwarded-For (library_api.settings), по умолчанию 0
+    LOG_LEVEL
+
+Приложение загружается в мастере до fork (preload_app): импорт Django и
+моделей делается один раз, воркеры делят память с мастером (как и индекс
+подсказок books.suggest, если SUGGEST_PRELOAD).
+static и media отдаёт library_api.files через sendfile.
+"""
+import multiprocessing
+import os
+
+interface = os.environ.get('SERVER_INTERFACE', 'wsgi')
+
+bind = os.environ.get('BIND', f"0.0.0.0:{os.environ.get('PORT', '8000')}")
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+
+if interface == 'asgi':
+    wsgi_app = 'library_api.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    wsgi_app = 'library_api.wsgi:application'
+    worker_class = 'gthread'
+    threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+preload_app = True
+sendfile = True
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+# Перезапуск воркеров с разбросом, чтобы они не уходили на рестарт все сразу
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 10000))
+max_requests_jitter = max_requests // 10
+
+loglevel = os.environ.get('LOG_LEVEL', 'info')
+accesslog = '-'
+errorlog = '-'
+# Заголовки X-Forwarded-* принимаются только от прокси на этой машине
+forwarded_allow_ips = os.environ.get('FORWARDED_ALLOW_IPS', '127.0.0.1')
+
+
+def when_ready(server):
+    # Индекс подсказок строится один раз в мастере, воркеры делят его память
+    from django.conf import settings
+    if preload_app and settings.SUGGEST_PRELOAD:
+        from books.suggest import warm_up
+        warm_up()
+
+
+def post_fork(server, worker):
+    # Соединения с БД, открытые в мастере при загрузке, воркерам не передаются
+    from django.db import connections
+    connections.close_all()
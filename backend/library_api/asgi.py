@@ -11,6 +11,9 @@ import os
 
 from django.core.asgi import get_asgi_application
 
+from library_api.files import AsgiFileHandler
+
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'library_api.settings')
 
-application = get_asgi_application()
+# static и media отдаются в обход Django (library_api.files)
+application = AsgiFileHandler(get_asgi_application())
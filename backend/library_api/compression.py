@@ -0,0 +1,236 @@
+"""
+Сжатие ответов: gzip, brotli (br) и zstd.
+
+Кодек выбирается по Accept-Encoding клиента из установленных пакетов
+(gzip - всегда, brotli и zstandard - если установлены).
+Уровни сжатия задаются пресетами: 'fast', 'balanced', 'max'.
+
+Ответ может принести готовые сжатые версии в атрибуте precompressed
+({'br': b'...', 'gzip': b'...'}) - тогда middleware их просто отдаёт,
+не тратя CPU (так работают кэши ответов, см. library_api.response_cache).
+Если нужной версии там нет, middleware сжимает сама и передаёт результат в
+response.store_compressed(encoding, content), если он задан: так кэш
+дополняется кодеками по мере того, как их просят клиенты.
+Для FileResponse рядом с файлом ищутся заранее сжатые копии
+(file.css.br, file.css.gz, file.css.zst), см. команду compress_assets.
+"""
+import os
+import re
+import zlib
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:  # brotli необязателен
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # zstandard необязателен
+    zstandard = None
+
+
+PRESETS = {
+    'fast': {'br': 1, 'zstd': 1, 'gzip': 1},
+    'balanced': {'br': 5, 'zstd': 3, 'gzip': 6},
+    'max': {'br': 11, 'zstd': 19, 'gzip': 9},
+}
+
+# Расширения заранее сжатых копий файлов
+FILE_SUFFIXES = {'br': '.br', 'zstd': '.zst', 'gzip': '.gz'}
+
+COMPRESSIBLE_TYPES = re.compile(
+    r'^(text/|application/(json|javascript|xml|msgpack|vnd\.api\+json)|image/svg\+xml)'
+)
+
+re_accept_encoding = re.compile(r'([a-z*]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?', re.IGNORECASE)
+
+
+def available_encodings():
+    """Кодеки в порядке предпочтения сервера."""
+    encodings = []
+    if brotli is not None:
+        encodings.append('br')
+    if zstandard is not None:
+        encodings.append('zstd')
+    encodings.append('gzip')
+    return encodings
+
+
+def negotiate_encoding(accept_encoding, encodings=None):
+    """
+    Выбирает кодек по заголовку Accept-Encoding с учётом q-значений.
+    Возвращает None, если подходящего кодека нет.
+    """
+    if not accept_encoding:
+        return None
+
+    accepted = {}
+    for name, quality in re_accept_encoding.findall(accept_encoding.lower()):
+        try:
+            accepted[name] = float(quality) if quality else 1.0
+        except ValueError:
+            continue
+
+    best, best_quality = None, 0.0
+    for encoding in encodings or available_encodings():
+        quality = accepted.get(encoding, accepted.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def get_level(encoding, preset=None):
+    preset = preset or getattr(settings, 'COMPRESSION_PRESET', 'balanced')
+    return PRESETS[preset][encoding]
+
+
+def compress(data, encoding, preset=None):
+    """Сжимает bytes целиком."""
+    level = get_level(encoding, preset)
+    if encoding == 'br':
+        return brotli.compress(data, quality=level)
+    if encoding == 'zstd':
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+
+def compress_all(data, preset=None, encodings=None):
+    """Сжатые версии data кодеками encodings (по умолчанию - всеми доступными), если они меньше оригинала."""
+    result = {}
+    for encoding in encodings or available_encodings():
+        compressed = compress(data, encoding, preset)
+        if len(compressed) < len(data):
+            result[encoding] = compressed
+    return result
+
+
+def precompress(request, data):
+    """
+    Сжатая версия data для кодека, который middleware выберет для этого
+    запроса ({} - если ответ сжиматься не будет). Остальные кодеки
+    досжимаются при запросах, которые их попросят (store_compressed).
+    """
+    if request.path.startswith(tuple(getattr(settings, 'COMPRESSION_EXCLUDE_PATHS', ()))):
+        return {}
+    if len(data) < getattr(settings, 'COMPRESSION_MIN_SIZE', 1024):
+        return {}
+    encoding = negotiate_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    if encoding is None:
+        return {}
+    return compress_all(data, encodings=[encoding])
+
+
+def compress_stream(chunks, encoding, preset=None):
+    """Потоковое сжатие: отдаёт сжатые куски по мере поступления данных."""
+    level = get_level(encoding, preset)
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=level)
+        process, finish = compressor.process, compressor.finish
+    elif encoding == 'zstd':
+        compressor = zstandard.ZstdCompressor(level=level).compressobj()
+        process, finish = compressor.compress, compressor.flush
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        process, finish = compressor.compress, compressor.flush
+
+    # Память ограничена внутренним буфером компрессора: куски отдаются,
+    # как только он их выдаёт, весь ответ целиком не накапливается
+    for chunk in chunks:
+        data = process(chunk)
+        if data:
+            yield data
+    yield finish()
+
+
+class CompressionMiddleware:
+    """
+    Сжимает ответы API и статики по Accept-Encoding.
+
+    Настройки:
+        COMPRESSION_MIN_SIZE - минимальный размер ответа для сжатия (байт)
+        COMPRESSION_PRESET - пресет уровней для сжатия на лету
+        COMPRESSION_EXCLUDE_PATHS - префиксы путей, которые не сжимаются
+            (ответы с токенами - защита от BREACH)
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.min_size = getattr(settings, 'COMPRESSION_MIN_SIZE', 1024)
+        self.exclude_paths = tuple(getattr(settings, 'COMPRESSION_EXCLUDE_PATHS', ()))
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        return self.process_response(request, response)
+
+    def process_response(self, request, response):
+        if response.has_header('Content-Encoding') or response.has_header('Content-Range'):
+            return response
+        if request.path.startswith(self.exclude_paths):
+            return response
+        if not COMPRESSIBLE_TYPES.match(response.get('Content-Type', '')):
+            return response
+        if not response.streaming and len(response.content) < self.min_size:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        encoding = negotiate_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            if not self._use_precompressed_file(response, encoding):
+                if response.is_async:
+                    return response
+                response.streaming_content = compress_stream(response.streaming_content, encoding)
+                response.headers.pop('Content-Length', None)
+        else:
+            precompressed = getattr(response, 'precompressed', None) or {}
+            content = precompressed.get(encoding)
+            if content is None:
+                content = compress(response.content, encoding)
+                if len(content) >= len(response.content):
+                    return response
+                store = getattr(response, 'store_compressed', None)
+                if store is not None:
+                    store(encoding, content)
+            response.content = content
+            response.headers['Content-Length'] = str(len(content))
+
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+    def _use_precompressed_file(self, response, encoding):
+        """Подменяет поток FileResponse заранее сжатой копией файла, если она есть."""
+        file = getattr(response, 'file_to_stream', None)
+        path = getattr(file, 'name', None)
+        if not isinstance(path, str):
+            return False
+
+        compressed_path = path + FILE_SUFFIXES[encoding]
+        try:
+            if os.path.getmtime(compressed_path) < os.path.getmtime(path):
+                return False
+            compressed = open(compressed_path, 'rb')
+        except OSError:
+            return False
+
+        file.close()
+        # Итератор, а не файл: иначе FileResponse пересчитает Content-Type по имени .gz/.br
+        response.streaming_content = _read_file(compressed, response.block_size)
+        response.headers['Content-Length'] = str(os.fstat(compressed.fileno()).st_size)
+        return True
+
+
+def _read_file(file, block_size):
+    try:
+        while chunk := file.read(block_size):
+            yield chunk
+    finally:
+        file.close()
@@ -0,0 +1,181 @@
+"""
+Разреженные наборы полей (sparse fieldsets) для сериализаторов DRF.
+
+Параметры запроса (только для GET/HEAD/OPTIONS):
+    ?fields=id,title,book_details.title  - оставить только перечисленные поля
+    ?exclude=description                 - убрать перечисленные поля
+    ?expand=user_details                 - встроить вложенные объекты из Meta.expandable_fields
+
+Без параметров сериализатор отдаёт прежнее полное представление.
+Если передан хотя бы один параметр, вложенные объекты из
+Meta.expandable_fields отдаются только по явному запросу (expand или fields).
+
+narrow_queryset() по набору полей сериализатора сужает SQL через
+.only(), чтобы невостребованные колонки (например description) не читались.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+SPARSE_PARAMS = ('fields', 'exclude', 'expand')
+
+
+def parse_fieldset(value):
+    """
+    'id,book_details.title,book_details.id' -> {'id': {}, 'book_details': {'title': {}, 'id': {}}}
+    """
+    if value is None:
+        return None
+    if isinstance(value, dict):
+        return value
+    if isinstance(value, str):
+        value = value.split(',')
+
+    tree = {}
+    for item in value:
+        item = item.strip()
+        if not item:
+            continue
+        node = tree
+        for part in item.split('.'):
+            node = node.setdefault(part, {})
+    return tree
+
+
+def get_sparse_params(request):
+    """
+    Достаёт fields/exclude/expand из запроса. Возвращает None, если их нет
+    или метод небезопасный (на запись набор полей не влияет).
+    """
+    if request is None or request.method not in SAFE_METHODS:
+        return None
+    query_params = getattr(request, 'query_params', request.GET)
+    params = {name: parse_fieldset(query_params.get(name))
+              for name in SPARSE_PARAMS if name in query_params}
+    return params or None
+
+
+class SparseFieldsetMixin:
+    """
+    Миксин для ModelSerializer: поддержка fields/exclude/expand.
+
+    Параметры берутся из kwargs конструктора или из context['request'].
+    Meta.expandable_fields - тяжёлые вложенные поля, которые в разреженном
+    режиме отдаются только по запросу.
+    Meta.sparse_sources - колонки модели для полей, источник которых нельзя
+    вывести автоматически (SerializerMethodField, get_*_display).
+    """
+
+    def __init__(self, *args, **kwargs):
+        params = {name: kwargs.pop(name) for name in SPARSE_PARAMS if name in kwargs}
+        super().__init__(*args, **kwargs)
+
+        if not params:
+            params = get_sparse_params(self.context.get('request')) or {}
+        if params:
+            self.apply_sparse_fieldset(**params)
+
+    def apply_sparse_fieldset(self, fields=None, exclude=None, expand=None):
+        fields = parse_fieldset(fields)
+        exclude = parse_fieldset(exclude) or {}
+        expand = parse_fieldset(expand) or {}
+        expandable = set(getattr(self.Meta, 'expandable_fields', ()))
+
+        for name in list(self.fields):
+            if fields is not None and name not in fields:
+                self.fields.pop(name)
+                continue
+            if exclude.get(name) == {}:
+                self.fields.pop(name)
+                continue
+            if name in expandable and name not in expand and not (fields and name in fields):
+                self.fields.pop(name)
+                continue
+
+            field = self.fields[name]
+            child = getattr(field, 'child', field)
+            if isinstance(child, SparseFieldsetMixin):
+                nested = {
+                    'fields': (fields or {}).get(name) or None,
+                    'exclude': exclude.get(name) or None,
+                    'expand': expand.get(name) or None,
+                }
+                if any(value is not None for value in nested.values()):
+                    child.apply_sparse_fieldset(**nested)
+
+
+def _resolve_path(model, path):
+    """Проверяет, что path ('book__genre__name') существует в модели."""
+    for part in path.split('__'):
+        if model is None:
+            return False
+        try:
+            field = model._meta.get_field(part)
+        except FieldDoesNotExist:
+            return False
+        if not field.concrete:
+            return False
+        model = field.related_model
+    return True
+
+
+def get_model_paths(serializer, prefix=''):
+    """
+    Список колонок модели (в нотации ORM), которые нужны сериализатору.
+    Возвращает None, если какое-то поле нельзя однозначно сопоставить
+    колонке - тогда queryset не сужается.
+    """
+    sources = getattr(serializer.Meta, 'sparse_sources', {})
+    paths = []
+
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        if name in sources:
+            paths.extend(prefix + source for source in sources[name])
+            continue
+        if field.source == '*' or isinstance(field, (serializers.SerializerMethodField,
+                                                      serializers.ListSerializer)):
+            return None
+
+        path = prefix + field.source.replace('.', '__')
+        if isinstance(field, serializers.BaseSerializer):
+            nested = get_model_paths(field, path + '__')
+            if nested is None:
+                return None
+            paths.extend(nested)
+        else:
+            paths.append(path)
+
+    return paths
+
+
+def narrow_queryset(queryset, serializer):
+    """
+    Сужает queryset до колонок, которые реально отдаёт serializer:
+    .only() по нужным полям и select_related только по нужным связям.
+    """
+    paths = get_model_paths(serializer)
+    if not paths or not all(_resolve_path(queryset.model, path) for path in paths):
+        return queryset
+
+    relations = set()
+    for path in paths:
+        parts = path.split('__')
+        for depth in range(1, len(parts)):
+            relations.add('__'.join(parts[:depth]))
+
+    return queryset.select_related(None).select_related(*sorted(relations)).only(*paths)
+
+
+class SparseFieldsetViewMixin:
+    """
+    Миксин для generic-представлений DRF: сужает queryset под набор полей
+    сериализатора, так что невостребованные колонки не читаются из БД.
+    """
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method not in SAFE_METHODS:
+            return queryset
+        return narrow_queryset(queryset, self.get_serializer())
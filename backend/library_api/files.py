@@ -0,0 +1,371 @@
+"""
+Раздача static и media в обход Django.
+
+FileHandler (WSGI) и AsgiFileHandler (ASGI) оборачивают приложение Django
+в wsgi.py/asgi.py и отвечают на запросы к STATIC_URL и MEDIA_URL сами:
+без middleware, роутинга и сессий. Остальные запросы уходят в Django.
+
+  - тело отдаётся через wsgi.file_wrapper (gunicorn - sendfile(2), данные
+    не копируются в процесс); под ASGI - http.response.zerocopysend, если
+    сервер его поддерживает, иначе чтением кусками в пуле потоков;
+  - ETag/Last-Modified и 304, один диапазон Range (PDF в читалке);
+  - заранее сжатые копии (.br/.zst/.gz, команда compress_assets) по
+    Accept-Encoding;
+  - файлы с хешем в имени (ManifestStaticFilesStorage: app.3f9a1c2b7d4e.js)
+    кэшируются на год с immutable, остальные - на STATIC_CACHE_MAX_AGE
+    и MEDIA_CACHE_MAX_AGE;
+  - CORS-заголовки для PDF и изображений ставятся только на media;
+  - подкаталоги PRIVATE_MEDIA_DIRS (исходные PDF) не отдаются - 404.
+
+Если файлы отдаёт nginx или CDN, обработчик выключается SERVE_FILES = False.
+"""
+import asyncio
+import email.utils
+import mimetypes
+import os
+import posixpath
+import re
+import stat
+
+from django.conf import settings
+
+from .compression import COMPRESSIBLE_TYPES, FILE_SUFFIXES, negotiate_encoding
+
+# Заголовки для media: PDF и обложки открываются с других источников
+MEDIA_HEADERS = (
+    ('Access-Control-Allow-Origin', '*'),
+    ('Access-Control-Allow-Methods', 'GET, HEAD, OPTIONS'),
+    ('Access-Control-Allow-Headers', '*'),
+    ('Access-Control-Expose-Headers', 'Content-Length, Content-Range, Accept-Ranges'),
+    ('Cross-Origin-Resource-Policy', 'cross-origin'),
+    ('Cross-Origin-Embedder-Policy', 'require-corp'),
+)
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# Хеш, который ManifestStaticFilesStorage вставляет перед расширением
+re_hashed_name = re.compile(r'\.[0-9a-f]{12}\.[^/]+$')
+re_range = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+BLOCK_SIZE = 64 * 1024
+
+ARCHIVE_TYPES = {'gzip': 'application/gzip', 'br': 'application/x-brotli', 'xz': 'application/x-xz',
+                 'bzip2': 'application/x-bzip', 'compress': 'application/x-compress'}
+
+
+class FileResult:
+    """Готовый ответ: статус, заголовки и (для GET) открытый файл с диапазоном."""
+
+    def __init__(self, status, headers, path=None, offset=0, length=0):
+        self.status = status
+        self.headers = headers
+        self.path = path
+        self.offset = offset
+        self.length = length
+
+
+class _Mount:
+    def __init__(self, prefix, root, max_age, extra_headers=(), private_dirs=()):
+        self.prefix = prefix
+        self.root = os.path.realpath(root)
+        self.max_age = max_age
+        self.extra_headers = list(extra_headers)
+        self.private_roots = [os.path.realpath(os.path.join(self.root, name)) for name in private_dirs]
+
+
+def _status_line(status):
+    return {
+        200: '200 OK', 204: '204 No Content', 206: '206 Partial Content',
+        304: '304 Not Modified', 404: '404 Not Found', 405: '405 Method Not Allowed',
+        416: '416 Range Not Satisfiable',
+    }[status]
+
+
+def _parse_range(value, size):
+    """Один диапазон 'bytes=a-b' -> (начало, длина); None - отдать файл целиком, False - 416."""
+    match = re_range.match(value.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    else:
+        start, end = max(size - int(last), 0), size - 1
+    if start >= size or start > end:
+        return False
+    return start, end - start + 1
+
+
+class FileResolver:
+    """Общая часть WSGI- и ASGI-обработчиков: путь -> FileResult."""
+
+    def __init__(self):
+        self.enabled = getattr(settings, 'SERVE_FILES', True)
+        self.mounts = []
+        if settings.STATIC_URL and settings.STATIC_ROOT:
+            self.mounts.append(_Mount(
+                self._prefix(settings.STATIC_URL), settings.STATIC_ROOT,
+                getattr(settings, 'STATIC_CACHE_MAX_AGE', 3600),
+            ))
+        if settings.MEDIA_URL and settings.MEDIA_ROOT:
+            self.mounts.append(_Mount(
+                self._prefix(settings.MEDIA_URL), settings.MEDIA_ROOT,
+                getattr(settings, 'MEDIA_CACHE_MAX_AGE', 86400), MEDIA_HEADERS,
+                getattr(settings, 'PRIVATE_MEDIA_DIRS', ()),
+            ))
+
+    @staticmethod
+    def _prefix(url):
+        # STATIC_URL может быть абсолютным адресом CDN - тогда это не наш путь
+        if '://' in url:
+            return None
+        return '/' + url.strip('/') + '/'
+
+    def match(self, path):
+        if not self.enabled:
+            return None
+        for mount in self.mounts:
+            if mount.prefix and path.startswith(mount.prefix):
+                return mount
+        return None
+
+    def _full_path(self, mount, path):
+        relative = posixpath.normpath(path[len(mount.prefix):])
+        if relative.startswith('../') or relative in ('.', '..') or '\x00' in relative:
+            return None
+        full_path = os.path.realpath(os.path.join(mount.root, relative))
+        # Символические ссылки и '..' не выводят за пределы каталога
+        if os.path.commonpath((mount.root, full_path)) != mount.root:
+            return None
+        # Закрытые подкаталоги - как несуществующие файлы
+        if any(os.path.commonpath((root, full_path)) == root for root in mount.private_roots):
+            return None
+        return full_path
+
+    def resolve(self, mount, method, path, headers):
+        """
+        headers - заголовки запроса в виде словаря с именами в нижнем регистре.
+        """
+        if method == 'OPTIONS':
+            return FileResult(204, [('Allow', 'GET, HEAD, OPTIONS'), *mount.extra_headers])
+        if method not in ('GET', 'HEAD'):
+            return FileResult(405, [('Allow', 'GET, HEAD, OPTIONS'), ('Content-Length', '0')])
+
+        full_path = self._full_path(mount, path)
+        try:
+            st = os.stat(full_path) if full_path else None
+        except (OSError, ValueError):
+            st = None
+        if st is None or not stat.S_ISREG(st.st_mode):
+            return FileResult(404, [('Content-Type', 'text/plain; charset=utf-8'),
+                                    ('Content-Length', '9'), *mount.extra_headers])
+
+        content_type, file_encoding = mimetypes.guess_type(full_path)
+        if file_encoding:
+            # Сжатый архив (снимок каталога .sqlite.gz) - это сам файл, а не кодирование ответа
+            content_type = ARCHIVE_TYPES.get(file_encoding, 'application/octet-stream')
+        content_type = content_type or 'application/octet-stream'
+        if content_type.startswith('text/') or content_type in ('application/javascript', 'application/json'):
+            content_type += '; charset=utf-8'
+
+        if re_hashed_name.search(full_path):
+            cache_control = IMMUTABLE_CACHE_CONTROL
+        else:
+            cache_control = f'public, max-age={mount.max_age}'
+        response_headers = [
+            ('Cache-Control', cache_control),
+            ('Last-Modified', email.utils.formatdate(st.st_mtime, usegmt=True)),
+            *mount.extra_headers,
+        ]
+
+        encoding = None
+        compressible = bool(COMPRESSIBLE_TYPES.match(content_type))
+        if compressible:
+            response_headers.append(('Vary', 'Accept-Encoding'))
+            encoding, encoded_st = self._precompressed(full_path, st, headers.get('accept-encoding', ''))
+            if encoding:
+                full_path += FILE_SUFFIXES[encoding]
+                st = encoded_st
+                response_headers.append(('Content-Encoding', encoding))
+        else:
+            response_headers.append(('Accept-Ranges', 'bytes'))
+
+        etag = f'"{st.st_mtime_ns:x}-{st.st_size:x}{"-" + encoding if encoding else ""}"'
+        response_headers.append(('ETag', etag))
+
+        if self._not_modified(headers, etag, st.st_mtime):
+            return FileResult(304, response_headers)
+
+        response_headers.append(('Content-Type', content_type))
+        size = st.st_size
+        byte_range = None
+        if not compressible and 'range' in headers and headers.get('if-range', etag) == etag:
+            byte_range = _parse_range(headers['range'], size)
+            if byte_range is False:
+                response_headers += [('Content-Range', f'bytes */{size}'), ('Content-Length', '0')]
+                return FileResult(416, response_headers)
+
+        if byte_range:
+            offset, length = byte_range
+            response_headers.append(('Content-Range', f'bytes {offset}-{offset + length - 1}/{size}'))
+            status = 206
+        else:
+            offset, length, status = 0, size, 200
+        response_headers.append(('Content-Length', str(length)))
+        return FileResult(status, response_headers, full_path if method == 'GET' else None, offset, length)
+
+    @staticmethod
+    def _precompressed(path, st, accept_encoding):
+        if not accept_encoding:
+            return None, None
+        available = {}
+        for encoding, suffix in FILE_SUFFIXES.items():
+            try:
+                encoded_st = os.stat(path + suffix)
+            except OSError:
+                continue
+            # Копия старше оригинала - устарела, отдаём оригинал
+            if encoded_st.st_mtime >= st.st_mtime:
+                available[encoding] = encoded_st
+        if not available:
+            return None, None
+        encoding = negotiate_encoding(accept_encoding, list(available))
+        return encoding, available.get(encoding)
+
+    @staticmethod
+    def _not_modified(headers, etag, mtime):
+        if_none_match = headers.get('if-none-match')
+        if if_none_match is not None:
+            tags = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+            return '*' in tags or etag in tags
+        if_modified_since = headers.get('if-modified-since')
+        if if_modified_since:
+            try:
+                since = email.utils.parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+            return int(mtime) <= since
+        return False
+
+
+class _FileRange:
+    """
+    Файл, ограниченный диапазоном: fileno() для sendfile (gunicorn берёт
+    текущую позицию и Content-Length), read() не выходит за конец диапазона.
+    """
+
+    def __init__(self, path, offset, length):
+        self.file = open(path, 'rb')
+        self.file.seek(offset)
+        self.remaining = length
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def __iter__(self):
+        while data := self.read(BLOCK_SIZE):
+            yield data
+
+    def close(self):
+        self.file.close()
+
+
+def _wsgi_path(environ):
+    # PATH_INFO в WSGI - байты UTF-8, декодированные как latin-1
+    path = environ.get('SCRIPT_NAME', '') + environ.get('PATH_INFO', '')
+    try:
+        return path.encode('latin-1').decode('utf-8')
+    except UnicodeError:
+        return path
+
+
+class FileHandler:
+    """WSGI: static и media - здесь, остальное - в приложение Django."""
+
+    def __init__(self, application):
+        self.application = application
+        self.resolver = FileResolver()
+
+    def __call__(self, environ, start_response):
+        path = _wsgi_path(environ)
+        mount = self.resolver.match(path)
+        if mount is None:
+            return self.application(environ, start_response)
+
+        headers = {
+            key[5:].replace('_', '-').lower(): value
+            for key, value in environ.items() if key.startswith('HTTP_')
+        }
+        result = self.resolver.resolve(mount, environ['REQUEST_METHOD'], path, headers)
+        start_response(_status_line(result.status), result.headers)
+        if result.status == 404 and environ['REQUEST_METHOD'] != 'HEAD':
+            return [b'Not Found']
+        if result.path is None:
+            return []
+
+        body = _FileRange(result.path, result.offset, result.length)
+        file_wrapper = environ.get('wsgi.file_wrapper')
+        if file_wrapper is not None:
+            return file_wrapper(body, BLOCK_SIZE)
+        return _closing_iter(body)
+
+
+def _closing_iter(body):
+    try:
+        yield from body
+    finally:
+        body.close()
+
+
+class AsgiFileHandler:
+    """ASGI: то же для uvicorn и других ASGI-серверов."""
+
+    def __init__(self, application):
+        self.application = application
+        self.resolver = FileResolver()
+
+    async def __call__(self, scope, receive, send):
+        mount = self.resolver.match(scope['path']) if scope['type'] == 'http' else None
+        if mount is None:
+            return await self.application(scope, receive, send)
+
+        headers = {name.decode('latin-1').lower(): value.decode('latin-1')
+                   for name, value in scope['headers']}
+        # stat и open - обращения к диску, не в цикле событий
+        result = await asyncio.to_thread(self.resolver.resolve, mount, scope['method'], scope['path'], headers)
+        await send({
+            'type': 'http.response.start',
+            'status': result.status,
+            'headers': [(name.encode('latin-1'), value.encode('latin-1')) for name, value in result.headers],
+        })
+        if result.status == 404 and scope['method'] != 'HEAD':
+            return await send({'type': 'http.response.body', 'body': b'Not Found'})
+        if result.path is None:
+            return await send({'type': 'http.response.body', 'body': b''})
+
+        body = await asyncio.to_thread(_FileRange, result.path, result.offset, result.length)
+        try:
+            if 'http.response.zerocopysend' in scope.get('extensions', {}):
+                await send({
+                    'type': 'http.response.zerocopysend',
+                    'file': body.file, 'offset': result.offset, 'count': result.length,
+                })
+                return
+            while True:
+                data = await asyncio.to_thread(body.read, BLOCK_SIZE)
+                more = body.remaining > 0 and bool(data)
+                await send({'type': 'http.response.body', 'body': data, 'more_body': more})
+                if not more:
+                    return
+        finally:
+            body.close()
@@ -0,0 +1,302 @@
+"""
+Профилирование отдельных запросов в боевом режиме.
+
+ProfilingMiddleware профилирует запрос, если:
+  - пришёл заголовок X-Profile от сотрудника (is_staff; сессия админки
+    или JWT): 'X-Profile: 1' - cProfile, 'X-Profile: sampling' - сэмплер;
+  - или запрос попал в выборку PROFILING_SAMPLE_RATE (доля от 0 до 1,
+    режим - PROFILING_MODE).
+Для остальных запросов это одна проверка заголовка; при
+PROFILING_ENABLED = False middleware вообще не подключается.
+
+Результат пишется в PROFILING_DIR (не в MEDIA_ROOT: профили содержат SQL
+и не должны раздаваться публично), хранятся PROFILING_KEEP последних:
+  <id>.json       запрос, статус, время, SQL-запросы с длительностью;
+  <id>.prof       pstats (cProfile) - snakeviz, `python -m pstats`;
+  <id>.txt        самые дорогие функции по cumulative (cProfile);
+  <id>.collapsed  свёрнутые стеки (сэмплер) - flamegraph.pl, speedscope.
+id профиля возвращается в заголовке X-Profile-Id. Список и скачивание -
+/admin/profiles/ (только сотрудники).
+
+Профилируется только выполнение запроса до ответа: тело потокового
+ответа формируется позже. Одновременно профилируется один запрос на
+процесс, остальные в это время выполняются как обычно.
+"""
+import collections
+import contextlib
+import cProfile
+import datetime
+import io
+import json
+import logging
+import os
+import pstats
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.contrib import admin
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import FileResponse, Http404
+from django.shortcuts import render
+from django.views.decorators.http import require_safe
+
+logger = logging.getLogger(__name__)
+
+PROFILE_SUFFIXES = {
+    '.json': 'application/json',
+    '.prof': 'application/octet-stream',
+    '.txt': 'text/plain; charset=utf-8',
+    '.collapsed': 'text/plain; charset=utf-8',
+}
+re_profile_file = re.compile(r'^[0-9]{8}T[0-9]{6}-[0-9a-f]{8}\.(json|prof|txt|collapsed)$')
+
+# Строк в текстовой сводке cProfile
+STATS_LINES = 80
+# Глубина стека в сэмплере
+MAX_STACK_DEPTH = 200
+
+# cProfile (и sys.monitoring в новых версиях Python) - один на процесс
+_profile_lock = threading.Lock()
+
+
+def profiles_dir():
+    return getattr(settings, 'PROFILING_DIR', os.path.join(settings.BASE_DIR, 'profiles'))
+
+
+# ==================== СБОР ====================
+
+class SQLRecorder:
+    """execute_wrapper: текст запроса (без параметров) и длительность."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'alias': context['connection'].alias,
+                'sql': sql,
+                'many': many,
+                'ms': round((time.perf_counter() - start) * 1000, 3),
+            })
+
+
+class StackSampler:
+    """
+    Сэмплирующий профилировщик: раз в PROFILING_SAMPLE_INTERVAL секунд
+    снимает стек потока запроса из sys._current_frames().
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.thread_id = threading.get_ident()
+        self.stacks = collections.Counter()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, name='profiling-sampler', daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({code.co_filename}:{frame.f_lineno})')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def collapsed(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+# ==================== MIDDLEWARE ====================
+
+def _is_staff(request):
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return user.is_staff
+    # API авторизуется JWT внутри DRF, поэтому заголовок проверяем здесь сами
+    from users.authentication import RevocableJWTAuthentication
+    try:
+        result = RevocableJWTAuthentication().authenticate(request)
+    except Exception:
+        return False
+    return result is not None and result[0].is_staff
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILING_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 0)
+        self.mode = getattr(settings, 'PROFILING_MODE', 'cprofile')
+
+    def __call__(self, request):
+        flag = request.META.get('HTTP_X_PROFILE')
+        if flag is None and not (self.sample_rate and random.random() < self.sample_rate):
+            return self.get_response(request)
+
+        if flag is not None:
+            if flag.lower() in ('0', 'false', 'off') or not _is_staff(request):
+                return self.get_response(request)
+            mode = 'sampling' if flag.lower() == 'sampling' else 'cprofile'
+        else:
+            mode = self.mode
+
+        if not _profile_lock.acquire(blocking=False):
+            return self.get_response(request)
+        try:
+            return self.profile(request, mode)
+        finally:
+            _profile_lock.release()
+
+    def profile(self, request, mode):
+        recorder = SQLRecorder()
+        profiler = sampler = None
+        started_at = datetime.datetime.now(datetime.timezone.utc)
+        start = time.perf_counter()
+
+        with contextlib.ExitStack() as stack:
+            # SQL всех соединений с БД на время запроса
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            if mode == 'sampling':
+                sampler = StackSampler(getattr(settings, 'PROFILING_SAMPLE_INTERVAL', 0.005))
+                sampler.start()
+            else:
+                profiler = cProfile.Profile()
+                profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+                if sampler is not None:
+                    sampler.stop()
+        duration = time.perf_counter() - start
+
+        try:
+            profile_id = save_profile(request, response, mode, started_at, duration,
+                                      recorder.queries, profiler, sampler)
+        except Exception:
+            logger.exception('Не удалось сохранить профиль запроса %s', request.path)
+        else:
+            response['X-Profile-Id'] = profile_id
+        return response
+
+
+# ==================== ХРАНЕНИЕ ====================
+
+def save_profile(request, response, mode, started_at, duration, queries, profiler=None, sampler=None):
+    directory = profiles_dir()
+    os.makedirs(directory, exist_ok=True)
+    profile_id = f'{started_at:%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}'
+    base = os.path.join(directory, profile_id)
+
+    user = getattr(request, 'user', None)
+    meta = {
+        'id': profile_id,
+        'mode': mode,
+        'started_at': started_at.isoformat(),
+        'method': request.method,
+        'path': request.path,
+        'query_string': request.META.get('QUERY_STRING', ''),
+        'status': response.status_code,
+        'user': user.get_username() if user is not None and user.is_authenticated else None,
+        'duration_ms': round(duration * 1000, 3),
+        'sql_count': len(queries),
+        'sql_ms': round(sum(query['ms'] for query in queries), 3),
+        'sql': queries,
+    }
+
+    if profiler is not None:
+        profiler.dump_stats(base + '.prof')
+        summary = io.StringIO()
+        pstats.Stats(profiler, stream=summary).sort_stats('cumulative').print_stats(STATS_LINES)
+        with open(base + '.txt', 'w', encoding='utf-8') as f:
+            f.write(summary.getvalue())
+    if sampler is not None:
+        meta['samples'] = sum(sampler.stacks.values())
+        with open(base + '.collapsed', 'w', encoding='utf-8') as f:
+            f.write(sampler.collapsed())
+
+    # .json пишется последним: по нему список понимает, что профиль готов
+    with open(base + '.json', 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=1)
+
+    _cleanup(directory, getattr(settings, 'PROFILING_KEEP', 200))
+    return profile_id
+
+
+def _cleanup(directory, keep):
+    ids = sorted(name[:-5] for name in os.listdir(directory) if name.endswith('.json'))
+    for profile_id in ids[:-keep] if keep else ():
+        for suffix in PROFILE_SUFFIXES:
+            try:
+                os.remove(os.path.join(directory, profile_id + suffix))
+            except FileNotFoundError:
+                pass
+
+
+def list_profiles(limit=200):
+    """Метаданные последних профилей (без списка SQL), от новых к старым."""
+    directory = profiles_dir()
+    if not os.path.isdir(directory):
+        return []
+    profiles = []
+    for name in sorted((n for n in os.listdir(directory) if n.endswith('.json')), reverse=True)[:limit]:
+        try:
+            with open(os.path.join(directory, name), encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            continue
+        meta.pop('sql', None)
+        meta['files'] = [
+            meta['id'] + suffix for suffix in PROFILE_SUFFIXES
+            if os.path.exists(os.path.join(directory, meta['id'] + suffix))
+        ]
+        profiles.append(meta)
+    return profiles
+
+
+# ==================== АДМИНКА ====================
+# Подключаются в library_api.urls через admin.site.admin_view (только сотрудники)
+
+@require_safe
+def profile_list(request):
+    return render(request, 'admin/profiles.html', {
+        **admin.site.each_context(request),
+        'title': 'Профили запросов',
+        'profiles': list_profiles(),
+        'enabled': getattr(settings, 'PROFILING_ENABLED', False),
+        'sample_rate': getattr(settings, 'PROFILING_SAMPLE_RATE', 0),
+    })
+
+
+@require_safe
+def profile_download(request, name):
+    if not re_profile_file.match(name):
+        raise Http404
+    path = os.path.join(profiles_dir(), name)
+    if not os.path.isfile(path):
+        raise Http404
+    suffix = os.path.splitext(name)[1]
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=name,
+                        content_type=PROFILE_SUFFIXES[suffix])
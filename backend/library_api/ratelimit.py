@@ -0,0 +1,204 @@
+"""
+Ограничение частоты запросов и сброс нагрузки.
+
+TokenBucketThrottle - троттлинг DRF по алгоритму token bucket. Бюджет
+задаётся на область (throttle_scope вьюхи) в REST_FRAMEWORK
+['DEFAULT_THROTTLE_RATES'], например 'login': '10/min' - ведро на 10
+запросов, которое пополняется на 10 за минуту. Ключ ведра - пользователь,
+для анонимов - IP (X-Forwarded-For учитывается только при NUM_PROXIES). Вьюхи без области и области без бюджета не ограничиваются.
+Отказ - 429 с Retry-After (стандартный Throttled).
+
+Состояние вёдер не лежит в БД:
+  - 'local' - словарь в памяти процесса (один процесс или тесты);
+  - 'redis' - общий Redis из REDIS_URL, списание атомарно в Lua-скрипте.
+По умолчанию 'redis', если задан REDIS_URL. Если Redis недоступен,
+запрос пропускается: ограничитель не должен ронять API.
+
+ConcurrencyLimitMiddleware - сброс нагрузки: ограничивает число
+одновременно выполняемых запросов в процессе (каждый держит своё
+соединение с БД, так что это и предел соединений) и отдельно - для дорогих
+областей (CONCURRENCY_LIMITS, например PBKDF2 при входе). Если слот не
+освободился за LOAD_SHED_QUEUE_TIMEOUT, ответ 503 с Retry-After.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import JsonResponse
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {'s': 1, 'sec': 1, 'm': 60, 'min': 60, 'h': 3600, 'hour': 3600, 'd': 86400, 'day': 86400}
+
+# Ведер в памяти процесса, после которого удаляются полные (неактивные)
+LOCAL_MAX_BUCKETS = 100000
+
+
+def parse_rate(rate):
+    """'10/min' -> (ёмкость 10, пополнение 10/60 в секунду)."""
+    count, period = rate.split('/')
+    count = int(count)
+    return count, count / PERIODS[period.strip().lower()]
+
+
+def throttle_scope(scope):
+    """
+    Область троттлинга для функции-вьюхи DRF (ставится над @api_view):
+        @throttle_scope('login')
+        @api_view(['POST'])
+        def login_view(request): ...
+    """
+    def decorator(view):
+        view.cls.throttle_scope = scope
+        return view
+    return decorator
+
+
+class LocalBucketStore:
+    def __init__(self):
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def consume(self, key, capacity, rate):
+        """Списывает токен. Возвращает (разрешено, секунд до следующего токена)."""
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated, _ = self.buckets.get(key, (capacity, now, rate))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self.buckets[key] = (tokens, now, rate)
+            if len(self.buckets) > LOCAL_MAX_BUCKETS:
+                self._prune(now)
+        return allowed, 0 if allowed else (1 - tokens) / rate
+
+    def _prune(self, now):
+        for key, (tokens, updated, rate) in list(self.buckets.items()):
+            # Ведро, в котором снова есть токен, можно забыть: новое начнётся полным
+            if tokens + (now - updated) * rate >= 1:
+                del self.buckets[key]
+
+
+class RedisBucketStore:
+    # Время берётся из Redis, чтобы часы воркеров не влияли на пополнение
+    SCRIPT = '''
+        local capacity = tonumber(ARGV[1])
+        local rate = tonumber(ARGV[2])
+        local clock = redis.call('TIME')
+        local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+        local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+        local tokens = tonumber(state[1]) or capacity
+        local updated = tonumber(state[2]) or now
+        tokens = math.min(capacity, tokens + (now - updated) * rate)
+        local allowed = 0
+        local wait = 0
+        if tokens >= 1 then
+            tokens = tokens - 1
+            allowed = 1
+        else
+            wait = (1 - tokens) / rate
+        end
+        redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+        redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000))
+        return {allowed, tostring(wait)}
+    '''
+
+    def __init__(self):
+        self.script = None
+
+    def consume(self, key, capacity, rate):
+        key = cache.make_key(f'ratelimit:{key}')
+        if self.script is None:
+            # Клиент redis-py из бэкенда кэша Django (REDIS_URL)
+            self.script = cache._cache.get_client(key, write=True).register_script(self.SCRIPT)
+        allowed, wait = self.script(keys=[key], args=[capacity, rate])
+        return bool(allowed), float(wait)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            backend = getattr(settings, 'RATE_LIMIT_BACKEND', 'local')
+            _store = RedisBucketStore() if backend == 'redis' else LocalBucketStore()
+        return _store
+
+
+class TokenBucketThrottle(BaseThrottle):
+    def allow_request(self, request, view):
+        self.wait_seconds = None
+        scope = getattr(view, 'throttle_scope', None)
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(scope) if scope else None
+        if not rate:
+            return True
+
+        capacity, refill = parse_rate(rate)
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            ident = f'user:{user.pk}'
+        else:
+            ident = f'ip:{self.get_ident(request)}'
+        try:
+            allowed, self.wait_seconds = get_store().consume(f'{scope}:{ident}', capacity, refill)
+        except Exception:
+            logger.exception('Ограничитель частоты недоступен, запрос пропущен')
+            return True
+        return allowed
+
+    def wait(self):
+        return self.wait_seconds
+
+
+def shed_response():
+    response = JsonResponse({'error': 'Сервер перегружен, повторите запрос позже'}, status=503,
+                            json_dumps_params={'ensure_ascii': False})
+    response['Retry-After'] = str(getattr(settings, 'LOAD_SHED_RETRY_AFTER', 1))
+    return response
+
+
+def _view_scope(view_func):
+    view_class = getattr(view_func, 'cls', None) or getattr(view_func, 'view_class', None)
+    return getattr(view_class, 'throttle_scope', None)
+
+
+class ConcurrencyLimitMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        total = getattr(settings, 'MAX_CONCURRENT_REQUESTS', None)
+        self.total = threading.BoundedSemaphore(total) if total else None
+        self.scopes = {
+            scope: threading.BoundedSemaphore(limit)
+            for scope, limit in getattr(settings, 'CONCURRENCY_LIMITS', {}).items()
+        }
+        self.timeout = getattr(settings, 'LOAD_SHED_QUEUE_TIMEOUT', 0.5)
+
+    def __call__(self, request):
+        if self.total is not None and not self.total.acquire(timeout=self.timeout):
+            return shed_response()
+        try:
+            return self.get_response(request)
+        finally:
+            # Потоковый ответ дочитывается уже после освобождения слота
+            slot = getattr(request, '_concurrency_slot', None)
+            if slot is not None:
+                slot.release()
+            if self.total is not None:
+                self.total.release()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        slot = self.scopes.get(_view_scope(view_func))
+        if slot is None:
+            return None
+        if not slot.acquire(timeout=self.timeout):
+            return shed_response()
+        request._concurrency_slot = slot
+        return None
@@ -0,0 +1,103 @@
+"""
+Быстрые рендереры и парсеры для REST API.
+
+FastJSONRenderer / FastJSONParser используют orjson, если он установлен,
+иначе работают как стандартные JSONRenderer / JSONParser из DRF.
+MessagePackRenderer / MessagePackParser (application/msgpack) - опциональный
+компактный формат для мобильного клиента, включается через заголовок Accept.
+"""
+from rest_framework import renderers, parsers
+from rest_framework.exceptions import ParseError
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # orjson необязателен
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # msgpack необязателен
+    msgpack = None
+
+
+_encoder = JSONEncoder()
+
+
+def _default(obj):
+    # Всё, что orjson/msgpack не умеют сами (Decimal, lazy-строки, datetime),
+    # приводим стандартным энкодером DRF, чтобы значения совпадали с JSONRenderer
+    return _encoder.default(obj)
+
+
+class FastJSONRenderer(renderers.JSONRenderer):
+    """
+    JSON через orjson. С отступами (indent) и без orjson - стандартный путь DRF.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        if data is None:
+            return b''
+
+        renderer_context = renderer_context or {}
+        if self.get_indent(accepted_media_type, renderer_context) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = orjson.dumps(
+            data, default=_default,
+            option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS,
+        )
+
+        # Как и DRF, экранируем U+2028/U+2029, чтобы JSON оставался подмножеством JavaScript
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class FastJSONParser(parsers.JSONParser):
+    """
+    Разбор JSON через orjson (без orjson - стандартный JSONParser).
+    """
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None:
+            return super().parse(stream, media_type, parser_context)
+
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
+
+
+class MessagePackRenderer(renderers.BaseRenderer):
+    """
+    MessagePack (application/msgpack). Отдаётся только по явному Accept.
+    """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=_default, use_bin_type=True)
+
+
+class MessagePackParser(parsers.BaseParser):
+    """
+    Разбор тела запроса в формате MessagePack.
+    """
+    media_type = 'application/msgpack'
+    renderer_class = MessagePackRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read(), raw=False)
+        except (ValueError, msgpack.ExtraData, msgpack.FormatError, msgpack.StackError) as exc:
+            raise ParseError('MessagePack parse error - %s' % str(exc))
+
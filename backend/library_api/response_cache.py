@@ -0,0 +1,54 @@
+"""
+Хранение отрендеренных ответов в кэше вместе со сжатыми версиями - общая
+часть кэша каталога (books.cache) и кэша пользователя (users.cache).
+
+При промахе сжимается только кодек, который попросил клиент (precompress
+учитывает COMPRESSION_EXCLUDE_PATHS и COMPRESSION_MIN_SIZE), остальные
+добавляются в запись при первом запросе с ними: middleware сжимает ответ
+сама и передаёт результат в response.store_compressed.
+"""
+import hashlib
+
+from django.core.cache import cache
+from django.http import HttpResponse
+
+from .compression import precompress
+
+# Заголовки, которые сохраняются вместе с телом ответа
+CACHED_HEADERS = ('Content-Type', 'Vary', 'Allow')
+
+
+def request_digest(request, *parts):
+    """
+    Хэш адреса запроса (включая хост, от которого зависят абсолютные URL)
+    + формата ответа + доп. частей - общая часть ключей кэша ответов.
+    """
+    raw = '|'.join([request.build_absolute_uri(), request.accepted_media_type or '',
+                    *map(str, parts)])
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def store_response(key, request, response, timeout):
+    content = response.content
+    # Middleware отдаст эту же версию, второй раз не сжимая
+    response.precompressed = precompress(request, content)
+    cache.set(key, {
+        'content': content,
+        'headers': {name: response[name] for name in CACHED_HEADERS if response.has_header(name)},
+        'precompressed': response.precompressed,
+    }, timeout)
+
+
+def build_cached_response(key, cached, timeout):
+    response = HttpResponse(cached['content'])
+    for name, value in cached['headers'].items():
+        response[name] = value
+    response.precompressed = cached['precompressed']
+    response.store_compressed = lambda encoding, content: add_encoding(key, cached, encoding, content, timeout)
+    return response
+
+
+def add_encoding(key, cached, encoding, content, timeout):
+    """Дописывает в запись кэша версию, сжатую middleware для этого запроса."""
+    cached['precompressed'] = {**cached['precompressed'], encoding: content}
+    cache.set(key, cached, timeout)
@@ -1,11 +1,12 @@
 from pathlib import Path
+import importlib.util
 import os
 from datetime import timedelta
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 SECRET_KEY = 'django-insecure-change-in-production-123456'
-DEBUG = True
+DEBUG = os.environ.get('DJANGO_DEBUG', '1') == '1'
 ALLOWED_HOSTS = ['*']
 
 INSTALLED_APPS = [
@@ -15,6 +16,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     
     # Third party
     'rest_framework',
@@ -29,14 +31,16 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'library_api.compression.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
-    'library_api.middleware.CorsMediaMiddleware',
+    'library_api.ratelimit.ConcurrencyLimitMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'library_api.profiling.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'library_api.urls'
@@ -44,7 +48,7 @@ ROOT_URLCONF = 'library_api.urls'
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
-        'DIRS': [],
+        'DIRS': [os.path.join(BASE_DIR, 'library_api', 'templates')],
         'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
@@ -87,9 +91,153 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Подкаталоги MEDIA_ROOT, которые library_api.files не отдаёт: исходные PDF
+# книг (Book.pdf_original) скачиваются только через админку. Если media
+# раздаёт nginx/CDN, эти каталоги нужно закрыть и там
+PRIVATE_MEDIA_DIRS = ['pdf_originals']
+
+# Раздача static и media в обход Django (library_api.files): выключить,
+# если их отдаёт nginx/CDN; сколько секунд кэшировать файлы без хеша в имени
+# (с хешем - год, immutable)
+SERVE_FILES = os.environ.get('SERVE_FILES', '1') == '1'
+STATIC_CACHE_MAX_AGE = int(os.environ.get('STATIC_CACHE_MAX_AGE', 3600))
+MEDIA_CACHE_MAX_AGE = int(os.environ.get('MEDIA_CACHE_MAX_AGE', 86400))
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Кэш: при нескольких воркерах нужен общий бэкенд (REDIS_URL),
+# иначе версия каталога и кэш ответов живут в памяти каждого процесса
+REDIS_URL = os.environ.get('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Где хранятся вёдра ограничителя частоты: 'local' (память процесса)
+# или 'redis' (общие для всех воркеров)
+RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'redis' if REDIS_URL else 'local')
+
+# Сброс нагрузки (library_api.ratelimit.ConcurrencyLimitMiddleware):
+# одновременных запросов на процесс (0 - без ограничения) и на дорогие
+# области; сколько ждать свободного слота до ответа 503 и что вернуть в Retry-After.
+# По умолчанию - потоков воркера gunicorn (GUNICORN_THREADS, как в
+# gunicorn.conf.py): больше процесс wsgi одновременно не выполнит, а для asgi
+# это предел соединений с БД на процесс - всего WEB_CONCURRENCY x столько
+MAX_CONCURRENT_REQUESTS = int(os.environ.get('MAX_CONCURRENT_REQUESTS') or os.environ.get('GUNICORN_THREADS', 4))
+CONCURRENCY_LIMITS = {
+    'login': 4,
+    'register': 4,
+    'password': 4,
+    'content_search': 8,
+}
+LOAD_SHED_QUEUE_TIMEOUT = 0.5
+LOAD_SHED_RETRY_AFTER = 1
+
+# Возобновляемые загрузки файлов книг по частям (books.uploads)
+RESUMABLE_UPLOAD_DIR = os.path.join(BASE_DIR, 'uploads_tmp')
+RESUMABLE_UPLOAD_MAX_SIZE = 500 * 1024 * 1024
+RESUMABLE_UPLOAD_CHUNK_MAX_SIZE = 16 * 1024 * 1024
+
+# Списки админки: начиная с этого числа строк без фильтров показывается
+# оценка из pg_class.reltuples вместо COUNT(*) (library_api.admin_tools)
+ADMIN_ESTIMATED_COUNT_THRESHOLD = 100000
+
+# Пул процессов для обработки PDF (books.workers)
+BOOK_WORKERS = int(os.environ.get('BOOK_WORKERS', 2))
+
+# Оптимизация загруженных PDF (books.pdf_pipeline): пережимать изображения
+# до этого разрешения (пусто - не пережимать) и качество JPEG
+PDF_IMAGE_DPI = int(os.environ['PDF_IMAGE_DPI']) if os.environ.get('PDF_IMAGE_DPI') else None
+PDF_JPEG_QUALITY = int(os.environ.get('PDF_JPEG_QUALITY', 75))
+
+# Как часто (секунды) буфер прогресса чтения записывается в БД (books.progress)
+READING_PROGRESS_FLUSH_INTERVAL = float(os.environ.get('READING_PROGRESS_FLUSH_INTERVAL', 5))
+
+# Профилирование запросов (library_api.profiling): X-Profile от сотрудников
+# и случайная доля запросов PROFILING_SAMPLE_RATE; режим для выборки -
+# 'cprofile' или 'sampling' (шаг сэмплера, секунды); куда писать профили
+# и сколько последних хранить. Список - /admin/profiles/
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', '1') == '1'
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', 0))
+PROFILING_MODE = os.environ.get('PROFILING_MODE', 'cprofile')
+PROFILING_SAMPLE_INTERVAL = 0.005
+PROFILING_DIR = os.environ.get('PROFILING_DIR', os.path.join(BASE_DIR, 'profiles'))
+PROFILING_KEEP = int(os.environ.get('PROFILING_KEEP', 200))
+
+# Как часто (секунды) пересчитывается сводка книг после бронирований:
+# свободные экземпляры, статус, очередь (books.counters)
+BOOK_COUNTERS_FLUSH_INTERVAL = float(os.environ.get('BOOK_COUNTERS_FLUSH_INTERVAL', 0.2))
+
+# Как часто (секунды) буфер журнала бронирований записывается в БД (books.events)
+RESERVATION_EVENT_FLUSH_INTERVAL = float(os.environ.get('RESERVATION_EVENT_FLUSH_INTERVAL', 1))
+
+# Уведомления о бронированиях (books.notifications, команда send_notifications).
+# Почта уходит по SMTP; для разработки - локальный отладочный сервер:
+#   python -m aiosmtpd -n -l localhost:1025
+EMAIL_HOST = os.environ.get('EMAIL_HOST', 'localhost')
+EMAIL_PORT = int(os.environ.get('EMAIL_PORT', 1025))
+EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER', '')
+EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD', '')
+EMAIL_USE_TLS = os.environ.get('EMAIL_USE_TLS', '') == '1'
+EMAIL_TIMEOUT = 10
+DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'library@localhost')
+
+# Шлюз push-уведомлений (без адреса push не отправляются)
+PUSH_GATEWAY_URL = os.environ.get('PUSH_GATEWAY_URL')
+PUSH_GATEWAY_TOKEN = os.environ.get('PUSH_GATEWAY_TOKEN')
+
+NOTIFICATION_TRANSPORTS = {'email': 'books.notifications.EmailTransport'}
+if PUSH_GATEWAY_URL:
+    NOTIFICATION_TRANSPORTS['push'] = 'books.notifications.PushGatewayTransport'
+NOTIFICATION_MAX_ATTEMPTS = 8
+# Задержка повтора (секунды): 30, 60, 120, ... не больше часа
+NOTIFICATION_RETRY_BASE = 30
+NOTIFICATION_RETRY_MAX = 3600
+# На сколько секунд отправитель забирает пачку себе
+NOTIFICATION_LEASE = 300
+# За сколько дней до даты получения напоминать
+PICKUP_REMINDER_DAYS_BEFORE = 1
+
+# Офлайн-снимок каталога (books.snapshot, команда build_catalog_snapshot):
+# подкаталог MEDIA_ROOT, сколько последних дельт хранить и сколько секунд
+# клиенты кэшируют манифест
+CATALOG_SNAPSHOT_DIR = 'catalog'
+CATALOG_SNAPSHOT_KEEP_DELTAS = int(os.environ.get('CATALOG_SNAPSHOT_KEEP_DELTAS', 48))
+CATALOG_MANIFEST_MAX_AGE = int(os.environ.get('CATALOG_MANIFEST_MAX_AGE', 300))
+
+# Через сколько дней возвращённые и отменённые бронирования переносятся
+# в архив (команда archive_reservations, books.archive)
+RESERVATION_ARCHIVE_AFTER_DAYS = int(os.environ.get('RESERVATION_ARCHIVE_AFTER_DAYS', 30))
+
+# Похожие книги (books.similarity, команда build_similarity): сколько
+# соседей хранить на книгу и где держать частоты термов между запусками
+SIMILAR_BOOKS_TOP_K = int(os.environ.get('SIMILAR_BOOKS_TOP_K', 10))
+SIMILARITY_INDEX_DIR = os.environ.get('SIMILARITY_INDEX_DIR', os.path.join(BASE_DIR, 'similarity'))
+
+# Подсказки поиска (books.suggest): как часто (секунды) забирать изменённые
+# книги, как часто сверять число книг (удаления) и при скольких изменённых
+# книгах перестроить индекс целиком; сколько подсказок по умолчанию.
+# SUGGEST_PRELOAD - строить индекс в мастере gunicorn до запуска воркеров
+SUGGEST_REFRESH_INTERVAL = float(os.environ.get('SUGGEST_REFRESH_INTERVAL', 5))
+SUGGEST_RECONCILE_INTERVAL = float(os.environ.get('SUGGEST_RECONCILE_INTERVAL', 300))
+SUGGEST_DELTA_MAX = 50000
+SUGGEST_LIMIT = 10
+SUGGEST_PRELOAD = os.environ.get('SUGGEST_PRELOAD', '1') == '1'
+
+# Сжатие ответов (library_api.compression)
+COMPRESSION_MIN_SIZE = 1024
+COMPRESSION_PRESET = 'balanced'  # 'fast' | 'balanced' | 'max'
+COMPRESSION_EXCLUDE_PATHS = ('/api/auth/',)
+
 AUTH_USER_MODEL = 'users.User'
 
 CORS_ALLOWED_ORIGINS = [
@@ -102,7 +250,7 @@ CORS_ALLOW_ALL_ORIGINS = DEBUG
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.RevocableJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
@@ -114,8 +262,39 @@ REST_FRAMEWORK = {
     ),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
+    'DEFAULT_RENDERER_CLASSES': [
+        'library_api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'library_api.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+    # Token bucket по throttle_scope вьюхи (library_api.ratelimit)
+    'DEFAULT_THROTTLE_CLASSES': [
+        'library_api.ratelimit.TokenBucketThrottle',
+    ],
+    # Сколько прокси стоит перед gunicorn: IP для вёдер анонимов берётся из
+    # X-Forwarded-For с этой глубины. 0 - только REMOTE_ADDR, иначе клиент
+    # обходил бы ограничения, подставляя свой X-Forwarded-For.
+    # За nginx на этой же машине - NUM_PROXIES=1
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', 0)),
+    'DEFAULT_THROTTLE_RATES': {
+        'login': '10/min',
+        'register': '5/min',
+        'password': '5/min',
+        'search': '60/min',
+        'content_search': '30/min',
+        'export': '10/min',
+    },
 }
 
+# MessagePack для мобильного клиента (Accept: application/msgpack), если установлен msgpack
+if importlib.util.find_spec('msgpack') is not None:
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'].insert(1, 'library_api.renderers.MessagePackRenderer')
+    REST_FRAMEWORK['DEFAULT_PARSER_CLASSES'].insert(1, 'library_api.renderers.MessagePackParser')
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(hours=5),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
@@ -125,4 +304,10 @@ SIMPLE_JWT = {
     'ALGORITHM': 'HS256',
     'SIGNING_KEY': SECRET_KEY,
     'AUTH_HEADER_TYPES': ('Bearer',),
-}
\ No newline at end of file
+    'TOKEN_REFRESH_SERIALIZER': 'users.serializers.RevocableTokenRefreshSerializer',
+}
+
+# Отзыв JWT (users.revocation): как часто процесс дочитывает новые отзывы
+# и как часто перестраивает фильтр, удаляя истёкшие записи (секунды)
+TOKEN_REVOCATION_SYNC_INTERVAL = float(os.environ.get('TOKEN_REVOCATION_SYNC_INTERVAL', 5))
+TOKEN_REVOCATION_REBUILD_INTERVAL = float(os.environ.get('TOKEN_REVOCATION_REBUILD_INTERVAL', 3600))
\ No newline at end of file
@@ -1,14 +1,15 @@
 from django.contrib import admin
 from django.urls import path, include
-from django.conf import settings
-from django.conf.urls.static import static
 
+from . import profiling
+
+# static и media отдаёт library_api.files (обёртка в wsgi.py/asgi.py), не Django
 urlpatterns = [
+    # Профили запросов (library_api.profiling) - до admin.site.urls, иначе их перехватит админка
+    path('admin/profiles/', admin.site.admin_view(profiling.profile_list), name='admin-profiles'),
+    path('admin/profiles/<str:name>', admin.site.admin_view(profiling.profile_download),
+         name='admin-profile-download'),
     path('admin/', admin.site.urls),
     path('api/auth/', include('users.urls')),
     path('api/', include('books.urls')),
 ]
-
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
-    urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
\ No newline at end of file
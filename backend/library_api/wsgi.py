@@ -11,6 +11,9 @@ import os
 
 from django.core.wsgi import get_wsgi_application
 
+from library_api.files import FileHandler
+
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'library_api.settings')
 
-application = get_wsgi_application()
+# static и media отдаются в обход Django (library_api.files)
+application = FileHandler(get_wsgi_application())
@@ -1,13 +1,15 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
-from .models import User
+from library_api.admin_tools import FastChangeListMixin
+from .models import User, RevokedToken
 
 @admin.register(User)
-class UserAdmin(BaseUserAdmin):
+class UserAdmin(FastChangeListMixin, BaseUserAdmin):
     list_display = ('username', 'email', 'user_type', 'is_staff', 'created_at')
     list_filter = ('user_type', 'is_staff', 'is_superuser', 'created_at')
     search_fields = ('username', 'email', 'phone')
     ordering = ('-created_at',)
+    date_hierarchy = 'created_at'
     
     fieldsets = (
         (None, {'fields': ('username', 'password')}),
@@ -23,4 +25,19 @@ class UserAdmin(BaseUserAdmin):
             'classes': ('wide',),
             'fields': ('username', 'email', 'user_type', 'password1', 'password2'),
         }),
-    )
\ No newline at end of file
+    )
+
+
+@admin.register(RevokedToken)
+class RevokedTokenAdmin(admin.ModelAdmin):
+    """Только просмотр: записи создаёт users.revocation, истёкшие удаляются автоматически"""
+    list_display = ('jti', 'token_type', 'user', 'revoked_at', 'expires_at')
+    list_filter = ('token_type',)
+    list_select_related = ('user',)
+    search_fields = ('jti', 'user__username')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,64 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from . import revocation
+from .cache import USER_CACHE_TIMEOUT, get_user_generation, get_user_key
+
+# Поля пользователя, которые хранятся в кэше: нужные для прав доступа.
+# Хеш пароля и личные данные в кэш не попадают
+CACHED_USER_FIELDS = ('id', 'username', 'is_active', 'is_staff', 'is_superuser', 'user_type')
+
+
+class RevocableJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication, отклоняющая отозванные токены (см. users.revocation).
+    Пользователь берётся из кэша по его поколению (users.cache): любое
+    сохранение пользователя увеличивает поколение, и он читается из БД заново.
+    В кэше только CACHED_USER_FIELDS; остальные поля восстановленного
+    пользователя отложены (как после .only()). Кто читает или сохраняет
+    профиль целиком, берёт пользователя через full_user().
+    """
+
+    def get_validated_token(self, raw_token):
+        token = super().get_validated_token(raw_token)
+        if revocation.is_revoked(token):
+            raise InvalidToken('Токен отозван')
+        return token
+
+    def get_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        # Проверка хеша пароля в токене и поиск не по pk - без кэша
+        if user_id is None or api_settings.CHECK_REVOKE_TOKEN or api_settings.USER_ID_FIELD not in ('id', 'pk'):
+            return super().get_user(validated_token)
+
+        generation = get_user_generation(user_id)
+        key = get_user_key(user_id, generation)
+        fields = cache.get(key)
+        if fields is None:
+            user = super().get_user(validated_token)
+            cache.set(key, {name: getattr(user, name) for name in CACHED_USER_FIELDS}, USER_CACHE_TIMEOUT)
+        else:
+            user = self._user_from_fields(fields)
+        user._cache_generation = generation
+        return user
+
+    @staticmethod
+    def _user_from_fields(fields):
+        User = get_user_model()
+        names = [field.attname for field in User._meta.concrete_fields if field.attname in fields]
+        return User.from_db(DEFAULT_DB_ALIAS, names, [fields[name] for name in names])
+
+
+def full_user(user):
+    """
+    Пользователь со всеми полями. Восстановленный из кэша перечитывается
+    одним запросом: иначе каждое отложенное поле - отдельный запрос, а
+    save() записал бы только загруженные поля (без updated_at).
+    """
+    if not user.get_deferred_fields():
+        return user
+    return type(user)._default_manager.get(pk=user.pk)
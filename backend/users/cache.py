@@ -0,0 +1,128 @@
+"""
+Кэш ответов, которые принадлежат одному пользователю (профиль,
+«мои бронирования»).
+
+Ключи содержат поколение пользователя. Код, меняющий его бронирования
+или профиль, вызывает bump_user_generation, и старые записи просто
+перестают читаться. Увеличение поколения откладывается до коммита
+транзакции: иначе параллельный запрос успел бы закэшировать старые данные
+под новым поколением.
+
+Пользователь для аутентификации берётся из того же кэша (см.
+users.authentication), поэтому повторное открытие закэшированного экрана
+не обращается к БД совсем.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+from library_api.response_cache import build_cached_response, request_digest, store_response
+
+USER_CACHE_TIMEOUT = 60 * 60
+
+
+def _generation_key(user_id):
+    return f'users:{user_id}:generation'
+
+
+def get_user_generation(user_id):
+    key = _generation_key(user_id)
+    generation = cache.get(key)
+    if generation is None:
+        # Начальное значение - время: если ключ вытеснен из кэша, новое
+        # поколение не совпадёт ни с одним из прежних
+        cache.add(key, time.time_ns(), None)
+        generation = cache.get(key)
+    return generation
+
+
+def _bump(user_ids):
+    for user_id in user_ids:
+        try:
+            cache.incr(_generation_key(user_id))
+        except ValueError:
+            # Поколения нет - нет и записей, которые надо сбросить
+            pass
+
+
+def bump_user_generation(*user_ids):
+    """Сбрасывает кэш пользователей после коммита текущей транзакции (вне её - сразу)."""
+    user_ids = {user_id for user_id in user_ids if user_id is not None}
+    if user_ids:
+        transaction.on_commit(lambda: _bump(user_ids))
+
+
+def request_generation(request):
+    # Поколение уже прочитано при аутентификации - второй раз в кэш не ходим
+    user = request.user
+    generation = getattr(user, '_cache_generation', None)
+    if generation is None:
+        generation = get_user_generation(user.pk)
+    return generation
+
+
+def get_user_cache_key(prefix, request, *parts):
+    """Ключ ответа: пользователь, его поколение, адрес запроса, формат и доп. части."""
+    return f'users:{request.user.pk}:{request_generation(request)}:{prefix}:{request_digest(request, *parts)}'
+
+
+def get_user_key(user_id, generation):
+    return f'users:{user_id}:{generation}:user'
+
+
+def cached_user_response(request, prefix, render, *parts, formats=('json', 'msgpack')):
+    """
+    Ответ render() из кэша пользователя. Кэшируются только машинные форматы
+    и только успешные ответы.
+    """
+    if request.accepted_renderer.format not in formats:
+        return render()
+
+    key = get_user_cache_key(prefix, request, *parts)
+    cached = cache.get(key)
+    if cached is not None:
+        return build_cached_response(key, cached, USER_CACHE_TIMEOUT)
+
+    response = render()
+    if response.status_code == 200:
+        response.add_post_render_callback(
+            lambda rendered: store_response(key, request, rendered, USER_CACHE_TIMEOUT)
+        )
+    return response
+
+
+class UserCacheMixin:
+    """
+    Кэширует GET-ответы, зависящие только от текущего пользователя.
+    get_user_cache_parts() - что ещё, кроме поколения пользователя, входит в ключ.
+    """
+    user_cache_prefix = None
+
+    def get_user_cache_parts(self):
+        return ()
+
+    def get(self, request, *args, **kwargs):
+        return cached_user_response(
+            request, self.user_cache_prefix or type(self).__name__,
+            lambda: super(UserCacheMixin, self).get(request, *args, **kwargs),
+            sorted(kwargs.items()), *self.get_user_cache_parts(),
+        )
+
+
+def cache_per_user(prefix):
+    """
+    То же для функции-вьюхи DRF (ставится под @api_view и @permission_classes):
+        @api_view(['GET'])
+        @permission_classes([IsAuthenticated])
+        @cache_per_user('profile')
+        def user_profile_view(request): ...
+    """
+    def decorator(view):
+        def wrapper(request, *args, **kwargs):
+            return cached_user_response(request, prefix, lambda: view(request, *args, **kwargs),
+                                        sorted(kwargs.items()))
+        wrapper.__name__ = view.__name__
+        wrapper.__doc__ = view.__doc__
+        return wrapper
+    return decorator
@@ -15,7 +15,7 @@ class User(AbstractUser):
         verbose_name='Тип пользователя'
     )
     phone = models.CharField(max_length=20, blank=True, null=True, verbose_name='Телефон')
-    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата регистрации')
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Дата регистрации')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата обновления')
     
     class Meta:
@@ -24,4 +24,31 @@ class User(AbstractUser):
         ordering = ['-created_at']
     
     def __str__(self):
-        return f"{self.username} ({self.get_user_type_display()})"
\ No newline at end of file
+        return f"{self.username} ({self.get_user_type_display()})"
+
+class RevokedToken(models.Model):
+    """
+    Отозванные JWT (выход, ротация refresh-токена). Запросы проверяются
+    по фильтру Блума в памяти (users.revocation), таблица читается только
+    при его синхронизации и при срабатывании фильтра.
+    """
+    jti = models.CharField(max_length=255, unique=True, verbose_name='Идентификатор токена (jti)')
+    token_type = models.CharField(max_length=20, verbose_name='Тип токена')
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='revoked_tokens',
+        blank=True,
+        null=True,
+        verbose_name='Пользователь'
+    )
+    expires_at = models.DateTimeField(db_index=True, verbose_name='Истекает')
+    revoked_at = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Дата отзыва')
+
+    class Meta:
+        verbose_name = 'Отозванный токен'
+        verbose_name_plural = 'Отозванные токены'
+        ordering = ['-revoked_at']
+
+    def __str__(self):
+        return f"{self.token_type} {self.jti}"
@@ -0,0 +1,149 @@
+"""
+Отзыв JWT: выход из аккаунта и ротация refresh-токенов.
+
+Отозванные jti хранятся в таблице RevokedToken до истечения токена.
+Чтобы проверка не стоила запроса к БД на каждый вызов API, каждый процесс
+держит в памяти фильтр Блума по этим jti:
+  - раз в TOKEN_REVOCATION_SYNC_INTERVAL секунд дочитываются новые записи
+    (с запасом SYNC_OVERLAP на транзакции, закоммиченные с опозданием);
+  - раз в TOKEN_REVOCATION_REBUILD_INTERVAL секунд фильтр строится заново,
+    перед этим истёкшие записи удаляются из таблицы.
+Токен, которого нет в фильтре, точно не отозван - это обычный путь без I/O.
+Совпадение в фильтре проверяется по БД (ложные срабатывания ~0.1%).
+
+Отзыв в одном процессе виден остальным не позже чем через интервал синхронизации.
+"""
+import datetime
+import hashlib
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import RevokedToken
+
+# Доля ложных срабатываний фильтра и минимальная ёмкость
+BLOOM_ERROR_RATE = 0.001
+BLOOM_MIN_CAPACITY = 10000
+
+SYNC_OVERLAP = datetime.timedelta(seconds=60)
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate=BLOOM_ERROR_RATE):
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        # Двойное хеширование: k позиций из двух 64-битных половин одного дайджеста
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        positions = self._positions(key)
+        if all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in positions):
+            return
+        for pos in positions:
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+class _State:
+    bloom = None
+    # jti, отзыв которых уже подтверждён БД (повторные попытки не идут в БД)
+    confirmed = set()
+    watermark = None
+    synced_at = 0.0
+    rebuilt_at = 0.0
+
+
+_state = _State()
+_lock = threading.Lock()
+
+
+def _rebuild():
+    now = timezone.now()
+    RevokedToken.objects.filter(expires_at__lt=now).delete()
+    bloom = BloomFilter(max(RevokedToken.objects.count() * 2, BLOOM_MIN_CAPACITY))
+    for jti in RevokedToken.objects.values_list('jti', flat=True).iterator(chunk_size=10000):
+        bloom.add(jti)
+    _state.bloom, _state.confirmed = bloom, set()
+    _state.watermark = now - SYNC_OVERLAP
+    _state.rebuilt_at = time.monotonic()
+
+
+def _refresh():
+    now = timezone.now()
+    for jti in RevokedToken.objects.filter(revoked_at__gte=_state.watermark).values_list('jti', flat=True):
+        _state.bloom.add(jti)
+    _state.watermark = now - SYNC_OVERLAP
+
+
+def sync(force=False):
+    """Дочитывает новые отзывы (или перестраивает фильтр), если пора."""
+    now = time.monotonic()
+    if not force and _state.bloom is not None \
+            and now - _state.synced_at < settings.TOKEN_REVOCATION_SYNC_INTERVAL:
+        return
+    # Пока один поток синхронизирует, остальные проверяют по текущему фильтру
+    if not _lock.acquire(blocking=_state.bloom is None or force):
+        return
+    try:
+        if not force and _state.bloom is not None \
+                and now - _state.synced_at < settings.TOKEN_REVOCATION_SYNC_INTERVAL:
+            return
+        if (force or _state.bloom is None
+                or now - _state.rebuilt_at >= settings.TOKEN_REVOCATION_REBUILD_INTERVAL
+                or _state.bloom.count > _state.bloom.capacity):
+            _rebuild()
+        else:
+            _refresh()
+        _state.synced_at = time.monotonic()
+    finally:
+        _lock.release()
+
+
+def is_revoked(token):
+    jti = token.get(api_settings.JTI_CLAIM)
+    if jti is None:
+        return False
+    sync()
+    if jti not in _state.bloom:
+        return False
+    if jti in _state.confirmed:
+        return True
+    revoked = RevokedToken.objects.filter(jti=jti).exists()
+    if revoked:
+        _state.confirmed.add(jti)
+    return revoked
+
+
+def revoke(*tokens, user=None):
+    """Отзывает токены (simplejwt Token); уже отозванные пропускаются."""
+    rows = []
+    for token in tokens:
+        rows.append(RevokedToken(
+            jti=token[api_settings.JTI_CLAIM],
+            token_type=token.token_type,
+            user_id=user.pk if user is not None else token.get(api_settings.USER_ID_CLAIM),
+            expires_at=datetime.datetime.fromtimestamp(token['exp'], tz=datetime.timezone.utc),
+        ))
+    RevokedToken.objects.bulk_create(rows, ignore_conflicts=True)
+
+    # В этом процессе отзыв действует сразу, в остальных - после синхронизации
+    bloom = _state.bloom
+    for row in rows:
+        if bloom is not None:
+            bloom.add(row.jti)
+        _state.confirmed.add(row.jti)
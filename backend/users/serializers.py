@@ -1,8 +1,13 @@
 from rest_framework import serializers
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
 from django.contrib.auth.password_validation import validate_password
+from library_api.fieldsets import SparseFieldsetMixin
 from .models import User
+from . import revocation
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ('id', 'username', 'email', 'user_type', 'phone', 
@@ -46,4 +51,20 @@ class PasswordResetSerializer(serializers.Serializer):
     def validate(self, attrs):
         if attrs['new_password'] != attrs['new_password2']:
             raise serializers.ValidationError({"new_password": "Новые пароли не совпадают."})
-        return attrs
\ No newline at end of file
+        return attrs
+
+class RevocableTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Обновление access-токена: отозванный refresh-токен не принимается,
+    а при ротации (ROTATE_REFRESH_TOKENS + BLACKLIST_AFTER_ROTATION)
+    старый refresh-токен отзывается.
+    """
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        if revocation.is_revoked(refresh):
+            raise InvalidToken('Токен отозван')
+        data = super().validate(attrs)
+        if api_settings.ROTATE_REFRESH_TOKENS and api_settings.BLACKLIST_AFTER_ROTATION:
+            revocation.revoke(refresh)
+        return data
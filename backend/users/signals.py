@@ -0,0 +1,11 @@
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .cache import bump_user_generation
+
+
+@receiver([post_save, post_delete], sender=settings.AUTH_USER_MODEL)
+def invalidate_user_cache(sender, instance, **kwargs):
+    """Изменение пользователя (профиль, пароль, права) сбрасывает его кэш."""
+    bump_user_generation(instance.pk)
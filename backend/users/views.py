@@ -2,8 +2,14 @@ from rest_framework import generics, status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import authenticate
+from library_api.ratelimit import throttle_scope
+from . import revocation
+from .authentication import full_user
+from .cache import cache_per_user
 from .models import User
 from .serializers import (UserSerializer, UserRegistrationSerializer, PasswordResetSerializer)
 
@@ -11,6 +17,7 @@ class RegisterView(generics.CreateAPIView):
     queryset = User.objects.all()
     permission_classes = (AllowAny,)
     serializer_class = UserRegistrationSerializer
+    throttle_scope = 'register'
     
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
@@ -27,6 +34,7 @@ class RegisterView(generics.CreateAPIView):
             }
         }, status=status.HTTP_201_CREATED)
 
+@throttle_scope('login')
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def login_view(request):
@@ -53,28 +61,54 @@ def login_view(request):
         }
     })
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def logout_view(request):
+    """
+    Выход: отзывает текущий access-токен и переданный refresh-токен
+    POST /api/auth/logout/  {refresh}
+    """
+    tokens = [request.auth]
+    raw_refresh = request.data.get('refresh')
+    if raw_refresh:
+        try:
+            refresh = RefreshToken(raw_refresh)
+        except TokenError:
+            return Response({'error': 'Недействительный refresh-токен'},
+                           status=status.HTTP_400_BAD_REQUEST)
+        if str(refresh.get(api_settings.USER_ID_CLAIM)) != str(request.user.pk):
+            return Response({'error': 'Refresh-токен принадлежит другому пользователю'},
+                           status=status.HTTP_400_BAD_REQUEST)
+        tokens.append(refresh)
+
+    revocation.revoke(*tokens, user=request.user)
+    return Response({'message': 'Вы вышли из аккаунта'}, status=status.HTTP_200_OK)
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cache_per_user('profile')
 def user_profile_view(request):
-    serializer = UserSerializer(request.user)
+    serializer = UserSerializer(full_user(request.user), context={'request': request})
     return Response(serializer.data)
 
 @api_view(['PUT', 'PATCH'])
 @permission_classes([IsAuthenticated])
 def update_profile_view(request):
-    serializer = UserSerializer(request.user, data=request.data, partial=True)
+    # Сохранение пользователя сбрасывает кэш профиля (users.signals)
+    serializer = UserSerializer(full_user(request.user), data=request.data, partial=True)
     if serializer.is_valid():
         serializer.save()
         return Response(serializer.data)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+@throttle_scope('password')
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def change_password_view(request):
     serializer = PasswordResetSerializer(data=request.data)
     
     if serializer.is_valid():
-        user = request.user
+        user = full_user(request.user)
         
         if not user.check_password(serializer.validated_data['old_password']):
             return Response({'old_password': 'Неверный пароль'}, 